@@ -0,0 +1,3 @@
+from recipe.asgi import create_asgi_app
+
+app = create_asgi_app()
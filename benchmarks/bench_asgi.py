@@ -0,0 +1,155 @@
+""" Compare the WSGI and ASGI entry points under many concurrent clients.
+
+    python benchmarks/bench_asgi.py --connections 10 100 500 --seconds 10
+
+Seeds --database (a temporary SQLite file by default) with one user and
+--recipes recipes, then serves it in turn with
+
+  wsgi  gunicorn run:app with --threads threads when gunicorn is installed,
+        the threaded werkzeug server otherwise
+  asgi  uvicorn asgi:app
+
+each in a single worker process, and for every --connections count keeps
+that many clients busy for --seconds with a mix of GET /recipes/<id>,
+GET /recipes?limit=20 and PUT /recipes/<id> (one in --write-every
+requests). Reports requests/sec, p50/p99 latency and errors per server.
+Needs httpx and the packages in requirements-asgi.txt.
+"""
+import argparse
+import asyncio
+from datetime import datetime
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))] if samples else 0
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def seed(database, recipes):
+    from recipe import create_app
+    from recipe.models import db, User, Recipe
+    from recipe import migrations
+
+    app = create_app("production")
+    app.config["SQLALCHEMY_DATABASE_URI"] = database
+    with app.app_context():
+        db.drop_all()
+        migrations.upgrade()
+        db.session.add(User("bench", "bench"))
+        db.session.commit()
+        now = datetime.now()
+        db.session.bulk_insert_mappings(Recipe, [
+            {"name": "r{}".format(number), "date_created": now, "date_modified": now, "created_by": 1}
+            for number in range(recipes)])
+        db.session.commit()
+
+
+def server_command(kind, port, threads):
+    if kind == "asgi":
+        return [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port), "--log-level", "warning"]
+    try:
+        import gunicorn  # noqa
+        return [sys.executable, "-m", "gunicorn", "run:app", "--bind", "127.0.0.1:{}".format(port),
+                "--threads", str(threads), "--log-level", "warning"]
+    except ImportError:
+        return [sys.executable, "-c", "import logging; from werkzeug.serving import run_simple; from run import app; "
+                "logging.getLogger('werkzeug').setLevel(logging.ERROR); "
+                "run_simple('127.0.0.1', {}, app, threaded=True)".format(port)]
+
+
+async def drive(url, token, recipes, connections, seconds, write_every):
+    import httpx
+
+    latencies = []
+    errors = [0]
+    deadline = time.perf_counter() + seconds
+    headers = {"Authorization": "Bearer {}".format(token)}
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=url, headers=headers, limits=limits, timeout=60) as client:
+
+        async def worker(number):
+            count = 0
+            while time.perf_counter() < deadline:
+                count += 1
+                recipeid = random.randint(1, recipes)
+                start = time.perf_counter()
+                try:
+                    if count % write_every == 0:
+                        response = await client.put("/recipes/{}".format(recipeid),
+                                                    json={"name": "w{}n{}".format(number, count % 1000)})
+                    elif count % 2:
+                        response = await client.get("/recipes/{}".format(recipeid))
+                    else:
+                        response = await client.get("/recipes?limit=20")
+                    if response.status_code >= 500:
+                        errors[0] += 1
+                except httpx.HTTPError:
+                    errors[0] += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(number) for number in range(connections)])
+        elapsed = time.perf_counter() - started
+    return len(latencies) / elapsed, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", help="SQLAlchemy URL, a temporary SQLite file by default")
+    parser.add_argument("--recipes", type=int, default=1000)
+    parser.add_argument("--connections", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--threads", type=int, default=16, help="threads of the WSGI worker")
+    parser.add_argument("--write-every", type=int, default=5)
+    parser.add_argument("--servers", nargs="+", default=["wsgi", "asgi"], choices=["wsgi", "asgi"])
+    args = parser.parse_args()
+
+    import httpx
+
+    database = args.database or "sqlite:///{}".format(os.path.join(tempfile.mkdtemp(), "asgi.db"))
+    seed(database, args.recipes)
+    env = dict(os.environ, DATABASE_URL=database, RECIPE_CONFIG="production",
+               RATELIMIT=os.environ.get("RATELIMIT", "0"))
+    print("{:<6} {:>12} {:>10} {:>10} {:>10} {:>8}".format("server", "connections", "req/s", "p50 ms", "p99 ms",
+                                                            "errors"))
+    for kind in args.servers:
+        port = free_port()
+        server = subprocess.Popen(server_command(kind, port, args.threads), cwd=ROOT, env=env)
+        url = "http://127.0.0.1:{}".format(port)
+        try:
+            for _ in range(100):
+                try:
+                    token = httpx.post(url + "/auth/login", json={"username": "bench", "password": "bench"}).json()
+                    break
+                except httpx.HTTPError:
+                    time.sleep(0.1)
+            else:
+                raise RuntimeError("{} server did not start".format(kind))
+            for connections in args.connections:
+                rate, p50, p99, errors = asyncio.run(drive(
+                    url, token["token"], args.recipes, connections, args.seconds, args.write_every))
+                print("{:<6} {:>12} {:>10.1f} {:>10.1f} {:>10.1f} {:>8}".format(
+                    kind, connections, rate, p50, p99, errors))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+""" Report logins/sec per core for password hashing cost settings.
+
+    python benchmarks/bench_passwords.py --scheme sha256_crypt --rounds 5000 50000 535000
+
+A login costs one verify, so logins/sec per core is 1 / verify time. The
+numbers are what a single request worker can sustain when hashing runs in
+its own thread; with PASSWORD_HASH_WORKERS=n the pool multiplies it by n.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recipe.passwords import get_context  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scheme", default="sha256_crypt")
+    parser.add_argument("--rounds", type=int, nargs="+", default=[5000, 20000, 80000, 535000])
+    parser.add_argument("--seconds", type=float, default=2.0,
+                        help="how long to keep verifying for each setting")
+    args = parser.parse_args()
+
+    print("{:<16} {:>10} {:>12} {:>16}".format("scheme", "rounds", "verify ms", "logins/s/core"))
+    for rounds in args.rounds:
+        context = get_context(args.scheme, rounds)
+        hashed = context.hash("correct horse battery staple")
+        verified = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.seconds:
+            context.verify("correct horse battery staple", hashed)
+            verified += 1
+        elapsed = time.perf_counter() - start
+        print("{:<16} {:>10} {:>12.2f} {:>16.1f}".format(
+            args.scheme, rounds, elapsed / verified * 1000, verified / elapsed))
+
+
+if __name__ == "__main__":
+    main()
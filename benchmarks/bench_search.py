@@ -0,0 +1,82 @@
+""" Compare the trigram search with the old LIKE '%q%' query.
+
+    python benchmarks/bench_search.py --rows 1000000 --database sqlite:///bench.db
+
+Seeds one user with --rows recipes (and one category each), then times
+both searches for a handful of queries. Reported times are the median of
+--repeat runs in milliseconds; for the in-process index the one-off build
+time is reported separately.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = ["beef", "stew", "chicken", "curry", "lentil", "soup", "chocolate", "cake",
+         "apple", "pie", "roast", "potatoes", "garlic", "bread", "lemon", "tart"]
+
+
+def median(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2]
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return median(samples), result
+
+
+def seed(db, Recipe, Categories, userid, rows):
+    now = datetime.now()
+    batch = 10000
+    for start in range(0, rows, batch):
+        db.session.execute(Recipe.__table__.insert(), [
+            {"id": i + 1, "name": "{} {}".format(WORDS[i % 16], i),
+             "date_created": now, "date_modified": now, "created_by": userid}
+            for i in range(start, min(start + batch, rows))])
+        db.session.execute(Categories.__table__.insert(), [
+            {"name": "{} {} {}".format(WORDS[(i * 7) % 16], WORDS[(i // 16) % 16], i), "date_created": now,
+             "date_modified": now, "done": False, "recipeid": i + 1}
+            for i in range(start, min(start + batch, rows))])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database", default="sqlite:///search_bench.db")
+    args = parser.parse_args()
+
+    from recipe import create_app
+    from recipe.models import db, Recipe, Categories
+    from recipe import search
+
+    app = create_app()
+    app.config["SQLALCHEMY_DATABASE_URI"] = args.database
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(db, Recipe, Categories, 1, args.rows)
+        print("{} recipes on {}".format(args.rows, db.engine.dialect.name))
+        if db.engine.dialect.name != "postgresql":
+            build, index = timed(lambda: search.build_index(1), 1)
+            search.indexes.set(1, index)
+            print("in-process index built in {:.1f} ms".format(build))
+        print("{:<12} {:>10} {:>10} {:>8} {:>8}".format("query", "like ms", "search ms", "like n", "search n"))
+        for q in ["cake", "stew 12", "potatoes", "choclate"]:
+            like, found = timed(lambda: db.session.query(Recipe.id).filter(
+                Recipe.created_by == 1, Recipe.name.like("%{}%".format(q))).all(), args.repeat)
+            ranked, matches = timed(lambda: search.search_recipes(1, q, 1000), args.repeat)
+            print("{:<12} {:>10.2f} {:>10.2f} {:>8} {:>8}".format(q, like, ranked, len(found), len(matches)))
+
+
+if __name__ == "__main__":
+    main()
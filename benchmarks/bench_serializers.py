@@ -0,0 +1,96 @@
+""" Time turning a user's recipes into a JSON response.
+
+    python benchmarks/bench_serializers.py --recipes 10000 --categories 3
+
+Seeds one user with --recipes recipes of --categories categories each and
+times, as the median of --repeat runs in milliseconds:
+
+  orm + flask       the old path: load Recipe and Categories objects, build
+                    dicts with returnthis and encode with flask.json
+  columns + <name>  Recipe.returnall reading column tuples, encoded with
+                    each JSON backend that is installed
+
+"rows" is the time to get the list of dicts, "encode" the time to JSON.
+"""
+import argparse
+from datetime import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def median(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2]
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipes", type=int, default=10000)
+    parser.add_argument("--categories", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database", help="SQLAlchemy URL, a temporary SQLite file by default")
+    args = parser.parse_args()
+
+    from flask import json
+    from recipe import create_app
+    from recipe.models import db, Recipe, Categories
+    from recipe import serializers
+
+    app = create_app("production")
+    app.config["SQLALCHEMY_DATABASE_URI"] = args.database or "sqlite:///{}".format(
+        os.path.join(tempfile.mkdtemp(), "serializers.db"))
+    with app.test_request_context():
+        db.drop_all()
+        db.create_all()
+        now = datetime.now()
+        db.session.execute(Recipe.__table__.insert(), [
+            {"id": i + 1, "name": "recipe {}".format(i), "date_created": now, "date_modified": now,
+             "created_by": 1} for i in range(args.recipes)])
+        db.session.execute(Categories.__table__.insert(), [
+            {"name": "step {}".format(j), "date_created": now, "date_modified": now, "done": j % 2 == 0,
+             "recipeid": i + 1} for i in range(args.recipes) for j in range(args.categories)])
+        db.session.commit()
+        query = db.session.query(Recipe).filter_by(created_by=1).order_by(Recipe.id)
+
+        def orm_rows():
+            recipes = query.all()
+            grouped = {}
+            for category in db.session.query(Categories).order_by(Categories.id):
+                grouped.setdefault(category.recipeid, []).append(category.returnthis())
+            result = [recipe.returnthis(grouped.get(recipe.id, [])) for recipe in recipes]
+            db.session.expunge_all()
+            return result
+
+        print("{} recipes with {} categories each on {}".format(
+            args.recipes, args.categories, db.engine.dialect.name))
+        print("{:<20} {:>10} {:>10} {:>10}".format("path", "rows ms", "encode ms", "total ms"))
+        rows_ms, document = timed(orm_rows, args.repeat)
+        encode_ms, body = timed(lambda: json.dumps(document), args.repeat)
+        print("{:<20} {:>10.1f} {:>10.1f} {:>10.1f}".format("orm + flask", rows_ms, encode_ms, rows_ms + encode_ms))
+        rows_ms, document = timed(lambda: Recipe.returnall(query), args.repeat)
+        for name in sorted(serializers.BACKENDS):
+            try:
+                dumps = serializers.load_backend(name)[1]
+            except (ImportError, TypeError):
+                print("{:<20} not installed".format("columns + " + name))
+                continue
+            encode_ms, body = timed(lambda: dumps(document), args.repeat)
+            print("{:<20} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+                "columns + " + name, rows_ms, encode_ms, rows_ms + encode_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+""" Report tokens verified/sec for each token format.
+
+    python benchmarks/bench_tokens.py --seconds 2 --keys 1 3
+
+  jws per call  the old path: a new TimedJSONWebSignatureSerializer built
+                for every token, as User.verify_auth_token used to
+  jws           tokens.py with its signers built once
+  compact       tokens.py with TOKEN_FORMAT=compact
+
+--keys sets how many keys are configured. The token is always signed with
+the oldest one, the worst case for JWS tokens, which are tried against
+each key in turn. Everything runs in one thread, so the numbers are per
+core.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from itsdangerous import TimedJSONWebSignatureSerializer  # noqa: E402
+from recipe.tokens import TokenSigner  # noqa: E402
+
+SECRET = "This is bruno"
+
+
+def rate(function, seconds):
+    """ calls of function per second, and the time of one in microseconds """
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        function()
+        calls += 1
+    elapsed = time.perf_counter() - start
+    return calls / elapsed, elapsed / calls * 1000000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0, help="how long to run each case")
+    parser.add_argument("--keys", type=int, nargs="+", default=[1, 3])
+    args = parser.parse_args()
+
+    print("{:<14} {:>5} {:>7} {:>12} {:>10} {:>12}".format(
+        "format", "keys", "length", "verified/s", "verify us", "signed/s"))
+    for count in args.keys:
+        keys = [(str(number), "{} {}".format(SECRET, number)) for number in range(count, 0, -1)]
+
+        def verify_per_call(token, secret=keys[-1][1]):
+            TimedJSONWebSignatureSerializer(secret, expires_in=30).loads(token)
+        token = TimedJSONWebSignatureSerializer(keys[-1][1], expires_in=6000).dumps({"id": 1})
+        verified, micros = rate(lambda: verify_per_call(token), args.seconds)
+        signed, _ = rate(lambda: TimedJSONWebSignatureSerializer(keys[0][1], expires_in=6000).dumps({"id": 1}),
+                         args.seconds)
+        print("{:<14} {:>5} {:>7} {:>12.0f} {:>10.1f} {:>12.0f}".format(
+            "jws per call", count, len(token), verified, micros, signed))
+
+        for fmt in ("jws", "compact"):
+            # sign with the oldest key, then make the newest one the signing key
+            token = TokenSigner(keys[-1:], 6000, fmt).sign(1)
+            signer = TokenSigner(keys, 6000, fmt)
+            assert signer.verify(token)[0] == 1
+            verified, micros = rate(lambda: signer.verify(token), args.seconds)
+            signed, _ = rate(lambda: signer.sign(1), args.seconds)
+            print("{:<14} {:>5} {:>7} {:>12.0f} {:>10.1f} {:>12.0f}".format(
+                fmt, count, len(token), verified, micros, signed))
+
+
+if __name__ == "__main__":
+    main()
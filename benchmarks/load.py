@@ -0,0 +1,333 @@
+""" Load test every endpoint of the API.
+
+    python benchmarks/load.py --users 20 --recipes 200 --categories 5 \\
+        --concurrency 8 --requests 200 --output results/baseline.json
+
+Seeds --users users, each with --recipes recipes of --categories categories,
+into --database (a throwaway SQLite file by default, any SQLAlchemy URL such
+as a local PostgreSQL works), then drives every route from --concurrency
+threads, --requests times per route. The app runs in-process through the
+WSGI test client, so numbers cover the app and the database but not the
+network. With --url the same scenario is sent to a running server instead
+(seed it with the same options first using --seed-only).
+
+For every route it reports p50/p95/p99 latency, requests/sec, errors and
+SQL statements per request, and writes the lot to --output as JSON.
+
+    python benchmarks/load.py --compare results/baseline.json results/new.json
+
+prints the change in latency and throughput between two runs.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = "benchmark"
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))]
+
+
+class StatementCounter(object):
+    """ counts SQL statements per thread """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.local.count = getattr(self.local, "count", 0) + 1
+
+    def take(self):
+        count = getattr(self.local, "count", 0)
+        self.local.count = 0
+        return count
+
+
+class InProcessClient(object):
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, token=None):
+        headers = {"Authorization": "Bearer {}".format(token)} if token else {}
+        response = self.client.open(path, method=method, headers=headers,
+                                    data=json.dumps(body) if body is not None else None,
+                                    content_type="application/json")
+        return response.status_code, response.get_data()
+
+
+class HttpClient(object):
+
+    def __init__(self, url):
+        import requests
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+
+    def request(self, method, path, body=None, token=None):
+        headers = {"Authorization": "Bearer {}".format(token)} if token else {}
+        response = self.session.request(method, self.url + path, json=body, headers=headers)
+        return response.status_code, response.content
+
+
+def seed(app, args):
+    """ create the users, recipes and categories, returns [(username, userid)] """
+    from recipe.models import db, User, Recipe, Categories
+    from recipe import migrations
+
+    now = datetime.now()
+    with app.app_context():
+        db.drop_all()
+        migrations.upgrade()
+        hashed = User("seed", PASSWORD).password
+        db.session.bulk_insert_mappings(User, [
+            {"username": "user{}".format(number), "password": hashed} for number in range(args.users)])
+        db.session.commit()
+        users = db.session.query(User.username, User.id).order_by(User.id).all()
+        for username, userid in users:
+            db.session.bulk_insert_mappings(Recipe, [
+                {"name": "{}r{}".format(userid, number), "date_created": now, "date_modified": now,
+                 "created_by": userid} for number in range(args.recipes)])
+        db.session.commit()
+        recipeids = [recipeid for recipeid, in db.session.query(Recipe.id)]
+        for start in range(0, len(recipeids), 1000):
+            db.session.bulk_insert_mappings(Categories, [
+                {"name": "c{}s{}".format(recipeid, number), "date_created": now, "date_modified": now,
+                 "done": False, "recipeid": recipeid}
+                for recipeid in recipeids[start:start + 1000] for number in range(args.categories)])
+            db.session.commit()
+        return [(username, userid) for username, userid in users]
+
+
+class Worker(object):
+    """ one simulated client, logged in as one seeded user """
+
+    def __init__(self, client, number, username):
+        self.client = client
+        self.number = number
+        self.username = username
+        self.token = None
+        self.sequence = 0
+        self.recipeids = []
+
+    def unique(self, prefix):
+        self.sequence += 1
+        return "{}{}w{}".format(prefix, self.sequence, self.number)
+
+    def login(self):
+        status, body = self.client.request("POST", "/auth/login", {"username": self.username, "password": PASSWORD})
+        self.token = json.loads(body.decode("utf-8"))["token"]
+        return status
+
+    def new_recipe(self):
+        """ create a recipe owned by this worker and return its id """
+        name = self.unique("n")
+        self.client.request("POST", "/recipes", {"name": name}, self.token)
+        status, body = self.client.request("GET", "/recipes?q={}".format(name), None, self.token)
+        return json.loads(body.decode("utf-8"))[0]["id"]
+
+    def new_catergory(self, recipeid):
+        name = self.unique("k")
+        self.client.request("POST", "/recipes/{}/categories".format(recipeid), {"name": name}, self.token)
+        status, body = self.client.request("GET", "/recipes/{}/categories".format(recipeid), None, self.token)
+        return [category["id"] for category in json.loads(body.decode("utf-8")) if category["name"] == name][0]
+
+    def prepare(self, route):
+        """ untimed setup, returns the arguments for run """
+        if route in ("get", "update", "create_category"):
+            if not self.recipeids:
+                status, body = self.client.request("GET", "/recipes?limit=50", None, self.token)
+                self.recipeids = [recipe["id"] for recipe in json.loads(body.decode("utf-8"))]
+            return random.choice(self.recipeids)
+        if route == "delete":
+            return self.new_recipe()
+        if route in ("update_category", "delete_category"):
+            recipeid = self.new_recipe()
+            return recipeid, self.new_catergory(recipeid)
+        return None
+
+    def run(self, route, argument):
+        request = self.client.request
+        if route == "register":
+            return request("POST", "/auth/register", {"username": self.unique("u"), "password": PASSWORD})[0]
+        if route == "login":
+            return request("POST", "/auth/login", {"username": self.username, "password": PASSWORD})[0]
+        if route == "list":
+            return request("GET", "/recipes?limit=20", None, self.token)[0]
+        if route == "search":
+            return request("GET", "/recipes?q=r1{}".format(random.randint(0, 9)), None, self.token)[0]
+        if route == "get":
+            return request("GET", "/recipes/{}".format(argument), None, self.token)[0]
+        if route == "create":
+            return request("POST", "/recipes", {"name": self.unique("c")}, self.token)[0]
+        if route == "update":
+            return request("PUT", "/recipes/{}".format(argument), {"name": self.unique("e")}, self.token)[0]
+        if route == "delete":
+            return request("DELETE", "/recipes/{}".format(argument), None, self.token)[0]
+        if route == "create_category":
+            return request("POST", "/recipes/{}/categories".format(argument), {"name": self.unique("a")},
+                           self.token)[0]
+        if route == "update_category":
+            return request("PUT", "/recipes/{}/categories/{}".format(*argument),
+                           {"name": self.unique("b"), "done": "true"}, self.token)[0]
+        if route == "delete_category":
+            return request("DELETE", "/recipes/{}/categories/{}".format(*argument), None, self.token)[0]
+        raise ValueError(route)
+
+
+ROUTES = ["register", "login", "list", "search", "get", "create", "update", "delete",
+          "create_category", "update_category", "delete_category"]
+EXPECTED = {"register": 201, "create": 201}
+
+
+def drive(workers, route, requests, counter):
+    """ run route requests times on every worker at once, return the stats """
+    latencies = []
+    statements = []
+    errors = [0]
+    busy = []
+    lock = threading.Lock()
+
+    def work(worker):
+        timed = 0.0
+        for _ in range(requests):
+            argument = worker.prepare(route)
+            counter.take()
+            start = time.perf_counter()
+            status = worker.run(route, argument)
+            elapsed = time.perf_counter() - start
+            timed += elapsed
+            with lock:
+                latencies.append(elapsed * 1000)
+                statements.append(counter.take())
+                if status != EXPECTED.get(route, 200):
+                    errors[0] += 1
+        with lock:
+            busy.append(timed)
+
+    with ThreadPoolExecutor(max_workers=len(workers)) as pool:
+        list(pool.map(work, workers))
+    # setup done in prepare is left out, so throughput is counted over the
+    # time the busiest thread spent in timed requests
+    wall = max(busy)
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "requests_per_second": round(len(latencies) / wall, 1),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "queries_per_request": round(float(sum(statements)) / len(statements), 2) if counter.enabled else None,
+    }
+
+
+def compare(old_path, new_path):
+    with open(old_path) as stream:
+        old = json.load(stream)
+    with open(new_path) as stream:
+        new = json.load(stream)
+    print("{:<16} {:>10} {:>10} {:>8} {:>10} {:>10} {:>8}".format(
+        "route", "old p95", "new p95", "change", "old rps", "new rps", "change"))
+    for route, stats in new["routes"].items():
+        before = old["routes"].get(route)
+        if before is None:
+            continue
+        print("{:<16} {:>10} {:>10} {:>7.0%} {:>10} {:>10} {:>7.0%}".format(
+            route, before["p95_ms"], stats["p95_ms"], stats["p95_ms"] / before["p95_ms"] - 1,
+            before["requests_per_second"], stats["requests_per_second"],
+            stats["requests_per_second"] / before["requests_per_second"] - 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", help="SQLAlchemy URL, a temporary SQLite file by default")
+    parser.add_argument("--url", help="drive a running server instead of the app in-process")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--recipes", type=int, default=100, help="recipes per user")
+    parser.add_argument("--categories", type=int, default=3, help="categories per recipe")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50, help="requests per route per thread")
+    parser.add_argument("--hash-rounds", type=int, default=5000, help="PASSWORD_HASH_ROUNDS for the run")
+    parser.add_argument("--routes", nargs="+", default=ROUTES, choices=ROUTES)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--seed-only", action="store_true")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare)
+
+    # the limiter would turn most of a load test away, RATELIMIT=1 keeps it on
+    os.environ.setdefault("RATELIMIT", "0")
+    from sqlalchemy import event
+    from recipe import create_app
+    from recipe.models import db
+
+    database = args.database
+    if database is None:
+        database = "sqlite:///{}".format(os.path.join(tempfile.mkdtemp(), "load.db"))
+    app = create_app("production")
+    app.config["SQLALCHEMY_DATABASE_URI"] = database
+    app.config["PASSWORD_HASH_ROUNDS"] = args.hash_rounds
+    started = time.perf_counter()
+    users = seed(app, args)
+    print("seeded {} users, {} recipes, {} categories in {:.1f}s".format(
+        len(users), len(users) * args.recipes, len(users) * args.recipes * args.categories,
+        time.perf_counter() - started))
+    if args.seed_only:
+        return
+
+    counter = StatementCounter()
+    counter.enabled = args.url is None
+    context = app.app_context()
+    context.push()
+    if args.url:
+        clients = [HttpClient(args.url) for _ in range(args.concurrency)]
+    else:
+        event.listen(db.engine, "before_cursor_execute", counter)
+        clients = [InProcessClient(app) for _ in range(args.concurrency)]
+    workers = [Worker(client, number, users[number % len(users)][0]) for number, client in enumerate(clients)]
+    for worker in workers:
+        worker.login()
+
+    results = {
+        "started": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "database": db.engine.dialect.name if not args.url else args.url,
+        "settings": {key: getattr(args, key) for key in
+                     ("users", "recipes", "categories", "concurrency", "requests", "hash_rounds")},
+        "routes": {},
+    }
+    print("{:<16} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9} {:>8}".format(
+        "route", "reqs", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms", "queries"))
+    for route in args.routes:
+        stats = drive(workers, route, args.requests, counter)
+        results["routes"][route] = stats
+        print("{:<16} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9} {:>8}".format(
+            route, stats["requests"], stats["errors"], stats["requests_per_second"],
+            stats["p50_ms"], stats["p95_ms"], stats["p99_ms"], stats["queries_per_request"]))
+    context.pop()
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(args.output, "w") as stream:
+            json.dump(results, stream, indent=2, sort_keys=True)
+        print("results written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,54 @@
+""" Yummy recipes API.
+
+Importing the package does no work, call create_app to build an
+application. The database schema is created or upgraded explicitly with
+
+    FLASK_APP=run.py flask init-db
+"""
+import os
 from flask import Flask
+from werkzeug.utils import import_string
 
 
-app = Flask(__name__)
-app.config["SECRET_KEY"] = "This is bruno"
+def create_app(config=None):
+    """ build the application. config is a name from config.configs, a
+    config object or None to use RECIPE_CONFIG from the environment.
+    nothing here talks to the database, connections are opened on first use """
+    from .cache import LRUCache
+    from .config import configs
+    from .models import db, token_cache
+    from . import search
+    from .serializers import serializer
+    from .views import api, response_cache
+    from . import changes
+    from . import importer
+    from . import metrics
+    from . import migrations
+    from . import profiling
+    from . import ratelimit
+    from . import replicas
+    from . import tokens
 
-from . import models
-from . import views
+    if config is None:
+        config = os.environ.get("RECIPE_CONFIG", "default")
+    app = Flask(__name__)
+    app.config.from_object(configs.get(config, config))
+    db.init_app(app)
+    replicas.init_app(app, db)
+    serializer.configure(app.config["JSON_BACKEND"])
+    tokens.init_app(app)
+    token_cache.configure(app.config["TOKEN_CACHE_SIZE"], app.config["TOKEN_CACHE_TTL"])
+    search.indexes.configure(app.config["SEARCH_INDEX_USERS"], app.config["SEARCH_INDEX_TTL"])
+    if app.config["RESPONSE_CACHE_BACKEND"]:
+        backend = import_string(app.config["RESPONSE_CACHE_BACKEND"])(app)
+    else:
+        backend = LRUCache(app.config["RESPONSE_CACHE_SIZE"], app.config["RESPONSE_CACHE_TTL"])
+    response_cache.configure(backend, app.config["RESPONSE_CACHE_TTL"])
+    app.register_blueprint(api)
+    migrations.init_app(app)
+    importer.init_app(app)
+    changes.init_app(app)
+    metrics.init_app(app)
+    profiling.init_app(app)
+    ratelimit.init_app(app)
+    return app
@@ -0,0 +1,339 @@
+""" ASGI entry point with an async database driver.
+
+    uvicorn asgi:app --workers 4
+
+The recipe reads and writes below are served by coroutines that talk to the
+database through SQLAlchemy's asyncio extension (asyncpg for PostgreSQL,
+aiosqlite for SQLite), so a worker can keep many requests waiting on the
+database without a thread for each. Every other route (login, register,
+bulk, import, export, category writes, metrics...) is handed to the Flask
+app from create_app through a WSGI adapter, so the API, its status codes
+and its messages are the same whichever way it is served.
+
+The async handlers do not use the response cache; they answer
+If-None-Match from the same ETags, and go through the same rate limiter. Needs the packages in
+requirements-asgi.txt.
+"""
+from contextlib import asynccontextmanager
+from datetime import datetime
+import time
+from flask import json
+from sqlalchemy import event, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from werkzeug.http import parse_date, parse_etags, quote_etag
+from . import create_app
+from . import handlers
+from . import metrics
+from . import replicas
+from . import search
+from .models import User, AuthUser, token_cache, catergories_of, recipes_with
+from .pagination import PaginationError, page_args
+from .pool import enable_foreign_keys
+from .ratelimit import bearer_token, limiter, retry_after, token_userid
+from .serializers import FieldsError, dumps, http_date, project
+from .views import recipes_changed, recipes_etag
+
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from starlette.applications import Starlette
+    from starlette.concurrency import run_in_threadpool
+    from starlette.responses import Response
+    from starlette.routing import Mount, Route
+    try:
+        from a2wsgi import WSGIMiddleware
+    except ImportError:
+        from starlette.middleware.wsgi import WSGIMiddleware
+except ImportError:
+    Starlette = None
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+UNAUTHORIZED = {"WWW-Authenticate": 'Bearer realm="Authentication Required"'}
+
+
+def async_url(uri):
+    """ the same database as uri through its async driver """
+    url = make_url(uri)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def json_response(value, status=200, headers=None):
+    return Response(dumps(value), status, headers=headers, media_type="application/json")
+
+
+def request_json(body, content_type):
+    """ what flask's request.json would give, None unless the body is JSON """
+    if not content_type.startswith("application/json"):
+        return None
+    try:
+        return json.loads(body.decode("utf-8"))
+    except ValueError:
+        return None
+
+
+def conditional(request, body, etag, last_modified=None):
+    """ a 200 with body, or 304 when the client already has this version.
+    decided like werkzeug's make_conditional on the Flask side: If-None-Match
+    (* included) wins, otherwise If-Modified-Since is compared as a date """
+    headers = {"ETag": quote_etag(etag, weak=True)}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    if_none_match = parse_etags(request.headers.get("if-none-match"))
+    if if_none_match:
+        unmodified = if_none_match.contains_weak(etag)
+    else:
+        since = parse_date(request.headers.get("if-modified-since"))
+        unmodified = (since is not None and last_modified is not None and
+                      parse_date(headers["Last-Modified"]) <= since)
+    if unmodified:
+        return Response(status_code=304, headers=headers)
+    return Response(body, 200, headers=headers, media_type="application/json")
+
+
+class AsyncRecipes(object):
+    """ the async routes, bound to one Flask app and its database """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        config = flask_app.config
+        options = {"pool_pre_ping": config["DB_POOL_PRE_PING"], "pool_size": config["DB_POOL_SIZE"],
+                   "max_overflow": config["DB_MAX_OVERFLOW"], "pool_timeout": config["DB_POOL_TIMEOUT"],
+                   "pool_recycle": config["DB_POOL_RECYCLE"]}
+        if config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+            # aiosqlite would otherwise open a connection, and a thread, per checkout
+            options["poolclass"] = AsyncAdaptedQueuePool
+        self.engine = create_async_engine(async_url(config["SQLALCHEMY_DATABASE_URI"]), **options)
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine.sync_engine, "connect", enable_foreign_keys)
+        self.replicas = [create_async_engine(async_url(uri), **options)
+                         for uri in config["SQLALCHEMY_REPLICA_URIS"]]
+
+    def reader(self, user):
+        """ the engine a GET handler reads from: the next replica, or the
+        primary when there are none or the user just wrote, see replicas.py """
+        if not self.replicas or replicas.recently_wrote(user.id):
+            return self.engine
+        return self.replicas[next(replicas.turns) % len(self.replicas)]
+
+    async def authenticate(self, request):
+        """ the AuthUser for the token of request, like views.verify_auth_token """
+        token = bearer_token(request.headers)
+        if not token:
+            metrics.auth_failed("missing")
+            return None
+        identity = token_cache.get(token)
+        if identity is not None:
+            return identity
+        userid, expires = User.verify_auth_token(token=token, return_expiry=True)
+        if userid is None:
+            metrics.auth_failed("invalid")
+            return None
+        async with self.engine.connect() as connection:
+            user = (await connection.execute(
+                select(User.id, User.username).where(User.id == userid))).first()
+        if user is None:
+            metrics.auth_failed("unknown_user")
+            return None
+        identity = AuthUser(user.id, user.username)
+        token_cache.set(token, identity, expires)
+        return identity
+
+    def route(self, path, rule, handler, method):
+        """ a Route running handler(request, user) for authenticated
+        requests, counted in metrics under the Flask rule """
+        name = self.endpoint_name(rule, method)
+
+        async def endpoint(request):
+            started = time.time()
+            if not limiter.enter():
+                metrics.rate_limited(rule, "overload")
+                response = json_response({"message": "The server is busy right now, try again shortly"}, 503,
+                                         {"Retry-After": "1"})
+            else:
+                try:
+                    response = await self.limited(request, rule, name)
+                    if response is None:
+                        user = await self.authenticate(request)
+                        if user is None:
+                            response = Response("Unauthorized Access", 401, headers=UNAUTHORIZED,
+                                                media_type="text/html")
+                        else:
+                            response = await handler(request, user)
+                finally:
+                    limiter.leave()
+            metrics.LATENCY.labels(rule, method).observe(time.time() - started)
+            metrics.REQUESTS.labels(rule, method, str(response.status_code)).inc()
+            return response
+        return Route(path, endpoint, methods=[method])
+
+    def endpoint_name(self, rule, method):
+        """ the Flask endpoint of rule, which RATELIMITS is keyed on """
+        for candidate in self.flask_app.url_map.iter_rules():
+            if candidate.rule == rule and method in candidate.methods:
+                return candidate.endpoint
+        return None
+
+    async def limited(self, request, rule, name):
+        """ a 429 when a bucket of the route is empty, like ratelimit.init_app """
+        def key(scope):
+            if scope == "ip":
+                return request.client.host if request.client else None
+            if scope == "user":
+                return token_userid(bearer_token(request.headers))
+            return None
+        refused = limiter.check(name, key)
+        if refused is None:
+            return None
+        metrics.rate_limited(rule, refused[0])
+        wait = retry_after(refused[1])
+        return json_response({"message": "Too many requests, try again in {} seconds".format(wait)}, 429,
+                             {"Retry-After": wait})
+
+    def routes(self):
+        return [
+            self.route("/recipes", "/recipes", self.list_created_recipe, "GET"),
+            self.route("/recipes", "/recipes", self.create_recipe, "POST"),
+            self.route("/recipes/{id:int}", "/recipes/<catergoryid>", self.get_recipe, "GET"),
+            self.route("/recipes/{id:int}", "/recipes/<id>", self.update_recipe, "PUT"),
+            self.route("/recipes/{id:int}", "/recipes/<id>", self.delete_recipe, "DELETE"),
+            self.route("/recipes/{id:int}/categories", "/recipes/<id>/categories",
+                       self.list_recipe_catergories, "GET"),
+        ]
+
+    async def returnall(self, connection, statement, categories=True, counts=False):
+        """ models.read_recipes on an async connection """
+        recipes = (await connection.execute(statement)).all()
+        if not recipes or not (categories or counts):
+            return recipes_with(recipes, (), False, False)
+        rows = await connection.execute(catergories_of(statement, categories))
+        return recipes_with(recipes, rows, categories, counts)
+
+    def search(self, userid, q, limit):
+        with self.flask_app.app_context():
+            return search.search_recipes(userid, q, limit)
+
+    async def list_created_recipe(self, request, user):
+        try:
+            limit, cursor, fields, counts, q = handlers.listing_args(request.query_params)
+        except (PaginationError, FieldsError) as e:
+            return json_response({"message": str(e)}, 400)
+        with_categories = handlers.wants_categories(fields)
+        truncated = False
+        if q:
+            ranked, truncated = handlers.search_page(
+                await run_in_threadpool(self.search, user.id, q, handlers.search_limit(limit)), limit)
+        async with self.reader(user).connect() as connection:
+            if q:
+                ls = handlers.in_rank_order(await self.returnall(
+                    connection, handlers.search_hits(ranked), with_categories, counts), ranked)
+            else:
+                ls = await self.returnall(connection, handlers.listing(user.id, limit, cursor),
+                                          with_categories, counts)
+        refused = handlers.listing_refused(ls, cursor, q)
+        if refused:
+            return json_response(*refused)
+        ls, token = handlers.listing_page(ls, limit, q)
+        response = conditional(request, dumps(project(ls, fields)), recipes_etag(ls))
+        if token:
+            response.headers["X-Next-Cursor"] = token
+        if truncated:
+            response.headers["X-Results-Truncated"] = "true"
+        return response
+
+    async def get_recipe(self, request, user):
+        try:
+            fields, counts = handlers.recipe_args(request.query_params)
+        except FieldsError as e:
+            return json_response({"message": str(e)}, 400)
+        async with self.reader(user).connect() as connection:
+            ls = await self.returnall(connection, handlers.one_recipe(request.path_params["id"]),
+                                      handlers.wants_categories(fields), counts)
+        refused = handlers.one_recipe_refused(ls, user.id)
+        if refused:
+            return json_response(*refused)
+        return conditional(request, dumps(project(ls, fields)), recipes_etag(ls), handlers.last_modified(ls[0]))
+
+    async def create_recipe(self, request, user):
+        name = handlers.json_name(request_json(await request.body(), request.headers.get("content-type", "")))
+        refused = handlers.create_refused(name)
+        if refused:
+            return json_response(*refused)
+        try:
+            async with self.engine.begin() as connection:
+                if (await connection.execute(handlers.name_taken(user.id, name))).first():
+                    return json_response(handlers.NAME_TAKEN, 400)
+                await connection.execute(handlers.insert_recipe(user.id, name, datetime.now()))
+        except IntegrityError:
+            return json_response(handlers.NAME_TAKEN, 400)
+        recipes_changed(user.id)
+        return json_response({"message": "Recipe Saved"}, 201)
+
+    async def update_recipe(self, request, user):
+        name = handlers.json_name(request_json(await request.body(), request.headers.get("content-type", "")))
+        refused = handlers.update_refused(name)
+        if refused:
+            return json_response(*refused)
+        recipeid = request.path_params["id"]
+        try:
+            async with self.engine.begin() as connection:
+                updated = (await connection.execute(
+                    handlers.rename_recipe(recipeid, user.id, name, datetime.now()))).rowcount
+                if not updated:
+                    owner = (await connection.execute(handlers.owner_of(recipeid))).scalar()
+        except IntegrityError:
+            return json_response(handlers.NAME_TAKEN, 400)
+        if not updated:
+            return json_response(*handlers.write_refused(owner, 403))
+        recipes_changed(user.id)
+        return json_response({"message": "successful update"})
+
+    async def delete_recipe(self, request, user):
+        recipeid = request.path_params["id"]
+        async with self.engine.begin() as connection:
+            for statement in handlers.delete_recipes(handlers.owned(recipeid, user.id), datetime.now()):
+                deleted = (await connection.execute(statement)).rowcount
+            if not deleted:
+                owner = (await connection.execute(handlers.owner_of(recipeid))).scalar()
+        if not deleted:
+            return json_response(*handlers.write_refused(owner, 400))
+        recipes_changed(user.id)
+        return json_response({"message": "Deleted recipe"})
+
+    async def list_recipe_catergories(self, request, user):
+        try:
+            limit, cursor = page_args(request.query_params)
+        except PaginationError as e:
+            return json_response({"message": str(e)}, 400)
+        recipeid = request.path_params["id"]
+        async with self.reader(user).connect() as connection:
+            owner = (await connection.execute(handlers.owner_of(recipeid))).scalar()
+            refused = handlers.recipe_refused(owner, user.id)
+            if refused:
+                return json_response(*refused)
+            rows = (await connection.execute(handlers.catergory_listing(recipeid, limit, cursor))).all()
+        ls, token = handlers.catergory_page(rows, limit)
+        response = json_response(ls)
+        if token:
+            response.headers["X-Next-Cursor"] = token
+        return response
+
+
+def create_asgi_app(config=None):
+    """ the ASGI application: async handlers for the routes of AsyncRecipes
+    and the Flask app of create_app(config) for the rest """
+    if Starlette is None:
+        raise RuntimeError("The ASGI app needs the packages in requirements-asgi.txt")
+    flask_app = create_app(config)
+    recipes = AsyncRecipes(flask_app)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        for engine in [recipes.engine] + recipes.replicas:
+            await engine.dispose()
+
+    app = Starlette(routes=recipes.routes() + [Mount("/", WSGIMiddleware(flask_app))], lifespan=lifespan)
+    app.state.flask_app = flask_app
+    app.state.recipes = recipes
+    return app
@@ -0,0 +1,123 @@
+""" Helpers for creating many recipes or categories at once.
+
+Every batch costs one query to find names that are already taken and one
+executemany INSERT, all in a single transaction, however many rows it holds.
+"""
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from .models import db, Recipe, Categories
+
+MAX_ITEMS = 5000
+DUPLICATE = "That name has already been used"
+
+
+def check_name(item, column):
+    """ return the name in item or the reason it cannot be stored in column """
+    if not isinstance(item, dict):
+        return None, "Expected an object with a name"
+    name = item.get("name")
+    if not name or not isinstance(name, type(u"")):
+        return None, "Please supply a name"
+    if column.type.length and len(name) > column.type.length:
+        return None, "Name is longer than {} characters".format(column.type.length)
+    return name, None
+
+
+def check_done(item):
+    done = item.get("done", False)
+    if isinstance(done, bool):
+        return done, None
+    if isinstance(done, type(u"")) and done.lower() in ("true", "false"):
+        return done.lower() == "true", None
+    return None, "done must be true or false"
+
+
+def plan(items, column, taken, check=None):
+    """ decide what happens to each item.
+    returns (results, accepted) where results has one entry per item in
+    the order received and accepted lists (index, name, item) to insert.
+    names already in taken, or repeated within items, are duplicates.
+    check(item) may return (value, error) to validate other fields """
+    results = []
+    accepted = []
+    seen = set()
+    for index, item in enumerate(items):
+        name, error = check_name(item, column)
+        if error is None and check is not None:
+            error = check(item)[1]
+        if error is not None:
+            results.append({"index": index, "name": name, "status": "invalid", "message": error})
+        elif name in taken or name in seen:
+            results.append({"index": index, "name": name, "status": "duplicate", "message": DUPLICATE})
+        else:
+            seen.add(name)
+            results.append({"index": index, "name": name, "status": "created"})
+            accepted.append((index, name, item))
+    return results, accepted
+
+
+def refuse(results, accepted, status, message):
+    """ report every accepted item as status instead, after the INSERT of
+    them failed and was rolled back """
+    for index, name, item in accepted:
+        results[index] = {"index": index, "name": name, "status": status, "message": message}
+    return results
+
+
+def wanted_names(items, column):
+    names = set()
+    for item in items:
+        name, error = check_name(item, column)
+        if error is None:
+            names.add(name)
+    return names
+
+
+def create_recipes(userid, items):
+    """ store the valid, new recipes in items for userid. names the user
+    already has are reported as duplicates instead of failing the batch.
+    a name another request stores between the check and the INSERT breaks
+    uq_Recipe_created_by_name; the batch is then checked and inserted once
+    more, and if that fails too nothing is stored """
+    names = wanted_names(items, Recipe.__table__.c.name)
+    for attempt in range(2):
+        taken = set()
+        if names:
+            taken = set(name for name, in db.session.query(Recipe.name).filter(
+                Recipe.created_by == userid, Recipe.name.in_(names)))
+        results, accepted = plan(items, Recipe.__table__.c.name, taken)
+        now = datetime.now()
+        try:
+            db.session.bulk_insert_mappings(Recipe, [
+                {"name": name, "date_created": now, "date_modified": now, "created_by": userid}
+                for index, name, item in accepted])
+            db.session.commit()
+            return results
+        except IntegrityError:
+            db.session.rollback()
+    return refuse(results, accepted, "duplicate", DUPLICATE)
+
+
+def create_catergories(recipe, items):
+    """ store the valid, new categories in items under recipe. like
+    create_new_catergory a name may only be used once in a recipe. if the
+    recipe is deleted before the INSERT, nothing is stored """
+    names = wanted_names(items, Categories.__table__.c.name)
+    taken = set()
+    if names:
+        taken = set(name for name, in db.session.query(Categories.name).filter(
+            Categories.recipeid == recipe.id, Categories.name.in_(names)))
+    results, accepted = plan(items, Categories.__table__.c.name, taken, check_done)
+    now = datetime.now()
+    try:
+        db.session.bulk_insert_mappings(Categories, [
+            {"name": name, "date_created": now, "date_modified": now, "recipeid": recipe.id,
+             "done": check_done(item)[0]}
+            for index, name, item in accepted])
+        if accepted:
+            recipe.date_modified = now
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return refuse(results, accepted, "invalid", "Recipe does not exist")
+    return results
@@ -0,0 +1,157 @@
+from collections import OrderedDict
+import hashlib
+from threading import Lock
+import time
+import uuid
+
+
+class LRUCache(object):
+    """ A small thread safe in-process cache.
+    holds at most maxsize entries, dropping the least recently used one
+    when full. entries older than ttl seconds are treated as missing """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def configure(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires is not None and expires <= self.clock():
+                del self._data[key]
+                return default
+            # re-insert so the entry becomes the most recently used one
+            del self._data[key]
+            self._data[key] = entry
+            return value
+
+    def set(self, key, value, ttl=None):
+        """ store value under key. ttl overrides the cache wide ttl """
+        if ttl is None:
+            ttl = self.ttl
+        expires = self.clock() + ttl if ttl is not None else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TokenCache(object):
+    """ Remembers which user a verified token belongs to.
+    entries are keyed by a digest of the token so the cache never holds
+    usable credentials, and live no longer than the token itself or ttl,
+    whichever is shorter. invalidate(userid) drops every token of a user by
+    bumping a per user generation, stale entries are then ignored """
+
+    def __init__(self, maxsize=10000, ttl=60, clock=time.time):
+        self.clock = clock
+        self._entries = LRUCache(maxsize, ttl, clock)
+        self._generations = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def digest(token):
+        if not isinstance(token, bytes):
+            token = token.encode("utf-8")
+        return hashlib.sha256(token).digest()
+
+    def get(self, token):
+        entry = self._entries.get(self.digest(token))
+        if entry is None:
+            return None
+        identity, generation = entry
+        if self._generations.get(identity.id, 0) != generation:
+            return None
+        return identity
+
+    def set(self, token, identity, expires=None):
+        """ cache identity for token until the unix time expires """
+        ttl = None
+        if expires is not None:
+            ttl = expires - self.clock()
+            if ttl <= 0:
+                return
+            if self._entries.ttl is not None:
+                ttl = min(ttl, self._entries.ttl)
+        generation = self._generations.get(identity.id, 0)
+        self._entries.set(self.digest(token), (identity, generation), ttl)
+
+    def configure(self, maxsize, ttl):
+        self._entries.configure(maxsize, ttl)
+
+    def invalidate(self, userid):
+        with self._lock:
+            self._generations[userid] = self._generations.get(userid, 0) + 1
+
+    def clear(self):
+        self._entries.clear()
+        self._generations.clear()
+
+
+class ResponseCache(object):
+    """ Per user cache of rendered responses.
+    backend is anything with get(key), set(key, value, ttl) and delete(key),
+    by default an in-process LRUCache. a shared backend (memcached, redis
+    ...) makes the cache and its invalidation span every worker.
+
+    keys carry a generation token per user, invalidate(userid) replaces it
+    so every response cached for the user becomes unreachable at once and
+    ages out of the backend on its own. tokens are random rather than a
+    counter, so a backend that evicts the token can never bring back
+    responses from an older generation """
+
+    def __init__(self, backend=None, ttl=None):
+        self.backend = backend if backend is not None else LRUCache()
+        self.ttl = ttl
+
+    def configure(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+
+    def generation(self, userid):
+        key = "generation:{}".format(userid)
+        generation = self.backend.get(key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self.backend.set(key, generation, None)
+        return generation
+
+    def get(self, userid, key, generation=None):
+        """ pass the generation read before rendering to get and set, so a
+        write landing in between can't file the old body under its new one """
+        if generation is None:
+            generation = self.generation(userid)
+        return self.backend.get("response:{}:{}:{}".format(userid, generation, key))
+
+    def set(self, userid, key, value, generation=None):
+        if generation is None:
+            generation = self.generation(userid)
+        self.backend.set("response:{}:{}:{}".format(userid, generation, key), value, self.ttl)
+
+    def invalidate(self, userid):
+        self.backend.set("generation:{}".format(userid), uuid.uuid4().hex, None)
+
+    def clear(self):
+        self.backend.clear()
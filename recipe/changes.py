@@ -0,0 +1,106 @@
+""" The changes feed behind GET /recipes/changes.
+
+A client keeps the watermark of its last sync and sends it back as since=.
+It gets the recipes and categories created or updated at or after that
+time, the ids of those deleted since (from the Tombstone table), and a new
+watermark. Without since everything is sent, as for a first sync.
+
+Rows are stamped when the request writing them starts, not when it
+commits, so a write still in flight when a sync reads could carry a time
+before the new watermark. The watermark is therefore set CHANGES_OVERLAP
+seconds before the read; a client may see a row twice and should apply a
+feed by deleting first, then inserting or replacing rows by id.
+
+Every category write also updates date_modified of its recipe, so changed
+categories are only looked for among changed recipes. Tombstones older
+than TOMBSTONE_RETENTION_DAYS are dropped by
+
+    FLASK_APP=run.py flask prune-tombstones
+
+and a since older than that is refused, the client has to sync everything.
+"""
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from .models import db, Recipe, Categories, Tombstone, RECIPE_COLUMNS, CATERGORY_COLUMNS
+from .serializers import RECIPE_FIELDS, catergory_dict
+
+WATERMARK_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+class WatermarkError(ValueError):
+    """ raised for a since= that is not a watermark or is too old """
+
+
+def format_watermark(value):
+    return value.strftime(WATERMARK_FORMAT)
+
+
+def parse_watermark(args):
+    """ the datetime in since=, None when it is not given """
+    since = args.get("since")
+    if not since:
+        return None
+    for fmt in (WATERMARK_FORMAT, "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return datetime.strptime(since, fmt)
+        except ValueError:
+            continue
+    raise WatermarkError("since must be a watermark from an earlier sync, like 2018-01-31T09:30:00.000000")
+
+
+def horizon(now):
+    """ the oldest since that tombstones are still kept for """
+    return now - timedelta(days=current_app.config["TOMBSTONE_RETENTION_DAYS"])
+
+
+def changes(userid, since):
+    """ the feed for userid since the datetime since, or all of it """
+    now = datetime.now()
+    watermark = now - timedelta(seconds=current_app.config["CHANGES_OVERLAP"])
+    if since is not None:
+        watermark = max(watermark, since)
+    recipes = db.session.query(*RECIPE_COLUMNS).filter(Recipe.created_by == userid)
+    recipeids = db.session.query(Recipe.id).filter(Recipe.created_by == userid)
+    catergories = db.session.query(Categories.recipeid, *CATERGORY_COLUMNS)
+    if since is not None:
+        recipes = recipes.filter(Recipe.date_modified >= since)
+        recipeids = recipeids.filter(Recipe.date_modified >= since)
+        catergories = catergories.filter(Categories.date_modified >= since)
+    feed = {
+        "recipes": {"created": [], "updated": [], "deleted": []},
+        "categories": {"created": [], "updated": [], "deleted": []},
+        "watermark": format_watermark(watermark)
+    }
+    for row in recipes.order_by(Recipe.id):
+        created = since is None or row[2] >= since
+        feed["recipes"]["created" if created else "updated"].append(dict(zip(RECIPE_FIELDS, row)))
+    for row in catergories.filter(Categories.recipeid.in_(db.select([recipeids.subquery().c.id]))).order_by(Categories.id):
+        category = catergory_dict(row[1:])
+        category["recipeid"] = row[0]
+        created = since is None or row[3] >= since
+        feed["categories"]["created" if created else "updated"].append(category)
+    if since is not None:
+        tombstones = db.session.query(Tombstone.recipeid, Tombstone.catergoryid).filter(
+            Tombstone.created_by == userid, Tombstone.date_deleted >= since).order_by(Tombstone.id)
+        for recipeid, catergoryid in tombstones:
+            if catergoryid is None:
+                feed["recipes"]["deleted"].append(recipeid)
+            else:
+                feed["categories"]["deleted"].append(catergoryid)
+    return feed
+
+
+def prune(now=None):
+    """ drop the tombstones older than TOMBSTONE_RETENTION_DAYS, returns how many """
+    deleted = db.session.query(Tombstone).filter(
+        Tombstone.date_deleted < horizon(now or datetime.now())).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def init_app(app):
+    @app.cli.command("prune-tombstones")
+    def prune_tombstones():
+        """ Drop the tombstones of deletes older than TOMBSTONE_RETENTION_DAYS. """
+        click.echo("Dropped {} tombstones".format(prune()))
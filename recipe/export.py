@@ -0,0 +1,38 @@
+""" Streaming export of a user's recipe book as NDJSON, one recipe with its
+categories per line.
+
+Recipes and categories are read with one outer join ordered by recipe, in
+batches of BATCH_SIZE rows from a server-side cursor, and each recipe is
+written out as soon as its last category has been read. Memory use does
+not depend on the size of the account.
+"""
+from .models import db, Recipe, Categories, RECIPE_COLUMNS, CATERGORY_COLUMNS
+from .serializers import catergory_dict, dumps, recipe_dict
+
+BATCH_SIZE = 500
+
+
+def rows(userid):
+    return db.session.query(*(RECIPE_COLUMNS + CATERGORY_COLUMNS)).outerjoin(
+        Categories, Categories.recipeid == Recipe.id).filter(
+        Recipe.created_by == userid).order_by(Recipe.id, Categories.id).execution_options(
+        stream_results=True).yield_per(BATCH_SIZE)
+
+
+def recipes(userid):
+    """ yield the recipes of userid, shaped like Recipe.returnthis """
+    current = None
+    for row in rows(userid):
+        if current is None or current["id"] != row[0]:
+            if current is not None:
+                yield current
+            current = recipe_dict(row, [])
+        if row[5] is not None:
+            current["categories"].append(catergory_dict(row[5:]))
+    if current is not None:
+        yield current
+
+
+def ndjson(userid):
+    for recipe in recipes(userid):
+        yield dumps(recipe) + b"\n"
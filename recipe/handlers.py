@@ -0,0 +1,191 @@
+""" The recipe routes served by both views.py and asgi.py.
+
+views.py runs every route on the Flask-SQLAlchemy session, asgi.py runs
+the busiest ones again as coroutines on an async connection. What does not
+depend on how a statement is run lives here, and both use it:
+
+  - reading the arguments
+  - the statements
+  - turning what the statements found into a message and status code
+
+Functions ending in _refused return (body, status) when the request has to
+stop there and None when it goes on. A fix made here reaches both entry
+points, so the two can't drift apart.
+"""
+from .models import db, Recipe, Categories, RECIPE_COLUMNS, CATERGORY_COLUMNS, bury_recipes
+from .pagination import MAX_PAGE_SIZE, PaginationError, page_args, keyset, next_cursor
+from .serializers import catergory_dict, parse_fields, parse_include
+
+NAME_TAKEN = {"message": "The Recipe name you are using has already been saved"}
+
+
+def json_name(body):
+    """ the name in a JSON body, None when there is none """
+    name = body.get("name") if isinstance(body, dict) else None
+    return name or None
+
+
+def wants_categories(fields):
+    return fields is None or "categories" in fields
+
+
+def owner_of(recipeid):
+    """ created_by of the recipe, None when there is no such recipe """
+    return db.select([Recipe.created_by]).where(Recipe.id == recipeid)
+
+
+def owned(recipeid, userid):
+    """ the recipe, matched only while it belongs to userid, to make a
+    write conditional on ownership inside the write itself """
+    return db.and_(Recipe.id == recipeid, Recipe.created_by == userid)
+
+
+def write_refused(owner, denied_status):
+    """ why a write to a recipe matched no rows, owner from owner_of. a
+    recipe of another user gets 403 on update but 400 on delete """
+    if owner is None:
+        return {"message": "The category you request does not exist"}, 400
+    return {"message": "You don't have permission to modify this category"}, denied_status
+
+
+def recipe_refused(owner, userid):
+    """ whether the recipe of a category route is there and the user's """
+    if owner is None:
+        return {"message": "Recipe does not exist"}, 400
+    if not owner == userid:
+        return {"message": "That recipe does not belong to you "}, 403
+    return None
+
+
+# GET /recipes
+def listing_args(args):
+    """ (limit, cursor, fields, counts, q), raises PaginationError or
+    FieldsError """
+    limit, cursor = page_args(args)
+    fields = parse_fields(args)
+    counts = "counts" in parse_include(args)
+    q = args.get("q") or None
+    if q and cursor is not None:
+        raise PaginationError("cursor cannot be used with q, search results are ranked")
+    return limit, cursor, fields, counts, q
+
+
+def listing(userid, limit, cursor):
+    """ the user's recipes, or the page of them after cursor """
+    statement = db.select(list(RECIPE_COLUMNS)).where(Recipe.created_by == userid)
+    if limit is None:
+        return statement.order_by(Recipe.id)
+    return keyset(statement, Recipe.id, limit, cursor)
+
+
+def search_limit(limit):
+    """ how many hits to ask search.search_recipes for: limit, MAX_PAGE_SIZE
+    without one, and one more to tell whether more matched """
+    return (limit or MAX_PAGE_SIZE) + 1
+
+
+def search_page(ranked, limit):
+    """ (hits to send, whether more matched than that), the second gives
+    the response X-Results-Truncated """
+    size = limit or MAX_PAGE_SIZE
+    return ranked[:size], len(ranked) > size
+
+
+def search_hits(ranked):
+    """ the recipes of search.search_recipes, best first once in_rank_order """
+    return db.select(list(RECIPE_COLUMNS)).where(Recipe.id.in_([recipeid for recipeid, rank in ranked]))
+
+
+def in_rank_order(ls, ranked):
+    order = dict((recipeid, position) for position, (recipeid, rank) in enumerate(ranked))
+    return sorted(ls, key=lambda recipe: order[recipe["id"]])
+
+
+def listing_refused(ls, cursor, q):
+    if ls or cursor is not None:
+        return None
+    if not q:
+        return {"message": "Need to supply name of category you are looking for"}, 400
+    return {"message": "No category with that name belonging to user"}, 401
+
+
+def listing_page(ls, limit, q):
+    """ (recipes to send, X-Next-Cursor or None) """
+    if limit is None or q:
+        return ls, None
+    return next_cursor(ls, limit)
+
+
+# GET /recipes/<id>
+def recipe_args(args):
+    """ (fields, counts), raises FieldsError """
+    return parse_fields(args), "counts" in parse_include(args)
+
+
+def one_recipe(recipeid):
+    return db.select(list(RECIPE_COLUMNS)).where(Recipe.id == recipeid)
+
+
+def one_recipe_refused(ls, userid):
+    if not ls:
+        return {"message": "No category with that id"}, 400
+    if not ls[0]["created_by"] == userid:
+        return {"message": "That category does not belong to you "}, 403
+    return None
+
+
+def last_modified(recipe):
+    """ the latest change to the recipe or its categories, None if unknown """
+    modified = [recipe["date_modified"]] + [category["date_modified"] for category in recipe["categories"]]
+    modified = [date for date in modified if date is not None]
+    return max(modified) if modified else None
+
+
+# POST /recipes
+def name_taken(userid, name):
+    return db.select([Recipe.id]).where(Recipe.created_by == userid, Recipe.name == name)
+
+
+def insert_recipe(userid, name, now):
+    return Recipe.__table__.insert().values(name=name, date_created=now, date_modified=now, created_by=userid)
+
+
+def create_refused(name):
+    if not name:
+        return {"message": "Please supply recipe name"}, 400
+    return None
+
+
+# PUT /recipes/<id>
+def update_refused(name):
+    if not name:
+        return {"message": "you need to supply new edits in json"}, 400
+    return None
+
+
+def rename_recipe(recipeid, userid, name, now):
+    return Recipe.__table__.update().where(owned(recipeid, userid)).values(name=name, date_modified=now)
+
+
+# DELETE /recipes/<id> and DELETE /recipes?ids=
+def delete_recipes(condition, now):
+    """ the statements to run, in order, to delete the recipes matching
+    condition: their tombstones, then the recipes. the categories go with
+    them, ON DELETE CASCADE """
+    return [bury_recipes(condition, now), Recipe.__table__.delete().where(condition)]
+
+
+# GET /recipes/<id>/categories
+def catergory_listing(recipeid, limit, cursor):
+    statement = db.select(list(CATERGORY_COLUMNS)).where(Categories.recipeid == recipeid)
+    if limit is None:
+        return statement.order_by(Categories.id)
+    return keyset(statement, Categories.id, limit, cursor)
+
+
+def catergory_page(rows, limit):
+    """ (categories to send, X-Next-Cursor or None) """
+    ls = [catergory_dict(row) for row in rows]
+    if limit is None:
+        return ls, None
+    return next_cursor(ls, limit)
@@ -0,0 +1,219 @@
+""" Streaming import of recipes from NDJSON or CSV.
+
+NDJSON has one recipe per line:
+
+    {"name": "soup", "categories": [{"name": "chop", "done": false}]}
+
+CSV has a header row with a name column and optional category and done
+columns. Consecutive rows with the same name make up one recipe:
+
+    name,category,done
+    soup,chop,false
+    soup,boil,true
+
+The input is parsed as it is read and handled in chunks of chunk_size
+recipes. For each chunk the names are checked against the chunk seen so far
+and with one IN query against the database, then recipes and categories are
+written with two executemany INSERTs and committed. A failure only loses the
+chunk being written.
+"""
+import codecs
+import csv
+from datetime import datetime
+import sys
+import time
+import click
+from flask import json
+from .bulk import check_done, check_name
+from .models import db, User, Recipe, Categories
+
+MAX_REJECTIONS = 100
+""" the python 2 csv module only reads byte strings """
+CSV_READS_BYTES = sys.version_info[0] == 2
+RECIPE_NAME = Recipe.__table__.c.name
+CATERGORY_NAME = Categories.__table__.c.name
+
+
+class ImportReport(object):
+    """ running totals of an import """
+
+    def __init__(self):
+        self.started = time.time()
+        self.rows = 0
+        self.recipes = 0
+        self.categories = 0
+        self.rejected = 0
+        self.rejections = []
+
+    def reject(self, line, name, message):
+        self.rejected += 1
+        if len(self.rejections) < MAX_REJECTIONS:
+            self.rejections.append({"line": line, "name": name, "message": message})
+
+    def summary(self):
+        seconds = time.time() - self.started
+        return {
+            "rows": self.rows,
+            "recipes": self.recipes,
+            "categories": self.categories,
+            "rejected": self.rejected,
+            "rejections": self.rejections,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(self.rows / seconds, 1) if seconds else None,
+        }
+
+
+def text_lines(stream):
+    """ decode a binary stream line by line """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for line in stream:
+        if isinstance(line, bytes):
+            line = decoder.decode(line)
+        yield line
+
+
+def parse_ndjson(lines):
+    """ yield (line number, item or None, error) """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            yield number, None, "Not valid JSON"
+            continue
+        yield number, item, None
+
+
+def parse_csv(lines):
+    """ yield (line number, item or None, error), grouping consecutive rows
+    that share a name into one recipe """
+    if CSV_READS_BYTES:
+        lines = (line.encode("utf-8") for line in lines)
+    reader = csv.DictReader(lines)
+    if not reader.fieldnames or "name" not in reader.fieldnames:
+        yield 1, None, "CSV needs a header row with a name column"
+        return
+    current = None
+    for row in reader:
+        if CSV_READS_BYTES:
+            row = dict((key, value.decode("utf-8") if isinstance(value, bytes) else value)
+                       for key, value in row.items())
+        if current is not None and row["name"] == current[1]["name"]:
+            item = current[1]
+        else:
+            if current is not None:
+                yield current[0], current[1], None
+            item = {"name": row["name"], "categories": []}
+            current = (reader.line_num, item)
+        if row.get("category"):
+            item["categories"].append({"name": row["category"], "done": row.get("done") or False})
+    if current is not None:
+        yield current[0], current[1], None
+
+
+def check_recipe(item):
+    """ return (name, categories, error) for one parsed recipe """
+    name, error = check_name(item, RECIPE_NAME)
+    if error is not None:
+        return name, None, error
+    categories = item.get("categories") or []
+    if not isinstance(categories, list):
+        return name, None, "categories must be a list"
+    checked = []
+    seen = set()
+    for category in categories:
+        catergory_name, error = check_name(category, CATERGORY_NAME)
+        if error is None:
+            done, error = check_done(category)
+        if error is not None:
+            return name, None, "Category {}: {}".format(catergory_name or len(checked) + 1, error)
+        if catergory_name in seen:
+            continue
+        seen.add(catergory_name)
+        checked.append((catergory_name, done))
+    return name, checked, None
+
+
+def write_chunk(userid, chunk, report):
+    """ store a chunk of (line, name, categories) and commit it """
+    names = [name for line, name, categories in chunk]
+    taken = set(name for name, in db.session.query(Recipe.name).filter(
+        Recipe.created_by == userid, Recipe.name.in_(names)))
+    accepted = []
+    for line, name, categories in chunk:
+        if name in taken:
+            report.reject(line, name, "That name has already been used")
+        else:
+            accepted.append((name, categories))
+    if not accepted:
+        return
+    now = datetime.now()
+    db.session.bulk_insert_mappings(Recipe, [
+        {"name": name, "date_created": now, "date_modified": now, "created_by": userid}
+        for name, categories in accepted])
+    ids = dict(db.session.query(Recipe.name, Recipe.id).filter(
+        Recipe.created_by == userid, Recipe.name.in_([name for name, categories in accepted])))
+    rows = [{"name": catergory_name, "done": done, "date_created": now, "date_modified": now,
+             "recipeid": ids[name]}
+            for name, categories in accepted for catergory_name, done in categories]
+    if rows:
+        db.session.bulk_insert_mappings(Categories, rows)
+    db.session.commit()
+    report.recipes += len(accepted)
+    report.categories += len(rows)
+
+
+def import_recipes(userid, parsed, chunk_size=1000):
+    """ import the (line, item, error) triples from parse_ndjson or parse_csv
+    for userid and return the ImportReport summary """
+    report = ImportReport()
+    chunk = []
+    seen = set()
+    for line, item, error in parsed:
+        report.rows += 1
+        name = item.get("name") if isinstance(item, dict) else None
+        if error is None:
+            name, categories, error = check_recipe(item)
+        if error is None and name in seen:
+            error = "Recipe appears more than once in this chunk"
+        if error is not None:
+            report.reject(line, name, error)
+            continue
+        seen.add(name)
+        chunk.append((line, name, categories))
+        if len(chunk) >= chunk_size:
+            write_chunk(userid, chunk, report)
+            chunk = []
+            seen = set()
+    if chunk:
+        write_chunk(userid, chunk, report)
+    return report.summary()
+
+
+PARSERS = {"ndjson": parse_ndjson, "csv": parse_csv}
+
+
+def guess_format(filename, mimetype=None):
+    if (mimetype and "csv" in mimetype) or (filename and filename.lower().endswith(".csv")):
+        return "csv"
+    return "ndjson"
+
+
+def init_app(app):
+    @app.cli.command("import-recipes")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--user", "username", required=True, help="username that will own the recipes")
+    @click.option("--format", "fmt", type=click.Choice(sorted(PARSERS)), default=None,
+                  help="input format, guessed from the file name by default")
+    @click.option("--chunk-size", default=None, type=int, help="recipes per commit")
+    def import_recipes_command(path, username, fmt, chunk_size):
+        """ Import recipes for a user from an NDJSON or CSV file. """
+        user = db.session.query(User).filter_by(username=username).first()
+        if user is None:
+            raise click.UsageError("No user called {}".format(username))
+        parser = PARSERS[fmt or guess_format(path)]
+        with open(path, "rb") as stream:
+            summary = import_recipes(user.id, parser(text_lines(stream)),
+                                     chunk_size or app.config["IMPORT_CHUNK_SIZE"])
+        click.echo(json.dumps(summary, indent=2))
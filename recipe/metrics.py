@@ -0,0 +1,123 @@
+""" Prometheus metrics, served at /metrics.
+
+Every request is counted by route, method and status and its duration goes
+into a histogram by route and method. Routes are the URL rules of views.py
+(/recipes/<id>), so the number of series stays fixed. Failed token checks
+and requests turned away by the rate limiter are counted by reason.
+Connection pool checkouts, timeouts and time spent waiting are counters
+bumped by the pool itself. Connections in use, idle and in overflow are
+gauges read from the pool when /metrics is scraped, labelled with the pid
+of the worker they describe.
+
+Under gunicorn each worker keeps its own numbers. Point
+PROMETHEUS_MULTIPROC_DIR at an empty directory in the environment gunicorn
+starts with; workers then write their metrics to memory mapped files there
+and /metrics, whichever worker answers, adds up all of them. The pool
+gauges are the exception, they only cover the worker that answered. Empty
+the directory before each start and add to the gunicorn config
+
+    from recipe.metrics import child_exit
+"""
+import os
+import time
+from flask import g, has_app_context, request
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram,
+                               REGISTRY, generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+from .models import db
+from .pool import pool_stats, wait_listeners
+
+REQUESTS = Counter("recipe_http_requests_total", "Requests handled",
+                   ["route", "method", "status"])
+LATENCY = Histogram("recipe_http_request_duration_seconds", "Time taken to handle requests",
+                    ["route", "method"],
+                    buckets=(.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 10.0))
+AUTH_FAILURES = Counter("recipe_auth_failures_total", "Requests with a token that was refused",
+                        ["reason"])
+RATE_LIMITED = Counter("recipe_rate_limited_total", "Requests turned away by the rate limiter",
+                       ["route", "reason"])
+POOL_CHECKOUTS = Counter("recipe_db_pool_checkouts", "Connections handed out by the pool")
+POOL_TIMEOUTS = Counter("recipe_db_pool_timeouts", "Checkouts that gave up waiting for a connection")
+POOL_WAIT = Counter("recipe_db_pool_wait_seconds", "Time spent waiting for a connection")
+POOL_GAUGES = [
+    ("checked_out", "Connections in use"),
+    ("checked_in", "Idle connections in the pool"),
+    ("overflow", "Connections open beyond the pool size"),
+]
+
+
+class PoolCollector(object):
+    """ the pool gauges of this worker, read at scrape time so requests
+    don't pay for them """
+
+    def collect(self):
+        if not has_app_context():
+            return
+        stats = pool_stats(db.engine)
+        for name, description in POOL_GAUGES:
+            if name in stats:
+                gauge = GaugeMetricFamily("recipe_db_pool_{}".format(name), description, labels=["pid"])
+                gauge.add_metric([str(os.getpid())], stats[name])
+                yield gauge
+
+
+REGISTRY.register(PoolCollector())
+
+
+def multiprocess_dir():
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("prometheus_multiproc_dir")
+
+
+def render():
+    """ (body, content type) for a scrape """
+    if multiprocess_dir():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(PoolCollector())
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def auth_failed(reason):
+    AUTH_FAILURES.labels(reason).inc()
+
+
+def rate_limited(route, reason):
+    """ reason is the scope of the empty bucket, or overload """
+    RATE_LIMITED.labels(route, reason).inc()
+
+
+def pool_waited(waited, timed_out):
+    POOL_CHECKOUTS.inc()
+    POOL_WAIT.inc(waited)
+    if timed_out:
+        POOL_TIMEOUTS.inc()
+
+
+def child_exit(server, worker):
+    """ gunicorn hook, cleans up after a worker that exited """
+    if multiprocess_dir():
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def init_app(app):
+    """ record every request of app when METRICS is set """
+    if not app.config["METRICS"]:
+        return
+    if pool_waited not in wait_listeners:
+        wait_listeners.append(pool_waited)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.time()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        LATENCY.labels(route, request.method).observe(time.time() - started)
+        REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+        return response
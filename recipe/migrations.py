@@ -0,0 +1,163 @@
+""" Schema creation and upgrades.
+
+The schema_version table holds the number of the last revision applied. A
+new database gets the current schema from the models in one go and is
+stamped with the latest revision. A database created before revisions were
+tracked is taken to be at revision 0 and brought forward one revision at a
+time. Run it with
+
+    FLASK_APP=run.py flask init-db
+"""
+import click
+from sqlalchemy import MetaData, inspect
+from sqlalchemy.schema import CreateTable
+from .models import db, Recipe, Categories, Tombstone
+
+schema_version = db.Table("schema_version", db.Column("revision", db.Integer, nullable=False))
+REVISIONS = []
+
+
+def revision(number, description):
+    """ register function(connection) as the upgrade to revision number """
+    def register(function):
+        REVISIONS.append((number, description, function))
+        REVISIONS.sort(key=lambda entry: entry[0])
+        return function
+    return register
+
+
+def head():
+    return REVISIONS[-1][0] if REVISIONS else 0
+
+
+def current_revision(connection):
+    """ the revision of the database, None when it has no schema yet """
+    tables = inspect(connection).get_table_names()
+    if "schema_version" in tables:
+        return connection.execute(db.select([schema_version.c.revision])).scalar() or 0
+    if "Recipe" in tables:
+        return 0
+    return None
+
+
+def stamp(connection, number):
+    connection.execute(schema_version.delete())
+    connection.execute(schema_version.insert(), {"revision": number})
+
+
+def upgrade(engine=None, echo=None):
+    """ bring the database up to the latest revision, returns the list of
+    revisions applied """
+    engine = engine or db.engine
+    echo = echo or (lambda message: None)
+    with engine.connect() as connection:
+        if connection.dialect.name == "sqlite":
+            # rebuild_table drops tables other tables point at, which
+            # sqlite would refuse or cascade with foreign keys on
+            connection.execute(db.text("PRAGMA foreign_keys=OFF"))
+        try:
+            with connection.begin():
+                return apply_revisions(connection, echo)
+        finally:
+            if connection.dialect.name == "sqlite":
+                connection.execute(db.text("PRAGMA foreign_keys=ON"))
+
+
+def apply_revisions(connection, echo):
+    applied = []
+    current = current_revision(connection)
+    if current is None:
+        db.metadata.create_all(connection)
+        stamp(connection, head())
+        echo("Created the schema at revision {}".format(head()))
+        return applied
+    schema_version.create(connection, checkfirst=True)
+    for number, description, function in REVISIONS:
+        if number <= current:
+            continue
+        echo("Applying revision {}: {}".format(number, description))
+        function(connection)
+        stamp(connection, number)
+        applied.append(number)
+    return applied
+
+
+def create_index(connection, name, table, columns):
+    connection.execute(db.text('CREATE INDEX IF NOT EXISTS "{}" ON "{}" ({})'.format(
+        name, table, ", ".join('"{}"'.format(column) for column in columns))))
+
+
+def rebuild_table(connection, table):
+    """ recreate table as the models now define it, keeping its rows. this is
+    how SQLite changes constraints: build the new table beside the old one,
+    copy the rows, swap them and create the indexes again """
+    metadata = MetaData()
+    for model_table in db.metadata.sorted_tables:
+        model_table.to_metadata(metadata)
+    new = table.to_metadata(metadata, name="_new_{}".format(table.name))
+    old_columns = set(column["name"] for column in inspect(connection).get_columns(table.name))
+    columns = ", ".join('"{}"'.format(column.name) for column in table.columns if column.name in old_columns)
+    connection.execute(CreateTable(new))
+    connection.execute(db.text('INSERT INTO "{}" ({}) SELECT {} FROM "{}"'.format(
+        new.name, columns, columns, table.name)))
+    connection.execute(db.text('DROP TABLE "{}"'.format(table.name)))
+    connection.execute(db.text('ALTER TABLE "{}" RENAME TO "{}"'.format(new.name, table.name)))
+    for index in table.indexes:
+        index.create(connection)
+
+
+@revision(1, "indexes for keyset pagination and trigram search")
+def pagination_and_search_indexes(connection):
+    create_index(connection, "ix_Recipe_created_by_id", "Recipe", ["created_by", "id"])
+    create_index(connection, "ix_Categories_recipeid_id", "Categories", ["recipeid", "id"])
+    if connection.dialect.name == "postgresql":
+        connection.execute(db.text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        connection.execute(db.text('CREATE INDEX IF NOT EXISTS "ix_Recipe_name_trgm" ON "Recipe" '
+                                   "USING gin (name gin_trgm_ops)"))
+        connection.execute(db.text('CREATE INDEX IF NOT EXISTS "ix_Categories_name_trgm" ON "Categories" '
+                                   "USING gin (name gin_trgm_ops)"))
+
+
+@revision(2, "recipe names unique per user, index category names per recipe")
+def per_user_names(connection):
+    create_index(connection, "ix_Categories_recipeid_name", "Categories", ["recipeid", "name"])
+    if connection.dialect.name == "sqlite":
+        rebuild_table(connection, Recipe.__table__)
+        return
+    constraints = inspect(connection).get_unique_constraints("Recipe")
+    for constraint in constraints:
+        if constraint["column_names"] == ["name"]:
+            connection.execute(db.text('ALTER TABLE "Recipe" DROP CONSTRAINT "{}"'.format(constraint["name"])))
+    if "uq_Recipe_created_by_name" not in [constraint["name"] for constraint in constraints]:
+        connection.execute(db.text('ALTER TABLE "Recipe" ADD CONSTRAINT "uq_Recipe_created_by_name" '
+                                   'UNIQUE (created_by, name)'))
+
+
+@revision(3, "delete the categories of a recipe in the database")
+def cascade_catergories(connection):
+    # rows left behind by deletes made before the foreign key was enforced
+    connection.execute(db.text('DELETE FROM "Categories" WHERE recipeid NOT IN (SELECT id FROM "Recipe")'))
+    if connection.dialect.name == "sqlite":
+        rebuild_table(connection, Categories.__table__)
+        return
+    for foreign_key in inspect(connection).get_foreign_keys("Categories"):
+        if foreign_key["referred_table"] == "Recipe":
+            connection.execute(db.text('ALTER TABLE "Categories" DROP CONSTRAINT "{}"'.format(
+                foreign_key["name"])))
+    connection.execute(db.text('ALTER TABLE "Categories" ADD CONSTRAINT "Categories_recipeid_fkey" '
+                               'FOREIGN KEY (recipeid) REFERENCES "Recipe" (id) ON DELETE CASCADE'))
+
+
+@revision(4, "tombstones and date_modified indexes for the changes feed")
+def changes_feed(connection):
+    Tombstone.__table__.create(connection, checkfirst=True)
+    create_index(connection, "ix_Tombstone_created_by_date_deleted", "Tombstone", ["created_by", "date_deleted"])
+    create_index(connection, "ix_Recipe_created_by_date_modified", "Recipe", ["created_by", "date_modified"])
+
+
+def init_app(app):
+    @app.cli.command("init-db")
+    def init_db():
+        """ Create the database schema or upgrade it to the latest revision. """
+        upgrade(echo=click.echo)
+        click.echo("Database is at revision {}".format(head()))
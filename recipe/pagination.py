@@ -0,0 +1,69 @@
+import base64
+import binascii
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 1000
+
+
+class PaginationError(ValueError):
+    """ raised when the client sends a limit or cursor we cannot use """
+
+
+def encode_cursor(lastid):
+    """ turn the id of the last row on a page into an opaque token """
+    return base64.urlsafe_b64encode(str(lastid).encode("utf-8")).decode("utf-8").rstrip("=")
+
+
+def decode_cursor(token):
+    """ get back the id of the last row the client has already seen """
+    padded = token + "=" * (-len(token) % 4)
+    try:
+        lastid = int(base64.urlsafe_b64decode(padded.encode("utf-8")).decode("utf-8"))
+    except (TypeError, ValueError, UnicodeDecodeError, binascii.Error):
+        raise PaginationError("Invalid cursor")
+    if lastid < 0:
+        raise PaginationError("Invalid cursor")
+    return lastid
+
+
+def page_args(args):
+    """ read limit and cursor from the query string.
+    returns (None, None) when the client did not ask for a page so the
+    caller can keep returning everything """
+    limit = args.get("limit")
+    cursor = args.get("cursor")
+    if not limit and cursor is None:
+        return None, None
+    if limit:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise PaginationError("limit must be a positive integer")
+        if limit < 1:
+            raise PaginationError("limit must be a positive integer")
+        limit = min(limit, MAX_PAGE_SIZE)
+    else:
+        limit = DEFAULT_PAGE_SIZE
+    if cursor:
+        cursor = decode_cursor(cursor)
+    else:
+        cursor = None
+    return limit, cursor
+
+
+def keyset(query, column, limit, cursor):
+    """ restrict query to the page that starts right after cursor.
+    the filter on column lets the database seek straight into the index
+    instead of scanning and throwing away OFFSET rows, so every page costs
+    the same. one extra row is fetched to know if there is a next page """
+    if cursor is not None:
+        query = query.filter(column > cursor)
+    return query.order_by(column).limit(limit + 1)
+
+
+def next_cursor(rows, limit):
+    """ trim the extra row fetched by keyset and build the next token """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]["id"])
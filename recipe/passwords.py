@@ -0,0 +1,100 @@
+""" Password hashing.
+
+The scheme and cost come from PASSWORD_HASH_SCHEME and PASSWORD_HASH_ROUNDS.
+Hashes made with any other scheme or cost still verify, and verify_and_update
+hands back a replacement hash so logins upgrade old hashes as they go.
+
+Hashing is deliberately slow, so it runs on a process pool of
+PASSWORD_HASH_WORKERS processes (one per CPU by default, 0 hashes in the
+request thread) instead of in the request thread. At most
+PASSWORD_HASH_QUEUE jobs may wait for the pool; past that, or when a job
+takes longer than PASSWORD_HASH_TIMEOUT, PasswordHashBusy is raised so a
+burst of logins is turned away instead of piling up. A job that timed out
+keeps its place in the queue until it finishes.
+"""
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from threading import BoundedSemaphore, Lock
+import os
+from flask import current_app
+from passlib.context import CryptContext
+
+""" hashes created before the scheme became configurable """
+LEGACY_SCHEMES = ["sha256_crypt"]
+contexts = {}
+
+
+class PasswordHashBusy(Exception):
+    """ raised when too many hashing jobs are already waiting """
+
+
+def get_context(scheme, rounds):
+    """ build (once per process) the passlib context for a scheme and cost.
+    pinning min and max rounds to the configured cost makes any hash with
+    another cost, higher or lower, count as needing an update """
+    key = (scheme, rounds)
+    if key not in contexts:
+        schemes = [scheme] + [legacy for legacy in LEGACY_SCHEMES if legacy != scheme]
+        settings = {"schemes": schemes, "default": scheme, "deprecated": "auto"}
+        if rounds:
+            for option in ("default_rounds", "min_rounds", "max_rounds"):
+                settings["{}__{}".format(scheme, option)] = rounds
+        contexts[key] = CryptContext(**settings)
+    return contexts[key]
+
+
+def _hash(scheme, rounds, password):
+    return get_context(scheme, rounds).hash(password)
+
+
+def _verify_and_update(scheme, rounds, password, hashed):
+    return get_context(scheme, rounds).verify_and_update(password, hashed)
+
+
+class HashPool(object):
+    """ a process pool created lazily in the process that uses it, so
+    workers forked by gunicorn each start their own """
+
+    def __init__(self):
+        self.pid = None
+        self.executor = None
+        self.slots = None
+        self.lock = Lock()
+
+    def run(self, function, *args):
+        workers = current_app.config["PASSWORD_HASH_WORKERS"]
+        if not workers:
+            return function(*args)
+        with self.lock:
+            if self.pid != os.getpid():
+                self.executor = ProcessPoolExecutor(max_workers=workers)
+                self.slots = BoundedSemaphore(workers + current_app.config["PASSWORD_HASH_QUEUE"])
+                self.pid = os.getpid()
+            executor, slots = self.executor, self.slots
+        if not slots.acquire(False):
+            raise PasswordHashBusy("Too many password checks in progress")
+        try:
+            future = executor.submit(function, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # the slot is held until the hash is done, even when we stop waiting for it
+        future.add_done_callback(lambda future: slots.release())
+        try:
+            return future.result(current_app.config["PASSWORD_HASH_TIMEOUT"])
+        except FutureTimeout:
+            raise PasswordHashBusy("Password check took too long")
+
+
+pool = HashPool()
+
+
+def hash_password(password):
+    return pool.run(_hash, current_app.config["PASSWORD_HASH_SCHEME"],
+                    current_app.config["PASSWORD_HASH_ROUNDS"], password)
+
+
+def verify_and_update(password, hashed):
+    """ return (valid, new hash or None). a new hash is returned when hashed
+    was made with another scheme or cost than the configured one """
+    return pool.run(_verify_and_update, current_app.config["PASSWORD_HASH_SCHEME"],
+                    current_app.config["PASSWORD_HASH_ROUNDS"], password, hashed)
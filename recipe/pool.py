@@ -0,0 +1,137 @@
+""" Connection pool settings and instrumentation.
+
+Pool sizing comes from the environment so every deployment can size the
+pool per worker without code changes:
+
+    DB_POOL_SIZE      connections kept open per worker (5)
+    DB_MAX_OVERFLOW   extra connections allowed under load (10)
+    DB_POOL_TIMEOUT   seconds to wait for a free connection (30)
+    DB_POOL_RECYCLE   seconds before a connection is replaced (1800)
+    DB_POOL_PRE_PING  test connections on checkout, survives failovers (1)
+
+Engines on a server database get an InstrumentedQueuePool which records how
+long requests wait for a connection and how often they give up. SQLite
+connections get PRAGMA foreign_keys=ON so ON DELETE CASCADE works there too.
+"""
+from threading import Lock
+import os
+import time
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, orm
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+from .replicas import RoutingSession
+
+
+def pool_settings(environ=os.environ):
+    """ read the pool settings, falling back to the defaults above """
+    return {
+        "DB_POOL_SIZE": int(environ.get("DB_POOL_SIZE", 5)),
+        "DB_MAX_OVERFLOW": int(environ.get("DB_MAX_OVERFLOW", 10)),
+        "DB_POOL_TIMEOUT": float(environ.get("DB_POOL_TIMEOUT", 30)),
+        "DB_POOL_RECYCLE": int(environ.get("DB_POOL_RECYCLE", 1800)),
+        "DB_POOL_PRE_PING": environ.get("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no"),
+    }
+
+
+""" called with (seconds waited, timed out) after every checkout of an
+InstrumentedQueuePool, metrics.py adds itself here """
+wait_listeners = []
+
+
+class WaitStats(object):
+    """ how long checkouts had to wait for a connection """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited, timed_out=False):
+        with self.lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if timed_out:
+                self.timeouts += 1
+        for listener in wait_listeners:
+            listener(waited, timed_out)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """ a QueuePool that times every checkout """
+
+    def __init__(self, *args, **kwargs):
+        super(InstrumentedQueuePool, self).__init__(*args, **kwargs)
+        self.wait_stats = WaitStats()
+
+    def _do_get(self):
+        start = time.time()
+        try:
+            connection = super(InstrumentedQueuePool, self)._do_get()
+        except TimeoutError:
+            self.wait_stats.record(time.time() - start, timed_out=True)
+            raise
+        self.wait_stats.record(time.time() - start)
+        return connection
+
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """ applies the DB_POOL_* settings when the engine is created, so they
+    follow whatever database URI is configured at that point. sessions can
+    read from replicas, see replicas.py """
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super(PooledSQLAlchemy, self).apply_driver_hacks(app, sa_url, options)
+        options["pool_pre_ping"] = app.config["DB_POOL_PRE_PING"]
+        if sa_url.drivername != "sqlite":
+            # sqlite connections are cheap and not shared across threads,
+            # flask-sqlalchemy already picks the right pool for them
+            options["poolclass"] = InstrumentedQueuePool
+            options["pool_size"] = app.config["DB_POOL_SIZE"]
+            options["max_overflow"] = app.config["DB_MAX_OVERFLOW"]
+            options["pool_timeout"] = app.config["DB_POOL_TIMEOUT"]
+            options["pool_recycle"] = app.config["DB_POOL_RECYCLE"]
+        return sa_url, options
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super(PooledSQLAlchemy, self).create_engine(sa_url, engine_opts)
+        if engine.dialect.name == "sqlite":
+            event.listen(engine, "connect", enable_foreign_keys)
+        return engine
+
+
+def enable_foreign_keys(dbapi_connection, connection_record):
+    """ sqlite leaves foreign keys unenforced unless asked, per connection """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def pool_stats(engine):
+    """ a snapshot of the pool behind engine, for health checks and metrics """
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__, "status": pool.status()}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+        })
+    waits = getattr(pool, "wait_stats", None)
+    if waits is not None:
+        with waits.lock:
+            stats.update({
+                "checkouts": waits.checkouts,
+                "timeouts": waits.timeouts,
+                "wait_total_ms": round(waits.wait_total * 1000, 3),
+                "wait_max_ms": round(waits.wait_max * 1000, 3),
+            })
+    return stats
@@ -0,0 +1,133 @@
+""" Opt-in per-request profiling.
+
+With PROFILING set every request records how many SQL statements it ran,
+the time spent in them, the time spent turning rows into JSON (the parts of
+a view wrapped in serializing()) and the total time. They are sent back as a
+Server-Timing header, which browser dev tools show next to the request:
+
+    Server-Timing: db;dur=4.1;desc="3 queries", serialize;dur=0.8, total;dur=6.3
+
+and logged on the recipe.profiling logger as one JSON object per request.
+
+With PROFILE_DIR also set each request runs under cProfile and requests
+taking PROFILE_SLOW_MS or longer are dumped to that directory as
+<endpoint>-<time>-<pid>.prof, to be read with pstats or snakeviz. cProfile
+slows every request down noticeably, so only turn it on while hunting.
+Streamed responses are timed up to the moment streaming starts.
+"""
+import cProfile
+from contextlib import contextmanager
+import logging
+import os
+import time
+from flask import g, json, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+_listening = []
+
+
+class RequestProfile(object):
+    """ the numbers collected for one request """
+
+    def __init__(self, profile_dir=None, slow_ms=None):
+        self.started = time.time()
+        self.queries = 0
+        self.sql = 0.0
+        self.serialize = 0.0
+        self.profile_dir = profile_dir
+        self.slow_ms = slow_ms
+        self.profiler = None
+        if profile_dir:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    def timings(self):
+        return {
+            "queries": self.queries,
+            "sql_ms": round(self.sql * 1000, 3),
+            "serialize_ms": round(self.serialize * 1000, 3),
+            "total_ms": round((time.time() - self.started) * 1000, 3),
+        }
+
+
+def current():
+    """ the profile of the running request, None when not profiling """
+    return g.get("profile") if g else None
+
+
+@contextmanager
+def serializing():
+    """ count the time spent in the block as serialization. statements run
+    inside it (lazy loads, the categories query of returnall) still count
+    as SQL and are taken off """
+    profile = current()
+    if profile is None:
+        yield
+        return
+    started, sql = time.time(), profile.sql
+    try:
+        yield
+    finally:
+        profile.serialize += (time.time() - started) - (profile.sql - sql)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["profiling_started"] = time.time()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("profiling_started", None)
+    profile = current()
+    if profile is not None and started is not None:
+        profile.queries += 1
+        profile.sql += time.time() - started
+
+
+def finish_request(response):
+    profile = current()
+    if profile is None:
+        return response
+    profile.stop()
+    timings = profile.timings()
+    response.headers["Server-Timing"] = 'db;dur={};desc="{} queries", serialize;dur={}, total;dur={}'.format(
+        timings["sql_ms"], timings["queries"], timings["serialize_ms"], timings["total_ms"])
+    line = dict(timings, endpoint=request.endpoint, method=request.method, path=request.path,
+                status=response.status_code)
+    if profile.profiler is not None and timings["total_ms"] >= profile.slow_ms:
+        line["profile"] = os.path.join(profile.profile_dir, "{}-{}-{}.prof".format(
+            request.endpoint or "unknown", int(profile.started * 1000), os.getpid()))
+        profile.profiler.dump_stats(line["profile"])
+    logger.info(json.dumps(line, sort_keys=True))
+    return response
+
+
+def init_app(app):
+    """ profile the requests of app when PROFILING is set """
+    if not app.config["PROFILING"]:
+        return
+    if not _listening:
+        # on the Engine class so every engine the app opens is covered
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+        _listening.append(True)
+    profile_dir = app.config["PROFILE_DIR"]
+    if profile_dir and not os.path.isdir(profile_dir):
+        os.makedirs(profile_dir)
+
+    @app.before_request
+    def profile_request():
+        g.profile = RequestProfile(profile_dir, app.config["PROFILE_SLOW_MS"])
+
+    app.after_request(finish_request)
+
+    @app.teardown_request
+    def stop_profiling(exception=None):
+        profile = g.pop("profile", None)
+        if profile is not None:
+            profile.stop()
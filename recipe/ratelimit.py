@@ -0,0 +1,248 @@
+""" Rate limiting and load shedding.
+
+Requests are counted against token buckets. RATELIMITS maps a blueprint
+endpoint ("api.login") to rules like "ip 10/minute": a bucket per client
+address holding up to 10 tokens that refills at 10 a minute. Endpoints
+without an entry get the "default" rules, whose buckets are shared by every
+such route. A rule is keyed on one of
+
+  ip        the client address (request.remote_addr, put ProxyFix in front
+            of the app when it runs behind a proxy)
+  user      the user id in the bearer token, read from the token cache or
+            the token signature, never from the database
+  username  the username posted to /auth/login, so guessing one account's
+            password from many addresses is limited too
+
+and is skipped when the request has nothing for it. An empty bucket turns
+the request away with 429 and Retry-After.
+
+RATELIMIT_MAX_IN_FLIGHT caps the requests a worker handles at once, past it
+requests are answered 503 straight away instead of queueing for the
+database or the password hasher.
+
+Both checks run before the view, ahead of any query or password hashing.
+Buckets live in the worker unless RATELIMIT_BACKEND names a factory
+(module:function) called with the app that returns a shared backend, such
+as redis_backend below.
+"""
+from collections import OrderedDict, namedtuple
+import math
+from threading import BoundedSemaphore, Lock
+import time
+from flask import g, request
+from werkzeug.utils import import_string
+from .models import User, token_cache
+from .serializers import jsonify
+from . import metrics
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+SCOPES = ("ip", "user", "username")
+Rule = namedtuple("Rule", ["scope", "count", "period"])
+
+
+class RateLimitError(ValueError):
+    """ raised for a rule that cannot be parsed """
+
+
+def parse_rule(text):
+    """ "ip 10/minute" -> Rule("ip", 10, 60) """
+    try:
+        scope, limit = text.split()
+        count, period = limit.split("/")
+        rule = Rule(scope, int(count), PERIODS[period.rstrip("s")])
+    except (KeyError, ValueError):
+        raise RateLimitError("{!r} is not a rule like 'ip 10/minute'".format(text))
+    if rule.scope not in SCOPES or rule.count < 1:
+        raise RateLimitError("{!r} is not a rule like 'ip 10/minute'".format(text))
+    return rule
+
+
+class MemoryBackend(object):
+    """ token buckets of this process. holds at most maxsize buckets, the
+    least recently used one is dropped when full, which only makes that
+    client start again from a full bucket """
+
+    def __init__(self, maxsize=100000, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = Lock()
+
+    def take(self, key, rate, burst, cost=1):
+        """ take cost tokens from the bucket key holding up to burst tokens
+        and gaining rate a second. returns 0 when they were taken, otherwise
+        the seconds until they would be there """
+        now = self.clock()
+        with self._lock:
+            tokens, stamp = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + max(0, now - stamp) * rate)
+            wait = 0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+""" MemoryBackend.take as one atomic step on the redis server, timed by the
+server's clock so every worker sees the same buckets """
+TAKE_SCRIPT = """
+redis.replicate_commands()
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call("HMGET", KEYS[1], "tokens", "stamp")
+local tokens = tonumber(state[1]) or burst
+local stamp = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - stamp) * rate)
+local wait = 0
+if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "stamp", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBackend(object):
+    """ token buckets in redis, shared by every worker pointed at it """
+
+    def __init__(self, client, prefix="ratelimit:"):
+        self.prefix = prefix
+        self.script = client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, rate, burst, cost=1):
+        return float(self.script(keys=[self.prefix + key], args=[rate, burst, cost]))
+
+
+def redis_backend(app):
+    """ RATELIMIT_BACKEND=recipe.ratelimit:redis_backend, connects to
+    RATELIMIT_REDIS_URL """
+    import redis
+    return RedisBackend(redis.StrictRedis.from_url(app.config["RATELIMIT_REDIS_URL"]))
+
+
+class RateLimiter(object):
+    """ configured in init_app """
+
+    def __init__(self):
+        self.rules = {}
+        self.backend = MemoryBackend()
+        self.slots = None
+
+    def configure(self, rules, backend, max_in_flight):
+        self.rules = dict((name, [parse_rule(rule) for rule in group]) for name, group in rules.items())
+        self.backend = backend
+        self.slots = BoundedSemaphore(max_in_flight) if max_in_flight else None
+
+    def check(self, endpoint, key):
+        """ take a token from every bucket of endpoint. key(scope) gives the
+        client's value for a scope, or None to skip rules on it. returns
+        None when the request may go ahead, otherwise (scope, seconds to
+        wait) of the first empty bucket """
+        name = endpoint if endpoint in self.rules else "default"
+        for rule in self.rules.get(name, ()):
+            value = key(rule.scope)
+            if value is None:
+                continue
+            wait = self.backend.take("{}:{}:{}".format(name, rule.scope, value),
+                                     float(rule.count) / rule.period, rule.count)
+            if wait:
+                return rule.scope, wait
+        return None
+
+    def enter(self):
+        """ claim an in-flight slot, False when the worker is full """
+        return self.slots is None or self.slots.acquire(False)
+
+    def leave(self):
+        if self.slots is not None:
+            self.slots.release()
+
+
+limiter = RateLimiter()
+
+
+def bearer_token(headers):
+    """ the token of x-access-token or Authorization: Bearer, as verify_auth_token reads it """
+    token = headers.get("x-access-token")
+    if not token:
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer":
+            return ""
+    return token
+
+
+def token_userid(token):
+    """ the user id a token claims, without touching the database """
+    if not token:
+        return None
+    identity = token_cache.get(token)
+    if identity is not None:
+        return identity.id
+    return User.verify_auth_token(token)
+
+
+def retry_after(wait):
+    return str(max(1, int(math.ceil(wait))))
+
+
+def too_many_requests(wait):
+    response = jsonify({"message": "Too many requests, try again in {} seconds".format(retry_after(wait))})
+    response.status_code = 429
+    response.headers["Retry-After"] = retry_after(wait)
+    return response
+
+
+def overloaded():
+    response = jsonify({"message": "The server is busy right now, try again shortly"})
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+def request_key(scope):
+    if scope == "ip":
+        return request.remote_addr
+    if scope == "user":
+        return token_userid(bearer_token(request.headers))
+    if request.endpoint == "api.login":
+        body = request.get_json(silent=True)
+        if isinstance(body, dict) and body.get("username"):
+            return body["username"]
+    return None
+
+
+def init_app(app):
+    """ limit every request of app when RATELIMIT is set """
+    if not app.config["RATELIMIT"]:
+        limiter.configure({}, None, 0)
+        return
+    if app.config["RATELIMIT_BACKEND"]:
+        backend = import_string(app.config["RATELIMIT_BACKEND"])(app)
+    else:
+        backend = MemoryBackend(app.config["RATELIMIT_SIZE"])
+    limiter.configure(app.config["RATELIMITS"], backend, app.config["RATELIMIT_MAX_IN_FLIGHT"])
+
+    @app.before_request
+    def limit_request():
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        if not limiter.enter():
+            metrics.rate_limited(route, "overload")
+            return overloaded()
+        g.ratelimit_slot = True
+        refused = limiter.check(request.endpoint, request_key)
+        if refused is not None:
+            metrics.rate_limited(route, refused[0])
+            return too_many_requests(refused[1])
+
+    @app.teardown_request
+    def release_slot(exc=None):
+        if g.pop("ratelimit_slot", None):
+            limiter.leave()
@@ -0,0 +1,78 @@
+""" Read replicas.
+
+SQLALCHEMY_REPLICA_URIS (DATABASE_REPLICA_URLS in the environment, comma
+separated) lists read-only copies of SQLALCHEMY_DATABASE_URI. They become
+the binds replica_0, replica_1... and a GET or HEAD request reads from one
+of them, taken round-robin per request. Everything else reads and writes
+the primary.
+
+Inside a request the session moves to the primary for good at its first
+write (a flush, an INSERT, UPDATE or DELETE, or any statement that is not a
+SELECT), so a handler always reads back what it wrote. A user who wrote
+within REPLICA_LAG_SECONDS is also read from the primary, replicas may not
+have their write yet. That memory is per worker.
+"""
+from itertools import count
+from flask import request
+from flask_sqlalchemy import SignallingSession, get_state
+from sqlalchemy.sql.selectable import CompoundSelect, Select
+from .cache import LRUCache
+
+turns = count()
+""" users who wrote recently, configured in init_app """
+recent_writers = LRUCache(10000, 5)
+
+
+def replica_binds(app):
+    return ["replica_{}".format(number) for number in range(len(app.config["SQLALCHEMY_REPLICA_URIS"]))]
+
+
+class RoutingSession(SignallingSession):
+    """ a SignallingSession that sends SELECTs to a replica while
+    replica_bind is set and nothing has been written """
+
+    def __init__(self, *args, **kwargs):
+        super(RoutingSession, self).__init__(*args, **kwargs)
+        self.replica_bind = None
+
+    def use_replica(self):
+        """ read from the next replica, if there are any """
+        binds = replica_binds(self.app)
+        if binds:
+            self.replica_bind = binds[next(turns) % len(binds)]
+
+    def use_primary(self):
+        self.replica_bind = None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.replica_bind is not None:
+            if self._flushing or not isinstance(clause, (Select, CompoundSelect)):
+                self.replica_bind = None
+            elif mapper is None or mapper.persist_selectable.info.get("bind_key") is None:
+                return get_state(self.app).db.get_engine(self.app, bind=self.replica_bind)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+def wrote(userid):
+    """ note that userid just wrote, see REPLICA_LAG_SECONDS """
+    recent_writers.set(userid, True)
+
+
+def recently_wrote(userid):
+    return recent_writers.get(userid) is not None
+
+
+def init_app(app, db):
+    """ add the replicas to the binds of app and read GET requests from them """
+    uris = app.config["SQLALCHEMY_REPLICA_URIS"]
+    if not uris:
+        return
+    binds = dict(app.config["SQLALCHEMY_BINDS"] or {})
+    binds.update(zip(replica_binds(app), uris))
+    app.config["SQLALCHEMY_BINDS"] = binds
+    recent_writers.configure(recent_writers.maxsize, app.config["REPLICA_LAG_SECONDS"])
+
+    @app.before_request
+    def read_from_replica():
+        if request.method in ("GET", "HEAD"):
+            db.session().use_replica()
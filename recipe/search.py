@@ -0,0 +1,159 @@
+""" Recipe search over recipe names and category names.
+
+On PostgreSQL the search runs in the database against pg_trgm GIN indexes
+on "Recipe".name and "Categories".name, which serve both ILIKE '%q%' and
+the trigram word similarity operator. Other databases (SQLite in
+development and tests) get an in-process inverted trigram index per user,
+built with one query on the first search and dropped whenever that user
+writes. The in-process index lives in each worker, so its entries also
+expire after SEARCH_INDEX_TTL seconds to bound staleness across workers.
+"""
+import heapq
+import math
+import re
+from sqlalchemy import DDL, event, func, or_
+from flask import current_app
+from .cache import LRUCache
+from .models import db, Recipe, Categories
+
+WORD = re.compile(r"\w+", re.UNICODE)
+
+""" the trigram indexes only exist on PostgreSQL """
+event.listen(db.metadata, "before_create", DDL(
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+event.listen(Recipe.__table__, "after_create", DDL(
+    'CREATE INDEX "ix_Recipe_name_trgm" ON "Recipe" '
+    "USING gin (name gin_trgm_ops)").execute_if(dialect="postgresql"))
+event.listen(Categories.__table__, "after_create", DDL(
+    'CREATE INDEX "ix_Categories_name_trgm" ON "Categories" '
+    "USING gin (name gin_trgm_ops)").execute_if(dialect="postgresql"))
+
+
+def trigrams(text):
+    """ split text into trigrams the way pg_trgm does, every word is
+    lower cased and padded with two spaces in front and one behind """
+    grams = set()
+    for word in WORD.findall(text.lower()):
+        padded = "  {} ".format(word)
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class TrigramIndex(object):
+    """ inverted index from trigram to the recipes whose name or category
+    names contain it """
+
+    def __init__(self):
+        self.postings = {}
+        self.fields = {}
+
+    def add(self, recipeid, name):
+        """ index name (a recipe or category name) under recipeid """
+        grams = trigrams(name)
+        self.fields.setdefault(recipeid, []).append((name.lower(), grams))
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(recipeid)
+
+    def search(self, q, threshold, limit=None):
+        """ return [(recipeid, rank)] best match first.
+        the rank of a field is the share of the query trigrams it contains,
+        a recipe ranks as its best field and a field containing q as a
+        substring ranks 1.0 """
+        needle = q.lower()
+        wanted = trigrams(q)
+        if len(needle) < 3 or not wanted:
+            """ too short to have a trigram inside a word, so "ab" could
+            never find "cabbage". look for it as a substring, as ILIKE does
+            on PostgreSQL """
+            ranked = [(recipeid, 1.0) for recipeid, fields in self.fields.items()
+                      if any(needle in name for name, grams in fields)]
+            return self.best(ranked, limit)
+        """ a field needs at least `needed` of the query trigrams, so it must
+        appear in at least one of the len(wanted) - needed + 1 rarest posting
+        lists. only those are read, the common trigrams are skipped """
+        needed = max(1, int(math.ceil(threshold * len(wanted) - 1e-9)))
+        postings = sorted((self.postings.get(gram, ()) for gram in wanted), key=len)
+        candidates = set()
+        for posting in postings[:len(wanted) - needed + 1]:
+            candidates.update(posting)
+        """ a field containing q as a substring holds every trigram of q that
+        does not touch the word padding, so intersect those as well """
+        inner = sorted((self.postings.get(gram, set()) for gram in wanted if " " not in gram), key=len)
+        if inner:
+            candidates.update(inner[0].intersection(*inner[1:]))
+        ranked = []
+        for recipeid in candidates:
+            best = 0.0
+            for name, grams in self.fields[recipeid]:
+                if needle in name:
+                    best = 1.0
+                    break
+                best = max(best, float(len(wanted & grams)) / len(wanted))
+            if best >= threshold:
+                ranked.append((recipeid, best))
+        return self.best(ranked, limit)
+
+    def best(self, ranked, limit=None):
+        """ the first limit of [(recipeid, rank)] by rank, then id """
+        order = lambda match: (-match[1], match[0])
+        if limit is not None:
+            return heapq.nsmallest(limit, ranked, key=order)
+        return sorted(ranked, key=order)
+
+
+""" sized from SEARCH_INDEX_USERS and SEARCH_INDEX_TTL in create_app """
+indexes = LRUCache()
+
+
+def build_index(userid):
+    """ load every recipe and category name of a user in a single query """
+    index = TrigramIndex()
+    rows = db.session.query(Recipe.id, Recipe.name, Categories.name).outerjoin(
+        Categories, Categories.recipeid == Recipe.id).filter(Recipe.created_by == userid)
+    seen = set()
+    for recipeid, recipename, catergoryname in rows:
+        if recipeid not in seen:
+            seen.add(recipeid)
+            index.add(recipeid, recipename)
+        if catergoryname is not None:
+            index.add(recipeid, catergoryname)
+    return index
+
+
+def invalidate(userid):
+    """ forget the index of a user after any of their recipes or
+    categories changed """
+    indexes.delete(userid)
+
+
+def search_database(userid, q, threshold, limit=None):
+    """ ranked search run by PostgreSQL through the trigram indexes """
+    pattern = "%{}%".format(q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_"))
+    recipematch = or_(Recipe.name.ilike(pattern), Recipe.name.op("%>")(q))
+    catergorymatch = or_(Categories.name.ilike(pattern), Categories.name.op("%>")(q))
+    rank = func.greatest(
+        func.word_similarity(q, Recipe.name),
+        func.coalesce(func.max(func.word_similarity(q, Categories.name)), 0))
+    query = db.session.query(Recipe.id, rank.label("rank")).outerjoin(
+        Categories, (Categories.recipeid == Recipe.id) & catergorymatch).filter(
+        Recipe.created_by == userid, or_(recipematch, Categories.id.isnot(None))).group_by(
+        Recipe.id).order_by(rank.desc(), Recipe.id)
+    db.session.execute(db.text("SET LOCAL pg_trgm.word_similarity_threshold = :threshold"),
+                       {"threshold": threshold})
+    if limit is not None:
+        query = query.limit(limit)
+    return [(recipeid, float(score)) for recipeid, score in query]
+
+
+def search_recipes(userid, q, limit=None):
+    """ return [(recipeid, rank)] of the recipes of userid whose name or
+    category names match q, best match first """
+    threshold = current_app.config["SEARCH_THRESHOLD"]
+    if db.engine.dialect.name == "postgresql":
+        return search_database(userid, q, threshold, limit)
+    index = indexes.get(userid)
+    if index is None:
+        index = build_index(userid)
+        indexes.set(userid, index)
+    return index.search(q, threshold, limit)
@@ -0,0 +1,174 @@
+""" Turning recipes and categories into JSON.
+
+Rows come straight from column queries as tuples in RECIPE_FIELDS or
+CATERGORY_FIELDS order (see models.RECIPE_COLUMNS), so no ORM objects are
+built just to be thrown away. Dates are written the way Flask's jsonify
+writes them, as HTTP dates ("Sun, 06 Nov 1994 08:49:37 GMT"), so clients see
+the same documents whichever backend is used.
+
+The JSON library is picked by JSON_BACKEND: orjson or ujson when they are
+installed, the standard library otherwise ("auto"), or one of them by name.
+"""
+from datetime import date, datetime
+import json
+from flask import current_app
+
+RECIPE_FIELDS = ("id", "name", "date_created", "date_modified", "created_by")
+CATERGORY_FIELDS = ("id", "name", "date_created", "date_modified", "done")
+""" what a client may ask for with fields= """
+FIELDS = RECIPE_FIELDS + ("categories",)
+""" added by include=counts, and kept whatever fields= says """
+COUNT_FIELDS = ("category_count", "done_count")
+INCLUDES = ("counts",)
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTHS = (None, "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def http_date(value):
+    """ format a date or datetime like werkzeug.http.http_date, naive
+    datetimes are taken to be UTC """
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = (value - value.utcoffset()).replace(tzinfo=None)
+        # % is about twice as fast as format here, and this runs for every date
+        return "%s, %02d %s %04d %02d:%02d:%02d GMT" % (
+            WEEKDAYS[value.weekday()], value.day, MONTHS[value.month], value.year,
+            value.hour, value.minute, value.second)
+    return "%s, %02d %s %04d 00:00:00 GMT" % (
+        WEEKDAYS[value.weekday()], value.day, MONTHS[value.month], value.year)
+
+
+def default(value):
+    if isinstance(value, date):
+        return http_date(value)
+    raise TypeError("{!r} is not JSON serializable".format(value))
+
+
+def stdlib_dumps(value):
+    return json.dumps(value, default=default, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def orjson_backend():
+    import orjson
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+    def dumps(value):
+        return orjson.dumps(value, default=default, option=options)
+    return dumps
+
+
+def ujson_backend():
+    import ujson
+
+    def dumps(value):
+        return ujson.dumps(value, default=default, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    dumps({"check": datetime(2000, 1, 1)})  # default= needs ujson 5.2
+    return dumps
+
+
+BACKENDS = {
+    "orjson": orjson_backend,
+    "ujson": ujson_backend,
+    "stdlib": lambda: stdlib_dumps,
+}
+
+
+def load_backend(name):
+    """ (name, dumps) of backend name, "auto" takes the first one that can
+    be imported """
+    if name != "auto":
+        return name, BACKENDS[name]()
+    for candidate in ("orjson", "ujson"):
+        try:
+            return candidate, BACKENDS[candidate]()
+        except (ImportError, TypeError):
+            continue
+    return "stdlib", stdlib_dumps
+
+
+class Serializer(object):
+    """ configured in create_app """
+
+    def __init__(self):
+        self.name = "stdlib"
+        self.dumps = stdlib_dumps
+
+    def configure(self, name):
+        self.name, self.dumps = load_backend(name)
+
+
+serializer = Serializer()
+
+
+def dumps(value):
+    """ value as UTF-8 encoded JSON """
+    return serializer.dumps(value)
+
+
+def jsonify(value):
+    """ like flask.jsonify for a single value, through the fast backend """
+    return current_app.response_class(dumps(value), mimetype="application/json")
+
+
+class FieldsError(ValueError):
+    """ raised when fields= names something a recipe does not have """
+
+
+def parse_fields(args):
+    """ read fields=name,date_modified from the query string. returns None
+    when every field is wanted """
+    fields = args.get("fields")
+    if not fields:
+        return None
+    fields = tuple(field.strip() for field in fields.split(",") if field.strip())
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown or not fields:
+        raise FieldsError("fields may only list {}".format(", ".join(FIELDS)))
+    return fields
+
+
+def parse_include(args):
+    """ read include=counts from the query string, as a tuple of what was
+    asked for """
+    include = args.get("include")
+    if not include:
+        return ()
+    include = tuple(name.strip() for name in include.split(",") if name.strip())
+    if not include or [name for name in include if name not in INCLUDES]:
+        raise FieldsError("include may only list {}".format(", ".join(INCLUDES)))
+    return include
+
+
+def project(recipes, fields):
+    """ keep only fields, and any counts, in each recipe dict """
+    if fields is None:
+        return recipes
+    fields = fields + COUNT_FIELDS
+    return [dict((field, recipe[field]) for field in fields if field in recipe) for recipe in recipes]
+
+
+def catergory_dict(row):
+    return {
+        "id": row[0],
+        "name": row[1],
+        "date_created": row[2],
+        "date_modified": row[3],
+        "done": row[4]
+    }
+
+
+def recipe_dict(row, categories):
+    return {
+        "id": row[0],
+        "name": row[1],
+        "date_created": row[2],
+        "date_modified": row[3],
+        "created_by": row[4],
+        "categories": categories
+    }
+
+
+def with_counts(recipe, categories, done):
+    recipe["category_count"] = int(categories)
+    recipe["done_count"] = int(done)
+    return recipe
@@ -0,0 +1,168 @@
+""" Auth tokens.
+
+TOKEN_KEYS lists the signing keys as kid:secret pairs (comma separated in
+the environment). The first one signs new tokens and all of them verify,
+so a key is rotated by putting a new one in front and dropping the old one
+once its tokens have expired. Without TOKEN_KEYS, SECRET_KEY is the only
+key, with kid 0.
+
+TOKEN_FORMAT picks what new tokens look like:
+
+  compact  base64url of a packed payload (version, kid, user id, expiry)
+           followed by its HMAC-SHA256, about 64 characters
+  jws      the itsdangerous JSON web signature the API always issued,
+           about twice as long (122 characters with HS256) and slower to
+           sign and verify
+
+Tokens of either format are accepted whatever TOKEN_FORMAT says, so
+switching does not log anyone out. JWS tokens carry no kid and are
+checked against each key in turn. Tokens live TOKEN_EXPIRES_IN seconds.
+
+Keys are derived and signers built once in configure, signing or verifying
+a token only hashes the token itself.
+"""
+import base64
+import hashlib
+import hmac
+import struct
+import time
+from itsdangerous import BadData, SignatureExpired, Signer, TimedJSONWebSignatureSerializer
+
+FORMATS = ("compact", "jws")
+VERSION = 1
+""" a compact token is HEAD, the kid, BODY and the mac of all that """
+HEAD = struct.Struct(">BB")  # version, kid length
+BODY = struct.Struct(">QI")  # user id, expiry as unix time
+MAC_SIZE = hashlib.sha256().digest_size
+
+
+def parse_keys(value):
+    """ "kid:secret,kid:secret" as a list of (kid, secret) pairs """
+    keys = []
+    for pair in value.split(","):
+        kid, sep, secret = pair.strip().partition(":")
+        if not sep or not kid or not secret:
+            raise ValueError("TOKEN_KEYS entries look like kid:secret, got {!r}".format(pair))
+        keys.append((kid, secret))
+    return keys
+
+
+def to_bytes(value):
+    return value if isinstance(value, bytes) else value.encode("utf-8")
+
+
+class PrederivedSigner(Signer):
+    """ an itsdangerous Signer that derives its key once instead of on
+    every signature """
+
+    def derive_key(self):
+        key = getattr(self, "_key", None)
+        if key is None:
+            key = self._key = Signer.derive_key(self)
+        return key
+
+
+class JWSSerializer(TimedJSONWebSignatureSerializer):
+    """ reuses its signers, the stock serializer builds one per token """
+    signer = PrederivedSigner
+
+    def __init__(self, *args, **kwargs):
+        super(JWSSerializer, self).__init__(*args, **kwargs)
+        self.signers = {}
+
+    def make_signer(self, salt=None, algorithm=None):
+        signer = self.signers.get((salt, algorithm))
+        if signer is None:
+            signer = self.signers[(salt, algorithm)] = super(JWSSerializer, self).make_signer(salt, algorithm)
+        return signer
+
+
+class TokenSigner(object):
+    """ signs and verifies the tokens of every format with a set of keys,
+    configured in create_app """
+
+    def __init__(self, keys=(("0", "unconfigured"),), expires_in=6000, fmt="compact", clock=time.time):
+        self.clock = clock
+        self.configure(keys, expires_in, fmt)
+
+    def configure(self, keys, expires_in, fmt):
+        if fmt not in FORMATS:
+            raise ValueError("TOKEN_FORMAT must be one of {}, got {!r}".format(", ".join(FORMATS), fmt))
+        if not keys:
+            raise ValueError("at least one token key is needed")
+        self.format = fmt
+        self.expires_in = expires_in
+        self.kid = to_bytes(keys[0][0])
+        self.macs = {}
+        self.serializers = []
+        for kid, secret in keys:
+            if len(to_bytes(kid)) > 255:
+                raise ValueError("token key ids are at most 255 bytes, {!r} is longer".format(kid))
+            # a key of its own for compact tokens, the secret may sign jws tokens too
+            key = hmac.new(to_bytes(secret), b"recipe.tokens.compact", hashlib.sha256).digest()
+            self.macs[to_bytes(kid)] = hmac.new(key, digestmod=hashlib.sha256)
+            self.serializers.append(JWSSerializer(secret, expires_in=expires_in))
+
+    def sign(self, userid):
+        """ a token for userid, as bytes """
+        if self.format == "jws":
+            return self.serializers[0].dumps({"id": userid})
+        payload = (HEAD.pack(VERSION, len(self.kid)) + self.kid +
+                   BODY.pack(userid, int(self.clock()) + self.expires_in))
+        mac = self.macs[self.kid].copy()
+        mac.update(payload)
+        return base64.urlsafe_b64encode(payload + mac.digest()).rstrip(b"=")
+
+    def verify(self, token):
+        """ (user id, unix time the token expires) for a valid token,
+        (None, None) otherwise """
+        token = to_bytes(token)
+        if b"." in token:
+            return self.verify_jws(token)
+        return self.verify_compact(token)
+
+    def verify_compact(self, token):
+        try:
+            raw = base64.urlsafe_b64decode(token + b"=" * (-len(token) % 4))
+        except (TypeError, ValueError):
+            return None, None
+        if len(raw) < HEAD.size + BODY.size + MAC_SIZE:
+            return None, None
+        version, size = HEAD.unpack_from(raw)
+        if version != VERSION or len(raw) != HEAD.size + size + BODY.size + MAC_SIZE:
+            return None, None
+        mac = self.macs.get(raw[HEAD.size:HEAD.size + size])
+        if mac is None:
+            return None, None
+        mac = mac.copy()
+        mac.update(raw[:-MAC_SIZE])
+        if not hmac.compare_digest(mac.digest(), raw[-MAC_SIZE:]):
+            return None, None
+        userid, expires = BODY.unpack_from(raw, HEAD.size + size)
+        if expires < self.clock():
+            return None, None
+        return userid, expires
+
+    def verify_jws(self, token):
+        for serializer in self.serializers:
+            try:
+                payload, header = serializer.loads(token, return_header=True)
+            except SignatureExpired:
+                return None, None
+            except BadData:
+                continue
+            try:
+                return int(payload["id"]), header["exp"]
+            except (KeyError, TypeError, ValueError):
+                return None, None
+        return None, None
+
+
+signer = TokenSigner()
+
+
+def init_app(app):
+    keys = app.config["TOKEN_KEYS"] or [("0", app.config["SECRET_KEY"])]
+    if not isinstance(keys, (list, tuple)):
+        keys = parse_keys(keys)
+    signer.configure(keys, app.config["TOKEN_EXPIRES_IN"], app.config["TOKEN_FORMAT"])
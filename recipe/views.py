@@ -1,13 +1,32 @@
 from datetime import datetime
-from flask import request, jsonify, g, json
+from functools import wraps
+import hashlib
+from flask import Blueprint, Response, current_app, request, g, json, stream_with_context
 from flask_httpauth import HTTPTokenAuth
-from . import app
+from sqlalchemy.exc import IntegrityError
+from werkzeug.urls import url_encode
+from .cache import ResponseCache
 from .models import db
-from .models import User, Recipe, Categories
+from .models import User, Recipe, Categories, AuthUser, token_cache, bury_catergories, read_recipes
+from .pagination import PaginationError, page_args
+from .passwords import PasswordHashBusy
+from .pool import pool_stats
+from . import bulk
+from . import changes
+from . import export
+from . import handlers
+from . import importer
+from . import metrics
+from .profiling import serializing
+from . import replicas
+from . import search
+from .serializers import FieldsError, jsonify, project
 
 
+api = Blueprint("api", __name__)
 auth = HTTPTokenAuth(scheme="Bearer")
-db.create_all()
+""" configured in create_app """
+response_cache = ResponseCache()
 
 
 @auth.verify_token
@@ -22,15 +41,73 @@ def verify_auth_token(token):
     if 'x-access-token' in request.headers:
             token = request.headers['x-access-token']
     if not token:
+        metrics.auth_failed("missing")
         return False
-    userid = User.verify_auth_token(token=token)
-    if userid is None:
-        return False
-    g.user = db.session.query(User).filter_by(id=userid).first()
+    identity = token_cache.get(token)
+    if identity is None:
+        userid, expires = User.verify_auth_token(token=token, return_expiry=True)
+        if userid is None:
+            metrics.auth_failed("invalid")
+            return False
+        user = db.session.query(User.id, User.username).filter_by(id=userid).first()
+        if user is None:
+            metrics.auth_failed("unknown_user")
+            return False
+        identity = AuthUser(user.id, user.username)
+        token_cache.set(token, identity, expires)
+    g.user = identity
+    if replicas.recently_wrote(identity.id):
+        db.session().use_primary()
     return True
 
 
-@app.route("/auth/login", methods=["POST"])
+def recipes_changed(userid):
+    """ drop anything derived from the recipes of userid after a write """
+    search.invalidate(userid)
+    response_cache.invalidate(userid)
+    replicas.wrote(userid)
+
+
+def cached(view):
+    """ serve successful responses of a GET view from response_cache, keyed
+    on the user and the query, and answer If-None-Match / If-Modified-Since
+    with 304 when the response did not change """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = "{}?{}".format(request.path, url_encode(request.args, sort=True))
+        generation = response_cache.generation(g.user.id)
+        hit = response_cache.get(g.user.id, key, generation)
+        if hit is None:
+            response, status = view(*args, **kwargs)
+            if status != 200:
+                return response, status
+            headers = [(name, value) for name, value in response.headers if name != "Content-Length"]
+            hit = (response.get_data(), headers)
+            response_cache.set(g.user.id, key, hit, generation)
+        data, headers = hit
+        response = current_app.response_class(data, headers=headers)
+        return response.make_conditional(request)
+    return wrapper
+
+
+def recipes_etag(ls):
+    """ a digest of the id and date_modified of every recipe and category in
+    ls, so any edit, addition or deletion changes it """
+    digest = hashlib.sha1()
+    for recipe in ls:
+        digest.update("{}:{};".format(recipe["id"], recipe["date_modified"]).encode("utf-8"))
+        for category in recipe.get("categories", ()):
+            digest.update("{}:{},".format(category["id"], category["date_modified"]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def tag_response(response, ls):
+    """ give response a weak ETag from recipes_etag """
+    response.set_etag(recipes_etag(ls), weak=True)
+    return response
+
+
+@api.route("/auth/login", methods=["POST"])
 def login():
     """ This function logs the user in.
     checks for supplied parameters against db
@@ -46,12 +123,15 @@ def login():
     new_user = db.session.query(User).filter_by(username=username).first()
     if not new_user or not new_user.validate_password(password):  # case of invalid credentials
         return jsonify({"message": "Invalid login credentials"}), 401
+    if new_user in db.session.dirty:
+        # the password hash was upgraded to the configured scheme or cost
+        db.session.commit()
     # create user and store in db
     token = new_user.generate_auth_token()
     return json.dumps({"token": token.decode("utf-8"), "id": new_user.id}), 200
 
 
-@app.route("/auth/register", methods=["POST"])
+@api.route("/auth/register", methods=["POST"])
 def register():
     """ This function registers a new user.
     checks credentials provided against existing ones
@@ -74,107 +154,231 @@ def register():
     return json.dumps({"token": token.decode('utf-8')}), 201
 
 
-@app.route("/recipes", methods=["POST"])
+@api.route("/recipes", methods=["POST"])
 @auth.login_required
 def create_recipe():
     """ This function creates a new recipe.
     make sure the user has a valid token before creating"""
     # we are logged in, we have access to g, where we have a field, g.userid
-    if not request.json or request.json.get("name") is None or request.json.get("name") == "":
-        return jsonify({
-            "message": "Please supply recipe name"
-            }), 400
-    recipe = db.session.query(Recipe).filter_by(created_by=g.user.id, name=request.json.get("name")).first()
-    if recipe:
-        return jsonify({
-            "message": "The Recipe name you are using has already been saved"}), 400
-    recipe = Recipe(name=request.json.get("name"), date_created=datetime.now(), created_by=g.user.id, date_modified=datetime.now())
-    db.session.add(recipe)
-    db.session.commit()
+    name = handlers.json_name(request.json)
+    refused = handlers.create_refused(name)
+    if refused:
+        return jsonify(refused[0]), refused[1]
+    if db.session.execute(handlers.name_taken(g.user.id, name)).first():
+        return jsonify(handlers.NAME_TAKEN), 400
+    try:
+        db.session.execute(handlers.insert_recipe(g.user.id, name, datetime.now()))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify(handlers.NAME_TAKEN), 400
+    recipes_changed(g.user.id)
     return jsonify({"message": "Recipe Saved"}), 201
 
 
-@app.route("/recipes", methods=["GET"])
+@api.route("/recipes/bulk", methods=["POST"])
+@auth.login_required
+def create_recipes_bulk():
+    """ Create many recipes in one request.
+    expects {"recipes": [{"name": ...}, ...]} and reports per recipe
+    whether it was created, a duplicate or invalid """
+    items = request.json.get("recipes") if isinstance(request.json, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"message": "Please supply a list of recipes"}), 400
+    if len(items) > bulk.MAX_ITEMS:
+        return jsonify({"message": "Send at most {} recipes at a time".format(bulk.MAX_ITEMS)}), 400
+    results = bulk.create_recipes(g.user.id, items)
+    created = len([result for result in results if result["status"] == "created"])
+    if created:
+        recipes_changed(g.user.id)
+    return jsonify({"created": created, "results": results}), 201 if created else 200
+
+
+@api.route("/recipes/import", methods=["POST"])
+@auth.login_required
+def import_recipe_file():
+    """ Import recipes from an NDJSON or CSV upload.
+    the file is either the request body or a multipart field called file,
+    the format comes from ?format= or else the content type or file name """
+    if "file" in request.files:
+        upload = request.files["file"]
+        stream, filename, mimetype = upload.stream, upload.filename, upload.mimetype
+    else:
+        stream, filename, mimetype = request.stream, None, request.mimetype
+    fmt = request.args.get("format") or importer.guess_format(filename, mimetype)
+    if fmt not in importer.PARSERS:
+        return jsonify({"message": "format must be ndjson or csv"}), 400
+    try:
+        chunk_size = int(request.args.get("chunk_size") or current_app.config["IMPORT_CHUNK_SIZE"])
+    except ValueError:
+        return jsonify({"message": "chunk_size must be a positive integer"}), 400
+    if chunk_size < 1:
+        return jsonify({"message": "chunk_size must be a positive integer"}), 400
+    summary = importer.import_recipes(
+        g.user.id, importer.PARSERS[fmt](importer.text_lines(stream)), chunk_size)
+    if summary["recipes"]:
+        recipes_changed(g.user.id)
+    return jsonify(summary), 200
+
+
+@api.route("/recipes", methods=["GET"])
 @auth.login_required
+@cached
 def list_created_recipe():
     """ Return the recipes belonging to the user.
     determine user from the supplied token """
-    search_name = False
-    search_limit = False
-    if request.args.get("q"):
-        search_name = True
-    if request.args.get("limit"):
-        search_limit = True
-    if search_name and search_limit:
-        recipe = db.session.query(Recipe).filter_by(created_by=g.user.id).filter(Recipe.name.like("%{}%".format(request.args.get("q")))).limit(request.args.get("limit")).all()
-    elif search_name:
-        recipe = db.session.query(Recipe).filter(Recipe.created_by == g.user.id, Recipe.name.like('%{}%'.format(request.args.get("q")))).all()
-    elif search_limit:
-        recipe = db.session.query(Recipe).filter_by(created_by=g.user.id).limit(request.args.get("limit")).all()
+    try:
+        limit, cursor, fields, counts, q = handlers.listing_args(request.args)
+    except (PaginationError, FieldsError) as e:
+        return jsonify({"message": str(e)}), 400
+    with_categories = handlers.wants_categories(fields)
+    truncated = False
+    if q:
+        ranked, truncated = handlers.search_page(search.search_recipes(g.user.id, q, handlers.search_limit(limit)),
+                                                 limit)
+        with serializing():
+            ls = handlers.in_rank_order(read_recipes(handlers.search_hits(ranked), with_categories, counts), ranked)
     else:
-        recipe = db.session.query(Recipe).filter_by(created_by=g.user.id).all()
-    ls = []
-    if not recipe:
-        if not search_name:
-            return jsonify(
-                {"message": "Need to supply name of category you are looking for"}
-                ), 400
-        else:
-            return jsonify(
-                {"message": "No category with that name belonging to user"}
-                ), 401
-    for category in recipe:
-        ls.append(category.returnthis())
-    return jsonify(ls), 200
+        with serializing():
+            ls = read_recipes(handlers.listing(g.user.id, limit, cursor), with_categories, counts)
+    refused = handlers.listing_refused(ls, cursor, q)
+    if refused:
+        return jsonify(refused[0]), refused[1]
+    ls, token = handlers.listing_page(ls, limit, q)
+    with serializing():
+        response = tag_response(jsonify(project(ls, fields)), ls)
+    if token:
+        response.headers["X-Next-Cursor"] = token
+    if truncated:
+        response.headers["X-Results-Truncated"] = "true"
+    return response, 200
+
+
+@api.route("/recipes/export", methods=["GET"])
+@auth.login_required
+def export_recipes():
+    """ Stream every recipe of the user with its categories as NDJSON. """
+    return Response(stream_with_context(export.ndjson(g.user.id)),
+                    mimetype="application/x-ndjson"), 200
+
+
+@api.route("/recipes/changes", methods=["GET"])
+@auth.login_required
+def recipe_changes():
+    """ What changed in the user's recipes since the watermark in since=. """
+    try:
+        since = changes.parse_watermark(request.args)
+    except changes.WatermarkError as e:
+        return jsonify({"message": str(e)}), 400
+    if since is not None and since < changes.horizon(datetime.now()):
+        return jsonify({"message": "Deletes that old are no longer kept, sync again without since"}), 410
+    feed = changes.changes(g.user.id, since)
+    with serializing():
+        return jsonify(feed), 200
+
+
+@api.route("/recipes/stats", methods=["GET"])
+@auth.login_required
+@cached
+def recipe_stats():
+    """ Counts of the user's recipes and categories, done and not. """
+    response = jsonify(Recipe.stats(g.user.id))
+    # not Last-Modified, deleting the newest recipe moves it back in time
+    response.add_etag()
+    return response, 200
 
 
-@app.route("/recipes/<catergoryid>", methods=["GET"])
+@api.route("/recipes/<catergoryid>", methods=["GET"])
 @auth.login_required
+@cached
 def get_recipe(catergoryid):
     """ Return the certain recipe for user. """
-    ls = []
-    recipe = db.session.query(Recipe).get(catergoryid)
-    if not recipe:
-        return jsonify({"message": "No category with that id"}), 400
-    if not recipe.created_by == g.user.id:
-        return jsonify({
-            "message": "That category does not belong to you "}), 403
-    ls.append(recipe.returnthis())
-    return jsonify(ls), 200
+    try:
+        fields, counts = handlers.recipe_args(request.args)
+    except FieldsError as e:
+        return jsonify({"message": str(e)}), 400
+    with serializing():
+        ls = read_recipes(handlers.one_recipe(catergoryid), handlers.wants_categories(fields), counts)
+    refused = handlers.one_recipe_refused(ls, g.user.id)
+    if refused:
+        return jsonify(refused[0]), refused[1]
+    with serializing():
+        response = tag_response(jsonify(project(ls, fields)), ls)
+    modified = handlers.last_modified(ls[0])
+    if modified is not None:
+        response.last_modified = modified
+    return response, 200
+
+
+def owned_recipe(id):
+    """ the id of recipe id, matching only while it belongs to the user, to
+    make a write conditional on ownership inside the write itself """
+    return db.select([Recipe.id]).where(handlers.owned(id, g.user.id))
+
 
+def recipe_owner(id):
+    """ created_by of recipe id or None, only used to explain a write that
+    matched no rows """
+    return db.session.execute(handlers.owner_of(id)).scalar()
 
-@app.route("/recipes/<id>", methods=["PUT"])
+
+@api.route("/recipes/<id>", methods=["PUT"])
 @auth.login_required
 def update_recipe(id):
     """ Update name or done status of a recipe """
-    if not request.json or request.json.get("name") is None or request.json.get("name") == "":
-        return jsonify({"message": "you need to supply new edits in json"}), 400
-    recipe = db.session.query(Recipe).filter_by(id=id).first()
-    if not recipe:
-        return jsonify({"message": "The category you request does not exist"}), 400
-    if not recipe.created_by == g.user.id:
-        return jsonify({"message": "You don't have permission to modify this category"}), 403
-    recipe.name = request.json.get("name")
-    recipe.date_modified = datetime.now()
-    db.session.commit()
+    name = handlers.json_name(request.json)
+    refused = handlers.update_refused(name)
+    if refused:
+        return jsonify(refused[0]), refused[1]
+    try:
+        updated = db.session.execute(handlers.rename_recipe(id, g.user.id, name, datetime.now())).rowcount
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify(handlers.NAME_TAKEN), 400
+    if not updated:
+        body, status = handlers.write_refused(recipe_owner(id), 403)
+        return jsonify(body), status
+    recipes_changed(g.user.id)
     return jsonify({"message": "successful update"}), 200
 
 
-@app.route("/recipes/<id>", methods=["DELETE"])
+@api.route("/recipes/<id>", methods=["DELETE"])
 @auth.login_required
 def delete_recipe(id):
-    recipe = db.session.query(Recipe).filter_by(id=id).first()
-    if not recipe:
-        return jsonify({"message": "The category you request does not exist"}), 400
-    if not recipe.created_by == g.user.id:
-        return jsonify(
-            {"message": "You don't have permission to modify this category"}), 400
-    db.session.delete(recipe)
+    for statement in handlers.delete_recipes(handlers.owned(id, g.user.id), datetime.now()):
+        deleted = db.session.execute(statement).rowcount
     db.session.commit()
+    if not deleted:
+        body, status = handlers.write_refused(recipe_owner(id), 400)
+        return jsonify(body), status
+    recipes_changed(g.user.id)
     return jsonify({"message": "Deleted recipe"}), 200
 
 
-@app.route("/recipes/<id>/categories", methods=["POST"])
+@api.route("/recipes", methods=["DELETE"])
+@auth.login_required
+def delete_recipes_bulk():
+    """ Delete the recipes listed in ids=1,2,3 and their categories with one
+    statement. ids that do not exist or belong to someone else are skipped """
+    try:
+        ids = [int(recipeid) for recipeid in request.args.get("ids", "").split(",") if recipeid.strip()]
+    except ValueError:
+        return jsonify({"message": "ids must be a comma separated list of recipe ids"}), 400
+    if not ids:
+        return jsonify({"message": "Please supply the ids of the recipes to delete"}), 400
+    if len(ids) > bulk.MAX_ITEMS:
+        return jsonify({"message": "Send at most {} recipes at a time".format(bulk.MAX_ITEMS)}), 400
+    mine = db.and_(Recipe.created_by == g.user.id, Recipe.id.in_(ids))
+    for statement in handlers.delete_recipes(mine, datetime.now()):
+        deleted = db.session.execute(statement).rowcount
+    db.session.commit()
+    if deleted:
+        recipes_changed(g.user.id)
+    return jsonify({"deleted": deleted}), 200
+
+
+@api.route("/recipes/<id>/categories", methods=["POST"])
 @auth.login_required
 def create_new_catergory(id):
     """ This function created a new category in the recipe."""
@@ -186,7 +390,7 @@ def create_new_catergory(id):
         return jsonify(
             {"message": "you need to supply name of new category as JSON"}
             ), 400
-    recipe = db.session.query(Categories).filter_by(name=catergory_name).first()
+    recipe = db.session.query(Categories.id).filter_by(recipeid=id, name=catergory_name).first()
     if recipe:
         return jsonify({"message": "User has already created that category"}), 400
     recipe = db.session.query(Recipe).filter_by(id=id).first()
@@ -199,11 +403,54 @@ def create_new_catergory(id):
         recipeid=id
         )
     db.session.add(new_catergory)
+    recipe.date_modified = datetime.now()
     db.session.commit()
+    recipes_changed(recipe.created_by)
     return jsonify({"message": "Successfuly created category"}), 200
 
 
-@app.route("/recipes/<id>/categories/<catergory_id>", methods=["PUT"])
+@api.route("/recipes/<id>/categories/bulk", methods=["POST"])
+@auth.login_required
+def create_catergories_bulk(id):
+    """ Create many categories in a recipe in one request.
+    expects {"categories": [{"name": ..., "done": false}, ...]} """
+    items = request.json.get("categories") if isinstance(request.json, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"message": "Please supply a list of categories"}), 400
+    if len(items) > bulk.MAX_ITEMS:
+        return jsonify({"message": "Send at most {} categories at a time".format(bulk.MAX_ITEMS)}), 400
+    recipe = db.session.query(Recipe).filter_by(id=id).first()
+    refused = handlers.recipe_refused(recipe.created_by if recipe else None, g.user.id)
+    if refused:
+        return jsonify(refused[0]), refused[1]
+    results = bulk.create_catergories(recipe, items)
+    created = len([result for result in results if result["status"] == "created"])
+    if created:
+        recipes_changed(recipe.created_by)
+    return jsonify({"created": created, "results": results}), 200
+
+
+@api.route("/recipes/<id>/categories", methods=["GET"])
+@auth.login_required
+def list_recipe_catergories(id):
+    """ Return the categories of a recipe a page at a time. """
+    try:
+        limit, cursor = page_args(request.args)
+    except PaginationError as e:
+        return jsonify({"message": str(e)}), 400
+    refused = handlers.recipe_refused(recipe_owner(id), g.user.id)
+    if refused:
+        return jsonify(refused[0]), refused[1]
+    rows = db.session.execute(handlers.catergory_listing(id, limit, cursor))
+    with serializing():
+        ls, token = handlers.catergory_page(rows, limit)
+        response = jsonify(ls)
+    if token:
+        response.headers["X-Next-Cursor"] = token
+    return response, 200
+
+
+@api.route("/recipes/<id>/categories/<catergory_id>", methods=["PUT"])
 @auth.login_required
 def update_recipe_list_catergory(id, catergory_id):
     """ Update name and done status of a recipe list category"""
@@ -214,56 +461,90 @@ def update_recipe_list_catergory(id, catergory_id):
     done = request.json.get("done")
     if catergory_name is None or catergory_name == "":
         return jsonify({"message": "you need to supply new name as JSON"}), 400
-    recipe = db.session.query(Recipe).filter_by(id=id).first()
-    if not recipe:
-        return jsonify({
-            "message": "The recipe does not exist, it was probably deleted"
-            }), 400
-    recipetlistcatergory = db.session.query(Categories).filter_by(id=catergory_id).first()
-    if not recipetlistcatergory:
-        return jsonify(
-            {"message": "Category does not exist, no category with that id"}
-            ), 400
-    if recipetlistcatergory.name == catergory_name:
+    now = datetime.now()
+    changes = {"name": catergory_name, "date_modified": now}
+    if done:
+        changes["done"] = done.lower() == "true"
+    updated = db.session.query(Categories).filter(
+        Categories.id == catergory_id, Categories.recipeid.in_(owned_recipe(id)),
+        Categories.name != catergory_name).update(changes, synchronize_session=False)
+    if updated:
+        db.session.query(Recipe).filter_by(id=id).update({"date_modified": now}, synchronize_session=False)
+    db.session.commit()
+    if not updated:
+        found = db.session.query(Recipe.created_by, Categories.name).outerjoin(
+            Categories, db.and_(Categories.recipeid == Recipe.id, Categories.id == catergory_id)).filter(
+            Recipe.id == id).first()
+        if found is None:
+            return jsonify({
+                "message": "The recipe does not exist, it was probably deleted"
+                }), 400
+        if found.created_by != g.user.id:
+            return jsonify({"message": "You don't have permission to modify this category"}), 403
+        if found.name is None:
+            return jsonify(
+                {"message": "Category does not exist, no category with that id"}
+                ), 400
         return jsonify(
             {"message": "No change to be recorded, set a new value for whatever you want to update"}
             ), 400
-    if done:
-        if done.lower() == "true":
-            recipetlistcatergory.done = True
-        else:
-            recipetlistcatergory.done = False
-    recipetlistcatergory.name = catergory_name
-    recipetlistcatergory.date_modified = datetime.now()
-    db.session.commit()
+    recipes_changed(g.user.id)
     return jsonify({"message": "Successfully updated category"}), 200
 
 
-@app.route("/recipes/<id>/categories/<catergory_id>", methods=["DELETE"])
+@api.route("/recipes/<id>/categories/<catergory_id>", methods=["DELETE"])
 @auth.login_required
 def delete_recipe_list_catergory(id, catergory_id):
-    recipe = db.session.query(Recipe).filter_by(id=id).first()
-    if not recipe:
-        return jsonify(
-            {"message": "Recipe does not exist, cannot delete"}
-            ), 400
-    if not recipe.created_by == g.user.id:
-        return jsonify({
-            "message": "You dont own the recipe, cannot delete"}), 401
-    recipecatergory = db.session.query(Categories).filter_by(id=catergory_id).first()
-    if not recipecatergory:
-        return jsonify({"message": "User does not have that category, cannot delete"}), 400
-    db.session.delete(recipecatergory)
+    now = datetime.now()
+    mine = db.and_(Categories.id == catergory_id, Categories.recipeid.in_(owned_recipe(id)))
+    db.session.execute(bury_catergories(mine, now))
+    deleted = db.session.query(Categories).filter(mine).delete(synchronize_session=False)
+    if deleted:
+        db.session.query(Recipe).filter_by(id=id).update({"date_modified": now}, synchronize_session=False)
     db.session.commit()
+    if not deleted:
+        owner = recipe_owner(id)
+        if owner is None:
+            return jsonify(
+                {"message": "Recipe does not exist, cannot delete"}
+                ), 400
+        if not owner == g.user.id:
+            return jsonify({
+                "message": "You dont own the recipe, cannot delete"}), 401
+        return jsonify({"message": "User does not have that category, cannot delete"}), 400
+    recipes_changed(g.user.id)
     return jsonify({"message": "Successfully deleted category"}), 200
 
 
-@app.errorhandler(500)
+@api.route("/health/db", methods=["GET"])
+def database_health():
+    """ Report the state of the connection pool of this worker. """
+    return jsonify(pool_stats(db.engine)), 200
+
+
+@api.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """ Metrics of every worker in the Prometheus text format. """
+    if not current_app.config["METRICS"]:
+        return jsonify({"message": "Invalid endpoint"}), 404
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type), 200
+
+
+@api.app_errorhandler(PasswordHashBusy)
+def handle_password_hash_busy(e):
+    db.session.rollback()
+    response = jsonify({"message": "Too many login attempts right now, try again shortly"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
+@api.app_errorhandler(500)
 def handle500(e):
     db.session.rollback()
     return jsonify({"messgae": "We are experiencing technical issues right now, please be patient"}), 500
 
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def handle404(e):
     return jsonify({"message": "Invalid endpoint"}), 404
@@ -1,4 +1,8 @@
-from recipe import app
+import os
+from recipe import create_app
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    # the development server, with DEBUG, unless RECIPE_CONFIG says otherwise
+    create_app(os.environ.get("RECIPE_CONFIG", "development")).run()
+else:
+    app = create_app()
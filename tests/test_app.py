@@ -0,0 +1,138 @@
+from datetime import datetime
+import os
+import subprocess
+import sys
+import time
+import unittest
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import Pool
+from recipe import create_app
+from recipe import migrations
+from recipe.models import db, Recipe, Categories
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_import_has_no_side_effects(self):
+        # a fresh interpreter importing the package must not need a database
+        code = "import recipe, recipe.models, recipe.views; print(hasattr(recipe, 'app'))"
+        env = dict(os.environ, DATABASE_URL="postgresql://nobody@127.0.0.1:1/none")
+        output = subprocess.check_output([sys.executable, "-c", code], env=env)
+        self.assertEqual(output.strip(), b"False")
+
+    def test_create_app_is_fast_and_does_no_database_io(self):
+        connects = []
+
+        def record(dbapi_connection, connection_record):
+            connects.append(dbapi_connection)
+        event.listen(Pool, "connect", record)
+        try:
+            start = time.time()
+            app = create_app("testing")
+            elapsed = time.time() - start
+        finally:
+            event.remove(Pool, "connect", record)
+        self.assertEqual(connects, [])
+        self.assertTrue(elapsed < 0.5, "create_app took {:.3f}s".format(elapsed))
+        self.assertTrue(app.config["TESTING"])
+
+
+class TestMigrations(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def revision(self):
+        with db.engine.connect() as connection:
+            return migrations.current_revision(connection)
+
+    def test_upgrade_creates_schema(self):
+        self.assertTrue(self.revision() is None)
+        migrations.upgrade()
+        self.assertEqual(self.revision(), migrations.head())
+        self.assertEqual(migrations.upgrade(), [])
+
+    def test_upgrade_database_without_revisions(self):
+        # a database created before revisions were tracked starts at 0
+        db.create_all()
+        with db.engine.begin() as connection:
+            migrations.schema_version.drop(connection)
+        self.assertEqual(self.revision(), 0)
+        applied = migrations.upgrade()
+        self.assertEqual(applied, [number for number, description, function in migrations.REVISIONS])
+        self.assertEqual(self.revision(), migrations.head())
+        indexes = [index["name"] for index in inspect(db.engine).get_indexes("Recipe")]
+        self.assertTrue("ix_Recipe_created_by_id" in indexes)
+
+    def test_upgrade_makes_recipe_names_unique_per_user(self):
+        # a revision 1 database still has the global unique on Recipe.name
+        db.create_all()
+        with db.engine.begin() as connection:
+            connection.execute(db.text('DROP TABLE "Recipe"'))
+            connection.execute(db.text(
+                'CREATE TABLE "Recipe" (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(20) NOT NULL UNIQUE, '
+                'date_created TIMESTAMP NOT NULL, date_modified TIMESTAMP, created_by INTEGER NOT NULL)'))
+            connection.execute(db.text(
+                'INSERT INTO "Recipe" (id, name, date_created, created_by) VALUES (1, \'soup\', :now, 1)'),
+                {"now": datetime.now()})
+            migrations.stamp(connection, 1)
+        self.assertEqual(migrations.upgrade()[0], 2)
+        db.session.add(Recipe(name="soup", date_created=datetime.now(), created_by=2, date_modified=None))
+        db.session.commit()
+        self.assertEqual(db.session.query(Recipe).filter_by(name="soup").count(), 2)
+        db.session.add(Recipe(name="soup", date_created=datetime.now(), created_by=1, date_modified=None))
+        self.assertRaises(IntegrityError, db.session.commit)
+        db.session.rollback()
+        indexes = [index["name"] for index in inspect(db.engine).get_indexes("Recipe")]
+        self.assertTrue("ix_Recipe_created_by_id" in indexes)
+
+    def test_upgrade_cascades_catergory_deletes(self):
+        # a revision 2 database has a plain foreign key on Categories
+        db.create_all()
+        with db.engine.begin() as connection:
+            connection.execute(db.text('DROP TABLE "Categories"'))
+            connection.execute(db.text(
+                'CREATE TABLE "Categories" (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(50) NOT NULL, '
+                'date_created TIMESTAMP NOT NULL, date_modified TIMESTAMP, done BOOLEAN NOT NULL, '
+                'recipeid INTEGER NOT NULL REFERENCES "Recipe" (id))'))
+            migrations.stamp(connection, 2)
+        db.session.add(Recipe(name="soup", date_created=datetime.now(), created_by=1, date_modified=None))
+        db.session.flush()
+        db.session.add(Categories(name="chop", date_created=datetime.now(), date_modified=None, recipeid=1))
+        db.session.commit()
+        self.assertEqual(migrations.upgrade()[0], 3)
+        db.session.query(Recipe).filter_by(id=1).delete()
+        db.session.commit()
+        self.assertEqual(db.session.query(Categories).count(), 0)
+
+    def test_upgrade_adds_tombstones(self):
+        # a revision 3 database has no Tombstone table and no date_modified index
+        db.create_all()
+        with db.engine.begin() as connection:
+            connection.execute(db.text('DROP TABLE "Tombstone"'))
+            connection.execute(db.text('DROP INDEX "ix_Recipe_created_by_date_modified"'))
+            migrations.stamp(connection, 3)
+        self.assertEqual(migrations.upgrade(), [4])
+        self.assertTrue("Tombstone" in inspect(db.engine).get_table_names())
+        indexes = [index["name"] for index in inspect(db.engine).get_indexes("Recipe")]
+        self.assertTrue("ix_Recipe_created_by_date_modified" in indexes)
+
+    def test_init_db_command(self):
+        result = CliRunner().invoke(self.app.cli, ["init-db"], obj=ScriptInfo(create_app=lambda info: self.app))
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(self.revision(), migrations.head())
+
+
+if __name__ == "__main__":
+    unittest.main()
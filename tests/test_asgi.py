@@ -0,0 +1,102 @@
+from datetime import datetime
+import unittest
+from flask import json
+from .test_base import BaseTestCase
+from recipe.models import db, User, Recipe, Categories, Tombstone
+
+try:
+    from recipe.asgi import Starlette
+except (SyntaxError, ImportError):
+    # async def and asynccontextmanager, Python 3.7 and later
+    Starlette = None
+
+try:
+    from starlette.testclient import TestClient
+except ImportError:
+    TestClient = None
+
+
+@unittest.skipIf(Starlette is None or TestClient is None, "needs the packages in requirements-asgi.txt")
+class TestAsgi(BaseTestCase):
+
+    def setUp(self):
+        super(TestAsgi, self).setUp()
+        from recipe.asgi import create_asgi_app
+        user = db.session.query(User).filter_by(username="admin").first()
+        self.userid = user.id
+        self.headers = {"Authorization": "Bearer {}".format(user.generate_auth_token().decode("utf-8"))}
+        now = datetime.now()
+        db.session.add(Recipe(name="soup", date_created=now, created_by=self.userid, date_modified=now))
+        db.session.add(Recipe(name="theirs", date_created=now, created_by=self.userid + 1, date_modified=now))
+        db.session.flush()
+        db.session.add(Categories(name="chop", date_created=now, date_modified=now, recipeid=1))
+        db.session.commit()
+        self.asgi = TestClient(create_asgi_app("testing"))
+        self.asgi.__enter__()
+
+    def tearDown(self):
+        self.asgi.__exit__(None, None, None)
+        super(TestAsgi, self).tearDown()
+
+    def test_reads_match_the_flask_app(self):
+        for url in ["/recipes", "/recipes?limit=1&fields=name,categories", "/recipes/1", "/recipes/1/categories",
+                    "/recipes?fields=id&include=counts", "/recipes/1?include=counts"]:
+            expected = self.client.get(url, headers=self.headers)
+            response = self.asgi.get(url, headers=self.headers)
+            self.assertEqual(response.status_code, expected.status_code, url)
+            self.assertEqual(response.json(), json.loads(expected.data), url)
+            self.assertEqual(response.headers.get("etag"), expected.headers.get("ETag"), url)
+        self.assertEqual(self.asgi.get("/recipes/2", headers=self.headers).status_code, 403)
+        self.assertEqual(self.asgi.get("/recipes/9", headers=self.headers).status_code, 400)
+        self.assertEqual(self.asgi.get("/recipes").status_code, 401)
+
+    def test_conditional_get(self):
+        response = self.asgi.get("/recipes/1", headers=self.headers)
+        headers = dict(self.headers, **{"If-None-Match": response.headers["etag"]})
+        response = self.asgi.get("/recipes/1", headers=headers)
+        self.assertEqual(response.status_code, 304)
+
+    def test_conditional_headers_match_the_flask_app(self):
+        modified = self.asgi.get("/recipes/1", headers=self.headers).headers["last-modified"]
+        cases = [{"If-None-Match": "*"}, {"If-None-Match": '"other", *'}, {"If-None-Match": '"other"'},
+                 {"If-Modified-Since": modified},
+                 {"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"},
+                 {"If-Modified-Since": "Thu, 01 Jan 1970 00:00:00 GMT"},
+                 {"If-Modified-Since": "not a date"}]
+        for conditions in cases:
+            headers = dict(self.headers, **conditions)
+            expected = self.client.get("/recipes/1", headers=headers).status_code
+            self.assertEqual(self.asgi.get("/recipes/1", headers=headers).status_code, expected, conditions)
+        self.assertEqual(self.asgi.get("/recipes/1", headers=dict(self.headers, **cases[0])).status_code, 304)
+
+    def test_writes(self):
+        response = self.asgi.post("/recipes", json={"name": "stew"}, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.asgi.post("/recipes", json={"name": "stew"}, headers=self.headers).status_code, 400)
+        self.assertEqual(self.asgi.put("/recipes/3", json={"name": "broth"}, headers=self.headers).status_code, 200)
+        self.assertEqual(self.asgi.put("/recipes/2", json={"name": "mine"}, headers=self.headers).status_code, 403)
+        self.assertEqual(self.asgi.delete("/recipes/1", headers=self.headers).status_code, 200)
+        self.assertEqual(db.session.query(Tombstone.recipeid).all(), [(1,)])
+        self.assertEqual(self.asgi.delete("/recipes/1", headers=self.headers).status_code, 400)
+        names = [recipe["name"] for recipe in self.asgi.get("/recipes", headers=self.headers).json()]
+        self.assertEqual(names, ["broth"])
+        db.session.expire_all()
+        self.assertEqual(db.session.query(Categories).count(), 0)
+
+    def test_other_routes_go_to_flask(self):
+        response = self.asgi.post("/auth/login", json={"username": "admin", "password": "admin"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("token", response.json())
+        response = self.asgi.post("/recipes/1/categories", json={"name": "boil"}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.asgi.get("/recipes/1", headers=self.headers).json()[0]["categories"]), 2)
+
+    def test_rate_limited(self):
+        from recipe.asgi import create_asgi_app
+        from .test_ratelimit import LimitedConfig
+        with TestClient(create_asgi_app(LimitedConfig)) as limited:
+            self.assertEqual(limited.get("/recipes/1", headers=self.headers).status_code, 200)
+            self.assertEqual(limited.get("/recipes", headers=self.headers).status_code, 200)
+            response = limited.get("/recipes", headers=self.headers)
+            self.assertEqual(response.status_code, 429)
+            self.assertTrue(int(response.headers["retry-after"]) >= 1)
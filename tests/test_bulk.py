@@ -0,0 +1,116 @@
+from datetime import datetime
+import unittest
+from flask import json
+from sqlalchemy import event
+from .test_base import BaseTestCase
+from recipe.models import db, User, Recipe, Categories
+
+
+class TestBulkCreate(BaseTestCase):
+
+    def setUp(self):
+        super(TestBulkCreate, self).setUp()
+        self.user = db.session.query(User).filter_by(username="admin").first()
+        self.headers = {"Authorization": "Bearer {}".format(self.user.generate_auth_token().decode("utf-8"))}
+
+    def post(self, url, payload):
+        return self.client.post(url, data=json.dumps(payload), headers=self.headers,
+                                content_type="application/json")
+
+    def test_bulk_create_recipes(self):
+        db.session.add(Recipe(name="soup", date_created=datetime.now(),
+                              created_by=self.user.id, date_modified=datetime.now()))
+        db.session.commit()
+        response = self.post("/recipes/bulk", {"recipes": [
+            {"name": "stew"}, {"name": "soup"}, {"name": ""}, {"name": "stew"},
+            {"name": "x" * 21}, {"name": "pie"}]})
+        self.assertEqual(response.status_code, 201)
+        body = json.loads(response.data)
+        self.assertEqual(body["created"], 2)
+        self.assertEqual([result["status"] for result in body["results"]],
+                         ["created", "duplicate", "invalid", "duplicate", "invalid", "created"])
+        names = set(name for name, in db.session.query(Recipe.name))
+        self.assertEqual(names, set(["soup", "stew", "pie"]))
+
+    def test_bulk_create_recipes_constant_round_trips(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.post("/recipes/bulk", {"recipes": [
+                {"name": "recipe{}".format(number)} for number in range(500)]})
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(db.session.query(Recipe).count(), 500)
+        self.assertEqual(len([s for s in statements if s.startswith("INSERT")]), 1)
+        self.assertTrue(len(statements) <= 4)
+
+    def test_bulk_create_recipes_bad_payload(self):
+        self.assertEqual(self.post("/recipes/bulk", {"recipes": "soup"}).status_code, 400)
+        self.assertEqual(self.post("/recipes/bulk", [{"name": "soup"}]).status_code, 400)
+
+    def test_bulk_create_catergories(self):
+        db.session.add(Recipe(name="soup", date_created=datetime.now(),
+                              created_by=self.user.id, date_modified=datetime.now()))
+        db.session.commit()
+        response = self.post("/recipes/1/categories/bulk", {"categories": [
+            {"name": "chop"}, {"name": "boil", "done": True}, {"name": "chop"},
+            {"name": "serve", "done": "maybe"}]})
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.data)
+        self.assertEqual([result["status"] for result in body["results"]],
+                         ["created", "created", "duplicate", "invalid"])
+        done = dict(db.session.query(Categories.name, Categories.done))
+        self.assertEqual(done, {"chop": False, "boil": True})
+
+    def test_bulk_create_catergories_not_owner(self):
+        db.session.add(Recipe(name="soup", date_created=datetime.now(),
+                              created_by=self.user.id + 1, date_modified=datetime.now()))
+        db.session.commit()
+        response = self.post("/recipes/1/categories/bulk", {"categories": [{"name": "chop"}]})
+        self.assertEqual(response.status_code, 403)
+        response = self.post("/recipes/2/categories/bulk", {"categories": [{"name": "chop"}]})
+        self.assertEqual(response.status_code, 400)
+
+    def before_insert(self, table, write):
+        """ run write on a connection of its own, as another request would,
+        just before the first INSERT into table """
+        fired = []
+
+        def race(conn, cursor, statement, parameters, context, executemany):
+            if not fired and statement.startswith('INSERT INTO "{}"'.format(table)):
+                fired.append(statement)
+                with db.engine.begin() as other:
+                    other.execute(write)
+        event.listen(db.engine, "before_cursor_execute", race)
+        self.addCleanup(event.remove, db.engine, "before_cursor_execute", race)
+
+    def test_bulk_create_recipes_name_taken_meanwhile(self):
+        now = datetime.now()
+        self.before_insert("Recipe", Recipe.__table__.insert().values(
+            name="stew", date_created=now, date_modified=now, created_by=self.user.id))
+        response = self.post("/recipes/bulk", {"recipes": [{"name": "soup"}, {"name": "stew"}]})
+        self.assertEqual(response.status_code, 201)
+        body = json.loads(response.data)
+        self.assertEqual([result["status"] for result in body["results"]], ["created", "duplicate"])
+        self.assertEqual(sorted(name for name, in db.session.query(Recipe.name)), ["soup", "stew"])
+
+    def test_bulk_create_catergories_recipe_deleted_meanwhile(self):
+        if db.engine.dialect.name == "sqlite" and not db.session.execute(db.text("PRAGMA foreign_keys")).scalar():
+            self.skipTest("needs foreign keys enforced")
+        db.session.add(Recipe(name="soup", date_created=datetime.now(),
+                              created_by=self.user.id, date_modified=datetime.now()))
+        db.session.commit()
+        self.before_insert("Categories", Recipe.__table__.delete())
+        response = self.post("/recipes/1/categories/bulk", {"categories": [{"name": "chop"}]})
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.data)
+        self.assertEqual((body["created"], body["results"][0]["status"]), (0, "invalid"))
+        self.assertEqual(db.session.query(Categories).count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+from flask import json
+from .test_base import BaseTestCase
+from recipe import changes
+from recipe.models import db, User, Recipe, Categories, Tombstone
+
+
+class TestChanges(BaseTestCase):
+
+    def setUp(self):
+        super(TestChanges, self).setUp()
+        self.app.config["CHANGES_OVERLAP"] = 0
+        self.user = db.session.query(User).filter_by(username="admin").first()
+        self.headers = {"Authorization": "Bearer {}".format(self.user.generate_auth_token().decode("utf-8"))}
+        now = datetime.now()
+        for name in ("soup", "stew", "salad"):
+            db.session.add(Recipe(name=name, date_created=now, created_by=self.user.id, date_modified=now))
+        db.session.add(Recipe(name="theirs", date_created=now, created_by=self.user.id + 1, date_modified=now))
+        db.session.flush()
+        for name in ("chop", "boil"):
+            db.session.add(Categories(name=name, date_created=now, date_modified=now, recipeid=1))
+        db.session.commit()
+
+    def sync(self, since=None):
+        url = "/recipes/changes" if since is None else "/recipes/changes?since={}".format(since)
+        response = self.client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data)
+
+    def send(self, method, url, body=None):
+        response = getattr(self.client, method)(
+            url, data=json.dumps(body) if body is not None else None, content_type="application/json",
+            headers=self.headers)
+        self.assertTrue(response.status_code in (200, 201), response.data)
+
+    def test_first_sync_sends_everything(self):
+        feed = self.sync()
+        self.assertEqual([recipe["name"] for recipe in feed["recipes"]["created"]], ["soup", "stew", "salad"])
+        self.assertEqual([category["name"] for category in feed["categories"]["created"]], ["chop", "boil"])
+        self.assertEqual(feed["categories"]["created"][0]["recipeid"], 1)
+        self.assertFalse("categories" in feed["recipes"]["created"][0])
+        self.assertEqual(feed["recipes"]["deleted"], [])
+
+    def test_only_changes_since_the_watermark(self):
+        watermark = self.sync()["watermark"]
+        self.send("put", "/recipes/2", {"name": "broth"})
+        self.send("post", "/recipes", {"name": "pie"})
+        self.send("put", "/recipes/1/categories/1", {"name": "dice"})
+        self.send("post", "/recipes/1/categories", {"name": "serve"})
+        self.send("delete", "/recipes/1/categories/2")
+        self.send("delete", "/recipes/3")
+        feed = self.sync(watermark)
+        self.assertEqual([recipe["name"] for recipe in feed["recipes"]["created"]], ["pie"])
+        self.assertEqual([recipe["name"] for recipe in feed["recipes"]["updated"]], ["soup", "broth"])
+        self.assertEqual(feed["recipes"]["deleted"], [3])
+        self.assertEqual([category["name"] for category in feed["categories"]["created"]], ["serve"])
+        self.assertEqual([category["name"] for category in feed["categories"]["updated"]], ["dice"])
+        self.assertEqual(feed["categories"]["deleted"], [2])
+        self.assertTrue(feed["watermark"] > watermark)
+        feed = self.sync(feed["watermark"])
+        self.assertEqual((feed["recipes"], feed["categories"]), (
+            {"created": [], "updated": [], "deleted": []}, {"created": [], "updated": [], "deleted": []}))
+
+    def test_bulk_delete_leaves_tombstones(self):
+        watermark = self.sync()["watermark"]
+        self.send("delete", "/recipes?ids=1,2,4")
+        feed = self.sync(watermark)
+        self.assertEqual(feed["recipes"]["deleted"], [1, 2])
+        # the categories went with their recipe and get no tombstones of their own
+        self.assertEqual(feed["categories"]["deleted"], [])
+        self.assertEqual(db.session.query(Tombstone).count(), 2)
+
+    def test_watermark_overlaps_writes_in_flight(self):
+        self.app.config["CHANGES_OVERLAP"] = 60
+        watermark = self.sync()["watermark"]
+        # rows written in the last minute come again, the client replaces them by id
+        self.assertEqual(len(self.sync(watermark)["recipes"]["created"]), 3)
+
+    def test_bad_or_expired_since(self):
+        response = self.client.get("/recipes/changes?since=yesterday", headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        old = changes.format_watermark(datetime.now() - timedelta(days=31))
+        response = self.client.get("/recipes/changes?since={}".format(old), headers=self.headers)
+        self.assertEqual(response.status_code, 410)
+
+    def test_prune(self):
+        now = datetime.now()
+        for days in (40, 1):
+            db.session.add(Tombstone(created_by=1, recipeid=9, date_deleted=now - timedelta(days=days)))
+        db.session.commit()
+        self.assertEqual(changes.prune(), 1)
+        self.assertEqual(db.session.query(Tombstone).count(), 1)
@@ -0,0 +1,52 @@
+from datetime import datetime
+import unittest
+from flask import json
+from .test_base import BaseTestCase
+from recipe.models import db, User, Recipe, Categories
+from recipe import export
+
+
+class TestExport(BaseTestCase):
+
+    def setUp(self):
+        super(TestExport, self).setUp()
+        self.user = db.session.query(User).filter_by(username="admin").first()
+        self.headers = {"Authorization": "Bearer {}".format(self.user.generate_auth_token().decode("utf-8"))}
+        for number in range(3):
+            recipe = Recipe(name="recipe{}".format(number), date_created=datetime.now(),
+                            created_by=self.user.id, date_modified=datetime.now())
+            db.session.add(recipe)
+            db.session.flush()
+            for step in range(number):
+                db.session.add(Categories(name="step{}{}".format(number, step), date_created=datetime.now(),
+                                          recipeid=recipe.id, date_modified=datetime.now()))
+        db.session.add(Recipe(name="other", date_created=datetime.now(),
+                              created_by=self.user.id + 1, date_modified=datetime.now()))
+        db.session.commit()
+
+    def test_export_streams_one_recipe_per_line(self):
+        response = self.client.get("/recipes/export", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.data.decode("utf-8").splitlines()
+        recipes = [json.loads(line) for line in lines]
+        self.assertEqual([recipe["name"] for recipe in recipes], ["recipe0", "recipe1", "recipe2"])
+        self.assertEqual([len(recipe["categories"]) for recipe in recipes], [0, 1, 2])
+
+    def test_export_matches_listing(self):
+        listing = json.loads(self.client.get("/recipes", headers=self.headers).data)
+        lines = self.client.get("/recipes/export", headers=self.headers).data.decode("utf-8").splitlines()
+        self.assertEqual([json.loads(line) for line in lines], listing)
+
+    def test_export_reads_in_batches(self):
+        # recipes spanning several fetch batches come out whole
+        export.BATCH_SIZE, batch = 2, export.BATCH_SIZE
+        try:
+            recipes = list(export.recipes(self.user.id))
+        finally:
+            export.BATCH_SIZE = batch
+        self.assertEqual([len(recipe["categories"]) for recipe in recipes], [0, 1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+from datetime import datetime
+import io
+import os
+import tempfile
+import unittest
+from click.testing import CliRunner
+from flask import json
+from flask.cli import ScriptInfo
+from .test_base import BaseTestCase
+from recipe.models import db, User, Recipe, Categories
+from recipe import importer
+
+
+NDJSON = "\n".join([
+    json.dumps({"name": "soup", "categories": [{"name": "chop"}, {"name": "boil", "done": True}]}),
+    json.dumps({"name": "stew"}),
+    "not json",
+    json.dumps({"name": "soup"}),
+    json.dumps({"name": "x" * 21}),
+    json.dumps({"name": "taken"}),
+    json.dumps({"name": "pie", "categories": [{"name": "bake", "done": "sometimes"}]}),
+    "",
+    json.dumps({"name": "tart", "categories": [{"name": "bake"}]}),
+]) + "\n"
+
+CSV = "name,category,done\nsoup,chop,false\nsoup,boil,true\nstew,,\npie,bake,true\n"
+
+
+class TestImport(BaseTestCase):
+
+    def setUp(self):
+        super(TestImport, self).setUp()
+        self.user = db.session.query(User).filter_by(username="admin").first()
+        self.userid = self.user.id
+        self.headers = {"Authorization": "Bearer {}".format(self.user.generate_auth_token().decode("utf-8"))}
+        db.session.add(Recipe(name="taken", date_created=datetime.now(),
+                              created_by=self.userid, date_modified=datetime.now()))
+        # names only have to be unique per user
+        db.session.add(Recipe(name="stew", date_created=datetime.now(),
+                              created_by=self.userid + 1, date_modified=datetime.now()))
+        db.session.commit()
+
+    def test_import_ndjson_in_chunks(self):
+        summary = importer.import_recipes(
+            self.userid, importer.parse_ndjson(importer.text_lines(io.BytesIO(NDJSON.encode("utf-8")))),
+            chunk_size=2)
+        self.assertEqual(summary["rows"], 8)
+        self.assertEqual(summary["recipes"], 3)
+        self.assertEqual(summary["categories"], 3)
+        self.assertEqual(summary["rejected"], 5)
+        self.assertEqual(sorted(rejection["line"] for rejection in summary["rejections"]), [3, 4, 5, 6, 7])
+        self.assertTrue(summary["rows_per_second"] > 0)
+        names = set(name for name, in db.session.query(Recipe.name).filter_by(created_by=self.userid))
+        self.assertEqual(names, set(["taken", "soup", "stew", "tart"]))
+        done = dict(db.session.query(Categories.name, Categories.done))
+        self.assertEqual(done, {"chop": False, "boil": True, "bake": False})
+
+    def test_import_csv_over_http(self):
+        response = self.client.post("/recipes/import?format=csv", data=CSV, headers=self.headers,
+                                    content_type="text/csv")
+        self.assertEqual(response.status_code, 200)
+        summary = json.loads(response.data)
+        self.assertEqual((summary["recipes"], summary["categories"], summary["rejected"]), (3, 3, 0))
+        soup = db.session.query(Recipe).filter_by(name="soup").first()
+        self.assertEqual(sorted(category.name for category in soup.categories), ["boil", "chop"])
+
+    def test_import_csv_keeps_non_ascii_names(self):
+        csv = u"name,category,done\ncaf\xe9 au lait,r\xf4tir,true\n".encode("utf-8")
+        summary = importer.import_recipes(self.userid, importer.parse_csv(importer.text_lines(io.BytesIO(csv))))
+        self.assertEqual((summary["recipes"], summary["categories"], summary["rejected"]), (1, 1, 0))
+        recipe = db.session.query(Recipe).filter_by(name=u"caf\xe9 au lait").first()
+        self.assertEqual([category.name for category in recipe.categories], [u"r\xf4tir"])
+
+    def test_import_upload_shows_in_listing(self):
+        response = self.client.post("/recipes/import", headers=self.headers, data={
+            "file": (io.BytesIO(NDJSON.encode("utf-8")), "recipes.ndjson")})
+        self.assertEqual(response.status_code, 200)
+        listing = json.loads(self.client.get("/recipes", headers=self.headers).data)
+        self.assertEqual([recipe["name"] for recipe in listing], ["taken", "soup", "stew", "tart"])
+
+    def test_import_command(self):
+        handle, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(handle, "w") as stream:
+            stream.write(CSV)
+        try:
+            result = CliRunner().invoke(self.app.cli, ["import-recipes", path, "--user", "admin"],
+                                        obj=ScriptInfo(create_app=lambda info: self.app))
+        finally:
+            os.remove(path)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(json.loads(result.output)["recipes"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+from datetime import datetime
+import json
+from .test_base import BaseTestCase
+from recipe.models import db, Recipe, Categories, Tombstone, CATERGORY_COLUMNS, RECIPE_COLUMNS
+from recipe.pagination import keyset
+
+
+class TestIndexes(BaseTestCase):
+    """ every query on a hot path must be answered from an index """
+
+    def plan(self, query):
+        statement = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={"literal_binds": True})
+        return [row[-1] for row in db.session.execute(db.text("EXPLAIN QUERY PLAN {}".format(statement)))]
+
+    def postgresql_plan(self, query):
+        """ (node types, index names) of the plan. with sequential scans
+        priced out, the planner only picks one when no index fits """
+        statement = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={"render_postcompile": True})
+        connection = db.session.connection()
+        connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) {}".format(statement), statement.params).scalar()
+        db.session.rollback()
+        if not isinstance(plan, list):
+            plan = json.loads(plan)
+        nodes, indexes, pending = [], [], [plan[0]["Plan"]]
+        while pending:
+            node = pending.pop()
+            nodes.append(node["Node Type"])
+            if "Index Name" in node:
+                indexes.append(node["Index Name"])
+            pending.extend(node.get("Plans", ()))
+        return nodes, indexes
+
+    def assertIndexed(self, query, *indexes):
+        """ the plan uses one of indexes, named as each database names them """
+        if db.engine.dialect.name == "postgresql":
+            nodes, used = self.postgresql_plan(query)
+            self.assertFalse("Seq Scan" in nodes, nodes)
+            self.assertTrue(set(indexes) & set(used), used)
+            return
+        if db.engine.dialect.name != "sqlite":
+            self.skipTest("query plans are checked on SQLite and PostgreSQL")
+        plan = self.plan(query)
+        self.assertFalse([step for step in plan if step.startswith("SCAN") and "USING" not in step], plan)
+        self.assertTrue([step for step in plan for index in indexes if index in step], plan)
+
+    def test_listing_a_page(self):
+        query = db.session.query(Recipe).filter_by(created_by=1)
+        self.assertIndexed(keyset(query, Recipe.id, 20, 40), "ix_Recipe_created_by_id")
+
+    def test_recipe_name_check(self):
+        self.assertIndexed(db.session.query(Recipe).filter_by(created_by=1, name="soup"),
+                           "sqlite_autoindex_Recipe", "uq_Recipe_created_by_name")
+        self.assertIndexed(db.session.query(Recipe.name).filter(
+            Recipe.created_by == 1, Recipe.name.in_(["soup", "stew"])),
+            "sqlite_autoindex_Recipe", "uq_Recipe_created_by_name")
+
+    def test_catergories_of_recipes(self):
+        recipeids = db.session.query(Recipe.id).filter_by(created_by=1).subquery()
+        query = db.session.query(Categories.recipeid, *CATERGORY_COLUMNS).filter(
+            Categories.recipeid.in_(db.select([recipeids.c.id]))).order_by(Categories.id)
+        self.assertIndexed(query, "ix_Categories_recipeid_id", "ix_Categories_recipeid_name")
+
+    def test_catergory_listing(self):
+        query = db.session.query(*CATERGORY_COLUMNS).filter(Categories.recipeid == 1)
+        self.assertIndexed(keyset(query, Categories.id, 20, 40), "ix_Categories_recipeid_id")
+
+    def test_catergory_name_check(self):
+        self.assertIndexed(db.session.query(Categories.id).filter_by(recipeid=1, name="chop"),
+                           "ix_Categories_recipeid_name")
+
+    def test_changes_since(self):
+        since = datetime(2018, 1, 1)
+        self.assertIndexed(db.session.query(*RECIPE_COLUMNS).filter(
+            Recipe.created_by == 1, Recipe.date_modified >= since), "ix_Recipe_created_by_date_modified")
+        self.assertIndexed(db.session.query(Tombstone.recipeid).filter(
+            Tombstone.created_by == 1, Tombstone.date_deleted >= since), "ix_Tombstone_created_by_date_deleted")
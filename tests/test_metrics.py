@@ -0,0 +1,92 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+from .test_base import BaseTestCase
+from recipe.config import TestingConfig
+from recipe.models import db, User
+from recipe.pool import InstrumentedQueuePool
+
+WORKER = """
+from recipe import create_app
+app = create_app("testing")
+with app.app_context():
+    app.test_client().get("/health/db")
+    print(app.test_client().get("/metrics").get_data(as_text=True))
+"""
+
+
+class QueuePoolConfig(TestingConfig):
+    SQLALCHEMY_ENGINE_OPTIONS = {"poolclass": QueuePool}
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestMetrics(BaseTestCase):
+
+    def setUp(self):
+        super(TestMetrics, self).setUp()
+        user = db.session.query(User).filter_by(username="admin").first()
+        self.headers = {"Authorization": "Bearer {}".format(user.generate_auth_token().decode("utf-8"))}
+
+    def test_requests_counted_by_route_and_status(self):
+        before = sample("recipe_http_requests_total", route="/recipes/<catergoryid>", method="GET", status="400")
+        timed = sample("recipe_http_request_duration_seconds_count", route="/recipes/<catergoryid>", method="GET")
+        self.client.get("/recipes/1", headers=self.headers)
+        self.client.get("/recipes/2", headers=self.headers)
+        self.assertEqual(sample("recipe_http_requests_total", route="/recipes/<catergoryid>", method="GET",
+                                status="400"), before + 2)
+        self.assertEqual(sample("recipe_http_request_duration_seconds_count", route="/recipes/<catergoryid>",
+                                method="GET"), timed + 2)
+
+    def test_auth_failures_counted(self):
+        missing = sample("recipe_auth_failures_total", reason="missing")
+        invalid = sample("recipe_auth_failures_total", reason="invalid")
+        self.client.get("/recipes")
+        self.client.get("/recipes", headers={"Authorization": "Bearer nonsense"})
+        self.assertEqual(sample("recipe_auth_failures_total", reason="missing"), missing + 1)
+        self.assertEqual(sample("recipe_auth_failures_total", reason="invalid"), invalid + 1)
+
+    def test_metrics_endpoint(self):
+        self.client.get("/health/db")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        body = response.get_data(as_text=True)
+        self.assertIn('recipe_http_requests_total{method="GET",route="/health/db",status="200"}', body)
+        self.assertIn("recipe_db_pool_checkouts_total", body)
+
+    def test_pool_checkouts_counted(self):
+        checkouts = sample("recipe_db_pool_checkouts_total")
+        timeouts = sample("recipe_db_pool_timeouts_total")
+        engine = create_engine("sqlite://", poolclass=InstrumentedQueuePool)
+        for _ in range(3):
+            engine.connect().close()
+        engine.dispose()
+        self.assertEqual(sample("recipe_db_pool_checkouts_total"), checkouts + 3)
+        self.assertEqual(sample("recipe_db_pool_timeouts_total"), timeouts)
+
+    def test_workers_add_up_in_multiprocess_mode(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for _ in range(2):
+            output = subprocess.check_output([sys.executable, "-c", WORKER], env=env, cwd=root)
+        self.assertIn(b'recipe_http_requests_total{method="GET",route="/health/db",status="200"} 2.0', output)
+
+
+class TestPoolGauges(BaseTestCase):
+    config = QueuePoolConfig
+
+    def test_read_at_scrape_time(self):
+        body = self.client.get("/metrics").get_data(as_text=True)
+        # setUp's connection is back in the pool, the scrape has not touched the database
+        self.assertIn('recipe_db_pool_checked_in{{pid="{}"}} 1.0'.format(os.getpid()), body)
+        self.assertIn('recipe_db_pool_checked_out{{pid="{}"}} 0.0'.format(os.getpid()), body)
@@ -0,0 +1,60 @@
+import time
+import unittest
+from flask import json
+from passlib.hash import sha256_crypt
+from .test_base import BaseTestCase
+from recipe import passwords
+from recipe.models import db, User
+
+
+class TestPasswordHashing(BaseTestCase):
+
+    def login(self):
+        return self.client.post("/auth/login", data=json.dumps(
+            {"username": "admin", "password": "admin"}), content_type="application/json")
+
+    def stored_hash(self):
+        db.session.remove()
+        return db.session.query(User).filter_by(username="admin").first().password
+
+    def test_hash_uses_configured_cost(self):
+        self.assertEqual(sha256_crypt.from_string(self.stored_hash()).rounds, 1000)
+
+    def test_login_rehashes_when_cost_changes(self):
+        self.app.config["PASSWORD_HASH_ROUNDS"] = 2000
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(sha256_crypt.from_string(self.stored_hash()).rounds, 2000)
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_login_rehashes_legacy_scheme(self):
+        self.app.config["PASSWORD_HASH_SCHEME"] = "pbkdf2_sha256"
+        self.assertEqual(self.login().status_code, 200)
+        self.assertTrue(self.stored_hash().startswith("$pbkdf2-sha256$1000$"))
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_wrong_password_does_not_rehash(self):
+        before = self.stored_hash()
+        self.app.config["PASSWORD_HASH_ROUNDS"] = 2000
+        response = self.client.post("/auth/login", data=json.dumps(
+            {"username": "admin", "password": "wrong"}), content_type="application/json")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.stored_hash(), before)
+
+    def test_hashing_on_process_pool(self):
+        self.app.config["PASSWORD_HASH_WORKERS"] = 1
+        hashed = passwords.hash_password("secret")
+        self.assertEqual(passwords.verify_and_update("secret", hashed), (True, None))
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_timed_out_hash_keeps_its_slot(self):
+        self.app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=0, PASSWORD_HASH_TIMEOUT=0.1)
+        pool = passwords.HashPool()
+        self.assertRaises(passwords.PasswordHashBusy, pool.run, time.sleep, 1)
+        # still sleeping in the pool, so there is no room for another job
+        self.assertRaises(passwords.PasswordHashBusy, pool.run, time.sleep, 0)
+        time.sleep(1.5)
+        self.assertEqual(pool.run(time.sleep, 0), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from flask import json
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import TimeoutError
+from .test_base import BaseTestCase
+from recipe import create_app
+from recipe.models import db
+from recipe.pool import InstrumentedQueuePool, pool_settings, pool_stats
+
+
+class TestPoolSettings(unittest.TestCase):
+
+    def test_defaults(self):
+        settings = pool_settings({})
+        self.assertEqual(settings["DB_POOL_SIZE"], 5)
+        self.assertTrue(settings["DB_POOL_PRE_PING"])
+
+    def test_from_environment(self):
+        settings = pool_settings({"DB_POOL_SIZE": "20", "DB_MAX_OVERFLOW": "0",
+                                  "DB_POOL_TIMEOUT": "2.5", "DB_POOL_PRE_PING": "false"})
+        self.assertEqual(settings["DB_POOL_SIZE"], 20)
+        self.assertEqual(settings["DB_MAX_OVERFLOW"], 0)
+        self.assertEqual(settings["DB_POOL_TIMEOUT"], 2.5)
+        self.assertFalse(settings["DB_POOL_PRE_PING"])
+
+    def test_server_databases_get_instrumented_pool(self):
+        app = create_app("testing")
+        url, options = db.apply_driver_hacks(app, make_url("postgresql://localhost/recipes"), {})
+        self.assertEqual(options["poolclass"], InstrumentedQueuePool)
+        self.assertEqual(options["pool_size"], app.config["DB_POOL_SIZE"])
+        self.assertEqual(options["pool_recycle"], app.config["DB_POOL_RECYCLE"])
+        self.assertTrue(options["pool_pre_ping"])
+
+
+class TestInstrumentedQueuePool(unittest.TestCase):
+
+    def test_records_waits_and_timeouts(self):
+        engine = create_engine(
+            "sqlite://", poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0,
+            pool_timeout=0.05, connect_args={"check_same_thread": False})
+        connection = engine.connect()
+        self.assertEqual(pool_stats(engine)["checked_out"], 1)
+        self.assertRaises(TimeoutError, engine.connect)
+        stats = pool_stats(engine)
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertTrue(stats["wait_max_ms"] >= 40)
+        connection.close()
+        self.assertEqual(pool_stats(engine)["checked_out"], 0)
+
+
+class TestDatabaseHealth(BaseTestCase):
+
+    def test_health_endpoint(self):
+        response = self.client.get("/health/db")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue("pool" in json.loads(response.data))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+from datetime import datetime
+import logging
+import os
+import shutil
+import tempfile
+from flask import json
+from .test_base import BaseTestCase
+from recipe import create_app, profiling
+from recipe.models import db, User, Recipe, Categories
+
+
+class Recorder(logging.Handler):
+    """ keeps the messages logged to it, unittest's assertLogs is 3.4+ """
+
+    def __init__(self):
+        logging.Handler.__init__(self, logging.INFO)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestProfiling(BaseTestCase):
+
+    def setUp(self):
+        super(TestProfiling, self).setUp()
+        self.profile_dir = tempfile.mkdtemp()
+        self.app.config.update(PROFILING=True, PROFILE_DIR=self.profile_dir, PROFILE_SLOW_MS=0)
+        profiling.init_app(self.app)
+        user = db.session.query(User).filter_by(username="admin").first()
+        self.headers = {"Authorization": "Bearer {}".format(user.generate_auth_token().decode("utf-8"))}
+        now = datetime.now()
+        recipe = Recipe(name="soup", date_created=now, created_by=user.id, date_modified=now)
+        db.session.add(recipe)
+        db.session.commit()
+        db.session.add(Categories(name="chop", date_created=now, date_modified=now, recipeid=recipe.id))
+        db.session.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.profile_dir)
+        super(TestProfiling, self).tearDown()
+
+    def test_server_timing_header(self):
+        response = self.client.get("/recipes", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        timing = response.headers["Server-Timing"]
+        self.assertIn('desc="3 queries"', timing)
+        self.assertIn("serialize;dur=", timing)
+        self.assertIn("total;dur=", timing)
+
+    def test_log_line_and_profile_dump(self):
+        recorder = Recorder()
+        level = profiling.logger.level
+        profiling.logger.addHandler(recorder)
+        profiling.logger.setLevel(logging.INFO)
+        try:
+            self.client.get("/recipes/1", headers=self.headers)
+        finally:
+            profiling.logger.removeHandler(recorder)
+            profiling.logger.setLevel(level)
+        line = json.loads(recorder.messages[0])
+        self.assertEqual(line["endpoint"], "api.get_recipe")
+        self.assertEqual(line["status"], 200)
+        self.assertEqual(line["queries"], 3)
+        self.assertTrue(line["sql_ms"] <= line["total_ms"])
+        self.assertTrue(os.path.exists(line["profile"]))
+
+    def test_off_by_default(self):
+        app = create_app("testing")
+        response = app.test_client().get("/recipes", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Server-Timing", response.headers)
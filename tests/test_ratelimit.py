@@ -0,0 +1,138 @@
+import unittest
+from flask import json
+from sqlalchemy import event
+from .test_base import BaseTestCase
+from .test_metrics import sample
+from recipe.config import TestingConfig
+from recipe.models import db, User
+from recipe.ratelimit import MemoryBackend, RateLimitError, limiter, parse_rule
+
+
+class LimitedConfig(TestingConfig):
+    RATELIMIT = True
+    RATELIMITS = {
+        "api.login": ["ip 3/minute", "username 2/minute"],
+        "default": ["user 2/minute"],
+    }
+
+
+class SharedConfig(LimitedConfig):
+    RATELIMIT_BACKEND = "tests.test_ratelimit:shared_backend"
+
+
+""" stands in for redis: outlives the apps built on it, like a server
+shared by every worker """
+shared = MemoryBackend()
+
+
+def shared_backend(app):
+    return shared
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_bucket_empties_and_refills(self):
+        now = [1000.0]
+        backend = MemoryBackend(clock=lambda: now[0])
+        self.assertEqual([backend.take("a", 1.0, 2) for _ in range(2)], [0, 0])
+        self.assertAlmostEqual(backend.take("a", 1.0, 2), 1.0)
+        self.assertEqual(backend.take("b", 1.0, 2), 0)
+        now[0] += 1.5
+        self.assertEqual(backend.take("a", 1.0, 2), 0)
+        self.assertAlmostEqual(backend.take("a", 1.0, 2), 0.5)
+
+    def test_least_recently_used_bucket_is_dropped(self):
+        backend = MemoryBackend(maxsize=2, clock=lambda: 0.0)
+        backend.take("a", 1.0, 1)
+        backend.take("b", 1.0, 1)
+        backend.take("c", 1.0, 1)
+        self.assertEqual(backend.take("a", 1.0, 1), 0)
+        self.assertEqual(backend.take("c", 1.0, 1), 1.0)
+
+    def test_parse_rule(self):
+        self.assertEqual(parse_rule("ip 10/minute"), ("ip", 10, 60))
+        self.assertEqual(parse_rule("user 5/seconds"), ("user", 5, 1))
+        for text in ("ip 10", "host 1/minute", "ip 0/minute", "ip ten/minute", "ip 1/week"):
+            self.assertRaises(RateLimitError, parse_rule, text)
+
+
+class TestRateLimit(BaseTestCase):
+    config = LimitedConfig
+
+    def login(self, username="admin", password="admin", **environ):
+        environ.setdefault("REMOTE_ADDR", "127.0.0.1")
+        return self.client.post("/auth/login", data=json.dumps({"username": username, "password": password}),
+                                content_type="application/json", environ_base=environ)
+
+    def token(self, username):
+        user = db.session.query(User).filter_by(username=username).first()
+        return {"Authorization": "Bearer {}".format(user.generate_auth_token().decode("utf-8"))}
+
+    def test_login_limited_per_ip_before_any_query(self):
+        for username in ("a", "b", "c"):
+            self.assertEqual(self.login(username).status_code, 401)
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.login()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(statements, [])
+        self.assertTrue(1 <= int(response.headers["Retry-After"]) <= 20)
+        self.assertIn("Too many requests", json.loads(response.data)["message"])
+        self.assertEqual(self.login(REMOTE_ADDR="10.0.0.2").status_code, 200)
+
+    def test_login_limited_per_username(self):
+        self.login(password="wrong", REMOTE_ADDR="10.0.0.1")
+        self.login(password="wrong", REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(self.login(REMOTE_ADDR="10.0.0.3").status_code, 429)
+        self.assertEqual(self.login("other", REMOTE_ADDR="10.0.0.3").status_code, 401)
+
+    def test_default_rules_per_user(self):
+        db.session.add(User("other", "other"))
+        db.session.commit()
+        admin, other = self.token("admin"), self.token("other")
+        refused = sample("recipe_rate_limited_total", route="/recipes", reason="user")
+        self.assertNotEqual(self.client.get("/recipes/1", headers=admin).status_code, 429)
+        self.assertNotEqual(self.client.get("/recipes/1/categories", headers=admin).status_code, 429)
+        response = self.client.get("/recipes", headers=admin)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response.headers["Retry-After"]) >= 1)
+        self.assertNotEqual(self.client.get("/recipes/1", headers=other).status_code, 429)
+        self.assertEqual(sample("recipe_rate_limited_total", route="/recipes", reason="user"), refused + 1)
+
+    def test_shed_when_worker_is_full(self):
+        limiter.configure(self.app.config["RATELIMITS"], MemoryBackend(), 1)
+        self.assertTrue(limiter.enter())
+        try:
+            response = self.login()
+        finally:
+            limiter.leave()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "1")
+        self.assertEqual(self.login().status_code, 200)
+
+
+class TestSharedBackend(BaseTestCase):
+    config = SharedConfig
+
+    def setUp(self):
+        shared.clear()
+        super(TestSharedBackend, self).setUp()
+
+    def test_buckets_outlive_the_worker(self):
+        for username in ("a", "b", "c"):
+            self.client.post("/auth/login", data=json.dumps({"username": username, "password": "x"}),
+                             content_type="application/json")
+        # another worker built on the same backend sees the empty bucket
+        from recipe import create_app
+        worker = create_app(SharedConfig)
+        with worker.app_context():
+            response = worker.test_client().post(
+                "/auth/login", data=json.dumps({"username": "admin", "password": "admin"}),
+                content_type="application/json")
+        self.assertEqual(response.status_code, 429)
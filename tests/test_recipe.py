@@ -1,8 +1,10 @@
 from datetime import datetime
 import unittest
 from flask import json
+from sqlalchemy import event
 from .test_base import BaseTestCase
 from recipe.models import db, User, Recipe, Categories
+from recipe.views import response_cache
 
 
 class TestRecipe(BaseTestCase):
@@ -94,6 +96,226 @@ class TestRecipe(BaseTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue(type(json.loads(response.data) == "json"))
 
+    def count_list_queries(self):
+        """ count the statements sent to the database while listing recipes """
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.client.get("/recipes", headers={
+                "Authorization": "Bearer {}".format(self.token)})
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(response.status_code, 200)
+        return len(statements), json.loads(response.data)
+
+    def test_get_recipes_no_query_per_recipe(self):
+        # listing must not issue one categories query per recipe
+        self.login_user()
+        self.create_recipe()
+        self.create_recipe_catergory()
+        userid = self.user.id
+        single, recipes = self.count_list_queries()
+        self.assertEqual(len(recipes), 1)
+        for number in range(2, 12):
+            recipe = Recipe(
+                name="recipe{}".format(number),
+                date_created=datetime.now(),
+                created_by=userid,
+                date_modified=datetime.now())
+            db.session.add(recipe)
+            db.session.flush()
+            db.session.add(Categories(
+                name="step{}".format(number),
+                date_created=datetime.now(),
+                recipeid=recipe.id,
+                date_modified=datetime.now()))
+        db.session.commit()
+        response_cache.invalidate(userid)  # the recipes were added behind the API's back
+        many, recipes = self.count_list_queries()
+        self.assertEqual(len(recipes), 11)
+        self.assertTrue(all(len(recipe["categories"]) == 1 for recipe in recipes))
+        # at most one query for the user, one for the recipes and one for the categories
+        self.assertTrue(many <= single)
+        self.assertTrue(many <= 3)
+
+    def test_get_recipes_paginated(self):
+        # walk through the recipes two at a time using the returned cursor
+        self.login_user()
+        for number in range(5):
+            db.session.add(Recipe(
+                name="recipe{}".format(number),
+                date_created=datetime.now(),
+                created_by=self.user.id,
+                date_modified=datetime.now()))
+        db.session.commit()
+        names = []
+        url = "/recipes?limit=2"
+        pages = 0
+        while url:
+            response = self.client.get(url, headers={
+                "Authorization": "Bearer {}".format(self.token)})
+            self.assertEqual(response.status_code, 200)
+            page = json.loads(response.data)
+            self.assertTrue(len(page) <= 2)
+            names.extend(recipe["name"] for recipe in page)
+            pages += 1
+            cursor = response.headers.get("X-Next-Cursor")
+            url = "/recipes?limit=2&cursor={}".format(cursor) if cursor else None
+        self.assertEqual(pages, 3)
+        self.assertEqual(names, ["recipe{}".format(number) for number in range(5)])
+
+    def test_get_recipes_invalid_cursor(self):
+        self.login_user()
+        self.create_recipe()
+        response = self.client.get("/recipes?limit=2&cursor=notacursor", headers={
+            "Authorization": "Bearer {}".format(self.token)})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/recipes?limit=-1", headers={
+            "Authorization": "Bearer {}".format(self.token)})
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_recipes_selected_fields(self):
+        # fields= trims each recipe, and leaving out categories skips that query
+        self.login_user()
+        self.create_recipe()
+        self.create_recipe_catergory()
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.client.get("/recipes?fields=id,name", headers={
+                "Authorization": "Bearer {}".format(self.token)})
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), [{"id": 1, "name": "testrecipe"}])
+        self.assertFalse([statement for statement in statements if "Categories" in statement])
+        response = self.client.get("/recipes/1?fields=name,categories", headers={
+            "Authorization": "Bearer {}".format(self.token)})
+        self.assertEqual(response.status_code, 200)
+        recipe, = json.loads(response.data)
+        self.assertEqual(sorted(recipe), ["categories", "name"])
+        self.assertEqual(recipe["categories"][0]["name"], "cook something")
+
+    def test_get_recipes_unknown_field(self):
+        self.login_user()
+        self.create_recipe()
+        response = self.client.get("/recipes?fields=name,password", headers={
+            "Authorization": "Bearer {}".format(self.token)})
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_recipes_with_counts(self):
+        # include=counts without categories counts them in one grouped query
+        self.login_user()
+        self.create_recipe()
+        self.create_recipe_catergory()
+        db.session.add(Categories(name="eat", date_created=datetime.now(), date_modified=datetime.now(),
+                                  recipeid=1, done=True))
+        db.session.add(Recipe(name="empty", date_created=datetime.now(), created_by=self.user.id,
+                              date_modified=datetime.now()))
+        db.session.commit()
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.client.get("/recipes?fields=id&include=counts", headers={
+                "Authorization": "Bearer {}".format(self.token)})
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), [{"id": 1, "category_count": 2, "done_count": 1},
+                                                     {"id": 2, "category_count": 0, "done_count": 0}])
+        statements = [statement for statement in statements if "Recipe" in statement or "Categories" in statement]
+        self.assertEqual(len(statements), 2)
+        self.assertIn("GROUP BY", statements[1])
+        self.assertNotIn("Categories.name", statements[1].replace('"', ""))
+        response = self.client.get("/recipes/1?include=counts", headers={
+            "Authorization": "Bearer {}".format(self.token)})
+        recipe, = json.loads(response.data)
+        self.assertEqual((recipe["category_count"], recipe["done_count"], len(recipe["categories"])), (2, 1, 2))
+        response = self.client.get("/recipes?include=everything", headers={
+            "Authorization": "Bearer {}".format(self.token)})
+        self.assertEqual(response.status_code, 400)
+
+    def test_recipe_stats(self):
+        self.login_user()
+        self.create_recipe()
+        self.create_recipe_catergory()
+        now = datetime.now()
+        db.session.add(Categories(name="eat", date_created=now, date_modified=now, recipeid=1, done=True))
+        db.session.add(Recipe(name="empty", date_created=now, created_by=self.user.id, date_modified=now))
+        db.session.add(Recipe(name="served", date_created=now, created_by=self.user.id, date_modified=now))
+        db.session.add(Recipe(name="theirs", date_created=now, created_by=self.user.id + 1, date_modified=now))
+        db.session.flush()
+        db.session.add(Categories(name="plate", date_created=now, date_modified=now, recipeid=3, done=True))
+        db.session.add(Categories(name="other", date_created=now, date_modified=now, recipeid=4, done=True))
+        db.session.commit()
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.client.get("/recipes/stats", headers={
+                "Authorization": "Bearer {}".format(self.token)})
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(response.status_code, 200)
+        stats = json.loads(response.data)
+        del stats["last_modified"]
+        self.assertEqual(stats, {"recipes": 3, "categories": 3, "categories_done": 2,
+                                 "recipes_without_categories": 1, "recipes_done": 1})
+        self.assertEqual(len([statement for statement in statements if "Recipe" in statement]), 1)
+        # the owner of "theirs"
+        self.create_user()
+        response = self.client.get("/recipes/stats", headers={
+            "Authorization": "Bearer {}".format(self.token)})
+        stats = json.loads(response.data)
+        self.assertEqual((stats["recipes"], stats["categories_done"], stats["recipes_done"]), (1, 1, 1))
+        db.session.add(User(username="nobody", password="nobody"))
+        db.session.commit()
+        nobody = db.session.query(User).filter_by(username="nobody").first()
+        response = self.client.get("/recipes/stats", headers={
+            "Authorization": "Bearer {}".format(nobody.generate_auth_token().decode("utf-8"))})
+        self.assertEqual(json.loads(response.data), {
+            "recipes": 0, "categories": 0, "categories_done": 0, "recipes_without_categories": 0,
+            "recipes_done": 0, "last_modified": None})
+
+    def test_list_recipe_catergories_paginated(self):
+        self.login_user()
+        self.create_recipe()
+        for number in range(3):
+            db.session.add(Categories(
+                name="step{}".format(number),
+                date_created=datetime.now(),
+                recipeid=1,
+                date_modified=datetime.now()))
+        db.session.commit()
+        response = self.client.get("/recipes/1/categories?limit=2", headers={
+            "Authorization": "Bearer {}".format(self.token)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.data)), 2)
+        cursor = response.headers.get("X-Next-Cursor")
+        response = self.client.get("/recipes/1/categories?limit=2&cursor={}".format(cursor), headers={
+            "Authorization": "Bearer {}".format(self.token)})
+        self.assertEqual([category["name"] for category in json.loads(response.data)], ["step2"])
+        self.assertTrue(response.headers.get("X-Next-Cursor") is None)
+
+    def test_list_recipe_catergories_unauthorized(self):
+        self.login_user()
+        self.create_recipe()
+        self.create_user()
+        response = self.client.get("/recipes/1/categories", headers={
+            "Authorization": "Bearer {}".format(self.token)})
+        self.assertEqual(response.status_code, 403)
+
     def test_get_recipes_with_id(self):
         self.login_user()
         self.create_recipe()
@@ -178,6 +400,30 @@ class TestRecipe(BaseTestCase):
         r = db.session.query(Recipe).filter_by(name="testrecipe").first()
         self.assertTrue(r is None)
 
+    def test_delete_recipes_bulk(self):
+        self.login_user()
+        userid = self.user.id
+        for number in range(3):
+            recipe = Recipe(name="recipe{}".format(number), date_created=datetime.now(),
+                            created_by=userid, date_modified=datetime.now())
+            db.session.add(recipe)
+            db.session.flush()
+            for step in range(50):
+                db.session.add(Categories(name="step{}".format(step), date_created=datetime.now(),
+                                          recipeid=recipe.id, date_modified=datetime.now()))
+        db.session.add(Recipe(name="theirs", date_created=datetime.now(),
+                              created_by=userid + 1, date_modified=datetime.now()))
+        db.session.commit()
+        response = self.client.delete("/recipes?ids=1,2,4,99", headers={
+            "Authorization": "Bearer {}".format(self.token)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data), {"deleted": 2})
+        self.assertEqual([recipe.id for recipe in db.session.query(Recipe).order_by(Recipe.id)], [3, 4])
+        self.assertEqual(set(recipeid for recipeid, in db.session.query(Categories.recipeid)), set([3]))
+        response = self.client.delete("/recipes?ids=1,x", headers={
+            "Authorization": "Bearer {}".format(self.token)})
+        self.assertEqual(response.status_code, 400)
+
     def test_delete_recipe_invalid_id(self):
         self.login_user()
         """there is no recipe in the system"""
@@ -215,6 +461,22 @@ class TestRecipe(BaseTestCase):
             Recipe).filter_by(name="testrecipe").first()
         self.assertTrue(recipe.categories[0].name == "do this")
 
+    def test_catergory_names_unique_per_recipe(self):
+        self.login_user()
+        self.create_recipe()
+        db.session.add(Recipe(name="other", date_created=datetime.now(),
+                              created_by=self.user.id, date_modified=datetime.now()))
+        db.session.commit()
+        statuses = []
+        for recipeid in (1, 2, 1):
+            response = self.client.post(
+                "/recipes/{}/categories".format(recipeid),
+                data=json.dumps({"name": "do this"}),
+                headers={"Authorization": "Bearer {}".format(self.token)},
+                content_type="application/json")
+            statuses.append(response.status_code)
+        self.assertEqual(statuses, [200, 200, 400])
+
     def test_create_recipe_catergory_no_name(self):
         self.login_user()
         self.create_recipe()
@@ -262,6 +524,65 @@ class TestRecipe(BaseTestCase):
         category = db.session.query(Categories).get(1)
         self.assertTrue(category is None)
 
+    def count_statements(self, method, url, **kwargs):
+        """ statements sent while handling one request, token already cached """
+        headers = {"Authorization": "Bearer {}".format(self.token)}
+        self.client.get("/recipes/0", headers=headers)
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = getattr(self.client, method)(url, headers=headers, **kwargs)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        return response, statements
+
+    def test_writes_are_single_statements(self):
+        self.login_user()
+        self.create_recipe()
+        self.create_recipe_catergory()
+        response, statements = self.count_statements(
+            "put", "/recipes/1", data=json.dumps({"name": "renamed"}), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([statement.split()[0] for statement in statements], ["UPDATE"])
+        response, statements = self.count_statements(
+            "put", "/recipes/1/categories/1", data=json.dumps({"name": "stir", "done": "true"}),
+            content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([statement.split()[0] for statement in statements], ["UPDATE", "UPDATE"])
+        self.assertTrue(db.session.query(Categories).get(1).done)
+        response, statements = self.count_statements("delete", "/recipes/1")
+        self.assertEqual(response.status_code, 200)
+        # a tombstone for the changes feed, the categories go with ON DELETE CASCADE
+        self.assertEqual([statement.split()[0] for statement in statements], ["INSERT", "DELETE"])
+        self.assertEqual(db.session.query(Categories).count(), 0)
+
+    def test_catergory_writes_check_the_owner(self):
+        self.login_user()
+        self.create_recipe()
+        self.create_recipe_catergory()
+        self.create_user()
+        response = self.client.put(
+            "/recipes/1/categories/1", data=json.dumps({"name": "stolen"}), content_type="application/json",
+            headers={"Authorization": "Bearer {}".format(self.token)})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.delete(
+            "/recipes/1/categories/1", headers={"Authorization": "Bearer {}".format(self.token)})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(db.session.query(Categories).get(1).name, "cook something")
+
+    def test_update_catergory_without_change(self):
+        self.login_user()
+        self.create_recipe()
+        self.create_recipe_catergory()
+        response = self.client.put(
+            "/recipes/1/categories/1", data=json.dumps({"name": "cook something"}),
+            content_type="application/json", headers={"Authorization": "Bearer {}".format(self.token)})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b"No change", response.data)
+
     def test_delete_recipe_catergory_invalid_id(self):
         self.login_user()
         self.create_recipe()
@@ -0,0 +1,106 @@
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from flask import json
+from recipe import create_app
+from recipe.config import TestingConfig
+from recipe.models import db, User, Recipe
+from recipe import replicas
+from recipe.views import response_cache
+
+try:
+    from recipe.asgi import Starlette
+except (SyntaxError, ImportError):
+    # async def and asynccontextmanager, Python 3.7 and later
+    Starlette = None
+
+try:
+    from starlette.testclient import TestClient
+except ImportError:
+    TestClient = None
+
+
+class TestReplicas(unittest.TestCase):
+    """ a primary and two replicas as SQLite files, each holding a recipe 1
+    named after the database so a response shows where it was read """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        uris = ["sqlite:///{}".format(os.path.join(self.directory, name))
+                for name in ("primary.db", "replica0.db", "replica1.db")]
+
+        class ReplicatedConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = uris[0]
+            SQLALCHEMY_REPLICA_URIS = uris[1:]
+        self.config = ReplicatedConfig
+        self.app = create_app(ReplicatedConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        replicas.recent_writers.clear()
+        now = datetime.now()
+        for bind, name in [(None, "primary"), ("replica_0", "replica0"), ("replica_1", "replica1")]:
+            engine = db.get_engine(self.app, bind)
+            db.metadata.create_all(engine)
+            with engine.begin() as connection:
+                connection.execute(User.__table__.insert(), {"username": "admin", "password": "x"})
+                connection.execute(Recipe.__table__.insert(), {
+                    "name": name, "date_created": now, "date_modified": now, "created_by": 1})
+        user = db.session.query(User).first()
+        self.headers = {"Authorization": "Bearer {}".format(user.generate_auth_token().decode("utf-8"))}
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def name(self):
+        response_cache.invalidate(1)  # every read has to reach a database
+        response = self.client.get("/recipes/1?fields=name", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data)[0]["name"]
+
+    def test_reads_go_to_the_replicas_in_turn(self):
+        names = [self.name() for _ in range(4)]
+        self.assertEqual(sorted(names), ["replica0", "replica0", "replica1", "replica1"])
+        self.assertNotEqual(names[0], names[1])
+
+    def test_writes_go_to_the_primary(self):
+        response = self.client.put("/recipes/1", data=json.dumps({"name": "renamed"}),
+                                   content_type="application/json", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        names = [row[0] for row in db.session.query(Recipe.name)]
+        self.assertEqual(names, ["renamed"])
+        # the writer reads the primary until the replicas have caught up
+        self.assertEqual(self.name(), "renamed")
+        replicas.recent_writers.clear()
+        self.assertTrue(self.name().startswith("replica"))
+
+    def test_session_sticks_to_the_primary_after_a_write(self):
+        with self.app.test_request_context("/recipes/1", method="GET"):
+            self.app.preprocess_request()
+            self.assertTrue(db.session.query(Recipe.name).scalar().startswith("replica"))
+            db.session.query(Recipe).filter_by(id=1).update({"name": "written"}, synchronize_session=False)
+            self.assertEqual(db.session.query(Recipe.name).scalar(), "written")
+            db.session.commit()
+            self.assertEqual(db.session.query(Recipe.name).scalar(), "written")
+            db.session.remove()
+
+    def test_other_methods_read_the_primary(self):
+        with self.app.test_request_context("/recipes", method="POST"):
+            self.app.preprocess_request()
+            self.assertEqual(db.session.query(Recipe.name).scalar(), "primary")
+            db.session.remove()
+
+    @unittest.skipIf(Starlette is None or TestClient is None, "needs the packages in requirements-asgi.txt")
+    def test_asgi_reads_go_to_the_replicas(self):
+        from recipe.asgi import create_asgi_app
+        with TestClient(create_asgi_app(self.config)) as client:
+            def name():
+                response = client.get("/recipes/1?fields=name", headers=self.headers)
+                return json.loads(response.content)[0]["name"]
+            self.assertEqual(sorted([name(), name()]), ["replica0", "replica1"])
+            replicas.wrote(1)
+            self.assertEqual(name(), "primary")
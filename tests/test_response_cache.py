@@ -0,0 +1,117 @@
+from datetime import datetime
+import unittest
+from flask import json
+from sqlalchemy import event
+from .test_base import BaseTestCase
+from recipe.cache import LRUCache, ResponseCache
+from recipe.models import db, User, Recipe, Categories
+from recipe.views import response_cache
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_invalidate_is_per_user(self):
+        cache = ResponseCache(LRUCache(16))
+        cache.set(1, "/recipes?", "first")
+        cache.set(2, "/recipes?", "second")
+        cache.invalidate(1)
+        self.assertTrue(cache.get(1, "/recipes?") is None)
+        self.assertEqual(cache.get(2, "/recipes?"), "second")
+
+    def test_evicted_generation_does_not_revive_old_entries(self):
+        backend = LRUCache(16)
+        cache = ResponseCache(backend)
+        cache.set(1, "/recipes?", "old")
+        cache.invalidate(1)
+        backend.delete("generation:1")
+        self.assertTrue(cache.get(1, "/recipes?") is None)
+
+
+class TestConditionalGet(BaseTestCase):
+
+    def setUp(self):
+        super(TestConditionalGet, self).setUp()
+        self.user = db.session.query(User).filter_by(username="admin").first()
+        self.token = self.user.generate_auth_token().decode("utf-8")
+        self.headers = {"Authorization": "Bearer {}".format(self.token)}
+        db.session.add(Recipe(name="testrecipe", date_created=datetime.now(),
+                              created_by=self.user.id, date_modified=datetime.now()))
+        db.session.commit()
+
+    def get(self, url, **headers):
+        headers.update(self.headers)
+        return self.client.get(url, headers=headers)
+
+    def test_unchanged_list_returns_304(self):
+        response = self.get("/recipes")
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        response = self.get("/recipes", **{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+
+    def test_recipe_has_last_modified(self):
+        response = self.get("/recipes/1")
+        self.assertEqual(response.status_code, 200)
+        response = self.get("/recipes/1", **{"If-Modified-Since": response.headers["Last-Modified"]})
+        self.assertEqual(response.status_code, 304)
+
+    def test_repeated_get_served_from_cache(self):
+        self.get("/recipes")
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.get("/recipes")
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.data)), 1)
+        self.assertEqual(statements, [])
+
+    def test_write_while_rendering_is_not_cached_over(self):
+        userid = self.user.id
+
+        # a write from another request lands while this one reads the database
+        def invalidate(conn, cursor, statement, parameters, context, executemany):
+            response_cache.invalidate(userid)
+        event.listen(db.engine, "before_cursor_execute", invalidate)
+        try:
+            self.assertEqual(self.get("/recipes").status_code, 200)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", invalidate)
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            self.assertEqual(self.get("/recipes").status_code, 200)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertNotEqual(statements, [])
+
+    def test_writes_invalidate(self):
+        etag = self.get("/recipes").headers["ETag"]
+        response = self.client.post("/recipes/1/categories", data=json.dumps({"name": "do this"}),
+                                    headers=self.headers, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        response = self.get("/recipes", **{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)[0]["categories"][0]["name"], "do this")
+        etag = response.headers["ETag"]
+        response = self.client.delete("/recipes/1/categories/1", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.get("/recipes", **{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)[0]["categories"], [])
+
+    def test_cache_is_per_query(self):
+        self.assertEqual(self.get("/recipes").status_code, 200)
+        self.assertEqual(self.get("/recipes?q=nothing").status_code, 401)
+
+
+if __name__ == "__main__":
+    unittest.main()
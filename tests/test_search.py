@@ -0,0 +1,115 @@
+from datetime import datetime
+import unittest
+from flask import json
+from .test_base import BaseTestCase
+from recipe import handlers
+from recipe.models import db, User, Recipe, Categories
+from recipe.search import TrigramIndex, trigrams
+
+
+class TestTrigramIndex(unittest.TestCase):
+
+    def test_trigrams_are_padded_per_word(self):
+        self.assertEqual(trigrams("Ab"), set(["  a", " ab", "ab "]))
+        self.assertEqual(trigrams("a b"), set(["  a", " a ", "  b", " b "]))
+
+    def test_search_ranks_best_match_first(self):
+        index = TrigramIndex()
+        index.add(1, "chocolate cake")
+        index.add(2, "cake")
+        index.add(3, "pancakes")
+        index.add(4, "lentil soup")
+        ranked = index.search("cake", 0.6)
+        self.assertEqual([recipeid for recipeid, rank in ranked], [1, 2, 3])
+        self.assertEqual(ranked[0][1], 1.0)
+
+    def test_search_matches_category_names(self):
+        index = TrigramIndex()
+        index.add(1, "sunday lunch")
+        index.add(1, "roast potatoes")
+        index.add(2, "breakfast")
+        self.assertEqual(index.search("potatoes", 0.6), [(1, 1.0)])
+
+    def test_search_tolerates_typos(self):
+        index = TrigramIndex()
+        index.add(1, "spaghetti bolognese")
+        self.assertEqual([recipeid for recipeid, rank in index.search("bolognase", 0.5)], [1])
+        self.assertEqual(index.search("bolognase", 0.9), [])
+
+    def test_short_queries_match_substrings(self):
+        index = TrigramIndex()
+        index.add(1, "pie")
+        index.add(2, "Cabbage")
+        index.add(3, "soup")
+        index.add(3, "tea")
+        self.assertEqual(index.search("p", 0.3), [(1, 1.0), (3, 1.0)])
+        self.assertEqual(index.search("AB", 0.3), [(2, 1.0)])
+        self.assertEqual(index.search("ie", 0.3), [(1, 1.0)])
+        self.assertEqual(index.search("e", 0.3, limit=2), [(1, 1.0), (2, 1.0)])
+        self.assertEqual(index.search("x", 0.3), [])
+
+
+class TestSearchEndpoint(BaseTestCase):
+
+    def setUp(self):
+        super(TestSearchEndpoint, self).setUp()
+        self.user = db.session.query(User).filter_by(username="admin").first()
+        self.token = self.user.generate_auth_token().decode("utf-8")
+
+    def create_recipe(self, name, categories=()):
+        recipe = Recipe(name=name, date_created=datetime.now(),
+                        created_by=self.user.id, date_modified=datetime.now())
+        db.session.add(recipe)
+        db.session.flush()
+        for catergory in categories:
+            db.session.add(Categories(name=catergory, date_created=datetime.now(),
+                                      recipeid=recipe.id, date_modified=datetime.now()))
+        db.session.commit()
+
+    def search(self, q, limit=None):
+        url = "/recipes?q={}".format(q) if limit is None else "/recipes?q={}&limit={}".format(q, limit)
+        return self.client.get(url, headers={
+            "Authorization": "Bearer {}".format(self.token)})
+
+    def test_search_recipe_and_category_names(self):
+        self.create_recipe("pancakes")
+        self.create_recipe("sunday lunch", ["bake the cake"])
+        self.create_recipe("soup")
+        response = self.search("cake")
+        self.assertEqual(response.status_code, 200)
+        names = [recipe["name"] for recipe in json.loads(response.data)]
+        self.assertEqual(sorted(names), ["pancakes", "sunday lunch"])
+
+    def test_search_sees_new_recipes(self):
+        self.create_recipe("soup")
+        self.assertEqual(self.search("stew").status_code, 401)
+        response = self.client.post(
+            "/recipes", data=json.dumps({"name": "beef stew"}),
+            headers={"Authorization": "Bearer {}".format(self.token)},
+            content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        response = self.search("stew")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([recipe["name"] for recipe in json.loads(response.data)], ["beef stew"])
+
+    def test_search_says_when_results_were_cut(self):
+        for name in ["pancakes", "cake pops", "cupcakes"]:
+            self.create_recipe(name)
+        response = self.search("cake", limit=2)
+        self.assertEqual(len(json.loads(response.data)), 2)
+        self.assertEqual(response.headers.get("X-Results-Truncated"), "true")
+        response = self.search("cake", limit=3)
+        self.assertEqual(len(json.loads(response.data)), 3)
+        self.assertNotIn("X-Results-Truncated", response.headers)
+        # without a limit, at most MAX_PAGE_SIZE
+        handlers.MAX_PAGE_SIZE, size = 2, handlers.MAX_PAGE_SIZE
+        try:
+            response = self.search("cake")
+        finally:
+            handlers.MAX_PAGE_SIZE = size
+        self.assertEqual(len(json.loads(response.data)), 2)
+        self.assertEqual(response.headers.get("X-Results-Truncated"), "true")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+from datetime import date, datetime, timedelta, tzinfo
+import unittest
+from flask import json
+from werkzeug.http import http_date as werkzeug_http_date
+from .test_base import BaseTestCase
+from recipe import serializers
+from recipe.models import db, User, Recipe, Categories
+
+
+class Plus(tzinfo):
+
+    def utcoffset(self, value):
+        return timedelta(hours=3)
+
+    def dst(self, value):
+        return timedelta(0)
+
+
+class TestSerializers(unittest.TestCase):
+
+    def test_http_date_matches_werkzeug(self):
+        for value in [datetime(1994, 11, 6, 8, 49, 37), datetime(2020, 2, 29, 23, 59, 59, 999999),
+                      datetime(2018, 1, 1, 1, 0, 0, tzinfo=Plus())]:
+            self.assertEqual(serializers.http_date(value), werkzeug_http_date(value.utctimetuple()))
+        self.assertEqual(serializers.http_date(date(2017, 7, 4)), werkzeug_http_date(date(2017, 7, 4).timetuple()))
+
+    def test_backends_agree_with_flask(self):
+        document = [{"id": 1, "name": u"caf\xe9", "date_created": datetime(2017, 5, 1, 10, 30),
+                     "date_modified": None, "categories": [{"done": True, "id": 2}]}]
+        expected = json.loads(json.dumps(document))
+        for name in serializers.BACKENDS:
+            try:
+                dumps = serializers.load_backend(name)[1]
+            except (ImportError, TypeError):
+                continue
+            self.assertEqual(json.loads(dumps(document).decode("utf-8")), expected, name)
+
+    def test_auto_falls_back_to_an_available_backend(self):
+        name, dumps = serializers.load_backend("auto")
+        self.assertIn(name, serializers.BACKENDS)
+        self.assertEqual(dumps({"a": 1}), b'{"a":1}')
+
+
+class TestColumnRows(BaseTestCase):
+
+    def test_returnall_matches_returnthis(self):
+        user = db.session.query(User).filter_by(username="admin").first()
+        now = datetime.now()
+        recipe = Recipe(name="soup", date_created=now, created_by=user.id, date_modified=now)
+        db.session.add(recipe)
+        db.session.commit()
+        db.session.add(Categories(name="chop", date_created=now, date_modified=None, recipeid=recipe.id))
+        db.session.commit()
+        listed = Recipe.returnall(db.session.query(Recipe).filter_by(created_by=user.id))
+        self.assertEqual(listed, [recipe.returnthis()])
+        self.assertEqual(listed[0]["categories"][0]["name"], "chop")
@@ -0,0 +1,101 @@
+import unittest
+from flask import json
+from sqlalchemy import event
+from .test_base import BaseTestCase
+from recipe.cache import TokenCache
+from recipe.models import db, User, AuthUser
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = TokenCache(maxsize=2, ttl=60, clock=self.clock)
+        self.user = AuthUser(1, "admin")
+
+    def test_respects_token_expiry(self):
+        self.cache.set("token", self.user, expires=self.clock.now + 10)
+        self.assertEqual(self.cache.get("token"), self.user)
+        self.clock.now += 11
+        self.assertTrue(self.cache.get("token") is None)
+
+    def test_respects_cache_ttl(self):
+        self.cache.set("token", self.user, expires=self.clock.now + 6000)
+        self.clock.now += 61
+        self.assertTrue(self.cache.get("token") is None)
+
+    def test_expired_token_is_not_cached(self):
+        self.cache.set("token", self.user, expires=self.clock.now - 1)
+        self.assertTrue(self.cache.get("token") is None)
+
+    def test_invalidate_user(self):
+        self.cache.set("token", self.user)
+        self.cache.set("other", AuthUser(2, "andrew"))
+        self.cache.invalidate(1)
+        self.assertTrue(self.cache.get("token") is None)
+        self.assertEqual(self.cache.get("other").id, 2)
+        # tokens verified after the invalidation are cached again
+        self.cache.set("token", self.user)
+        self.assertEqual(self.cache.get("token"), self.user)
+
+    def test_bounded(self):
+        for number in range(3):
+            self.cache.set("token{}".format(number), self.user)
+        self.assertTrue(self.cache.get("token0") is None)
+        self.assertEqual(self.cache.get("token2"), self.user)
+
+
+class TestTokenCacheRequests(BaseTestCase):
+
+    def setUp(self):
+        super(TestTokenCacheRequests, self).setUp()
+        self.user = db.session.query(User).filter_by(username="admin").first()
+        self.token = self.user.generate_auth_token().decode("utf-8")
+
+    def get_recipes(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.client.get("/recipes", headers={
+                "Authorization": "Bearer {}".format(self.token)})
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        return response, statements
+
+    def test_seen_token_skips_user_query(self):
+        response, first = self.get_recipes()
+        self.assertEqual(response.status_code, 400)  # user has no recipes yet
+        self.assertTrue(any('FROM "User"' in statement for statement in first))
+        response, second = self.get_recipes()
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(any('FROM "User"' in statement for statement in second))
+
+    def test_deleted_user_token_rejected(self):
+        self.assertEqual(self.get_recipes()[0].status_code, 400)
+        db.session.delete(db.session.query(User).filter_by(username="admin").first())
+        db.session.commit()
+        self.assertEqual(self.get_recipes()[0].status_code, 401)
+
+    def test_password_change_drops_cached_token(self):
+        self.assertEqual(self.get_recipes()[0].status_code, 400)
+        user = db.session.query(User).filter_by(username="admin").first()
+        user.password = user.hash_password("newpassword")
+        db.session.commit()
+        response, statements = self.get_recipes()
+        self.assertTrue(any('FROM "User"' in statement for statement in statements))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from flask import json
+from itsdangerous import TimedJSONWebSignatureSerializer
+from .test_base import BaseTestCase
+from recipe import tokens
+from recipe.tokens import TokenSigner, parse_keys
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenSigner(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.signer = TokenSigner([("a", "first secret")], expires_in=60, clock=self.clock)
+
+    def test_compact_round_trip(self):
+        token = self.signer.sign(42)
+        self.assertEqual(self.signer.verify(token), (42, 1000060))
+        self.assertEqual(self.signer.verify(token.decode("utf-8")), (42, 1000060))
+        self.assertFalse(b"." in token)
+        self.assertTrue(len(token) < 70)
+
+    def test_compact_expires(self):
+        token = self.signer.sign(42)
+        self.clock.now += 61
+        self.assertEqual(self.signer.verify(token), (None, None))
+
+    def test_tampered_or_garbage_tokens_fail(self):
+        token = bytearray(self.signer.sign(42))
+        token[10] = ord("B") if token[10] != ord("B") else ord("C")
+        for bad in [bytes(token), b"", b"abc", b"!!!!", u"caf\xe9", b"a.b.c"]:
+            self.assertEqual(self.signer.verify(bad), (None, None))
+
+    def test_rotation(self):
+        old = self.signer.sign(1)
+        self.signer.configure([("b", "second secret"), ("a", "first secret")], 60, "compact")
+        new = self.signer.sign(2)
+        self.assertEqual(self.signer.verify(old)[0], 1)
+        self.assertEqual(self.signer.verify(new)[0], 2)
+        # once the old key is dropped its tokens stop working
+        self.signer.configure([("b", "second secret")], 60, "compact")
+        self.assertEqual(self.signer.verify(old), (None, None))
+        self.assertEqual(self.signer.verify(new)[0], 2)
+
+    def test_same_kid_other_secret_fails(self):
+        token = self.signer.sign(1)
+        self.signer.configure([("a", "another secret")], 60, "compact")
+        self.assertEqual(self.signer.verify(token), (None, None))
+
+    def test_jws_tokens(self):
+        self.signer.configure([("b", "second secret"), ("a", "first secret")], 60, "jws")
+        token = self.signer.sign(7)
+        self.assertEqual(self.signer.verify(token)[0], 7)
+        # tokens issued before this module, signed with SECRET_KEY alone
+        legacy = TimedJSONWebSignatureSerializer("first secret", expires_in=6000).dumps({"id": 3})
+        self.assertEqual(self.signer.verify(legacy)[0], 3)
+        other = TimedJSONWebSignatureSerializer("unknown", expires_in=6000).dumps({"id": 3})
+        self.assertEqual(self.signer.verify(other), (None, None))
+        expired = TimedJSONWebSignatureSerializer("first secret", expires_in=-10).dumps({"id": 3})
+        self.assertEqual(self.signer.verify(expired), (None, None))
+
+    def test_bad_settings(self):
+        self.assertRaises(ValueError, self.signer.configure, [("a", "secret")], 60, "jwt")
+        self.assertRaises(ValueError, self.signer.configure, [], 60, "compact")
+        self.assertRaises(ValueError, parse_keys, "a:one,two")
+        self.assertEqual(parse_keys("a:one, b:two:three"), [("a", "one"), ("b", "two:three")])
+
+
+class TestTokenFormats(BaseTestCase):
+
+    def login(self):
+        response = self.client.post("/auth/login", data=json.dumps({"username": "admin", "password": "admin"}),
+                                    content_type="application/json")
+        return json.loads(response.data)["token"]
+
+    def test_either_format_is_accepted(self):
+        compact = self.login()
+        tokens.signer.configure([("0", self.app.config["SECRET_KEY"])], 6000, "jws")
+        jws = self.login()
+        self.assertTrue(len(compact) < len(jws))
+        for token in (compact, jws):
+            response = self.client.get("/recipes", headers={"Authorization": "Bearer " + token})
+            self.assertNotEqual(response.status_code, 401)